@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+تحديد عرض النطاق لعمليات النقل على مستوى البوت ولكل مستخدم
+يُحجز الرصيد بأجزاء صغيرة (quantum) بترتيب الوصول، فتتناوب عمليات النقل المتزامنة
+على عرض النطاق بالتساوي ولا تنتظر الملفات الصغيرة انتهاء الملفات الكبيرة
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUANTUM = 256 * 1024
+
+
+class _ByteBucket:
+    """دلو بايتات يقبل الحجز المسبق: الرصيد قد يصبح سالباً ويعني انتظار الحاجزين التاليين"""
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def reserve(self, nbytes: int, now: float) -> float:
+        """حجز nbytes وإرجاع الثواني حتى يصبح الحجز متاحاً"""
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        self.tokens -= nbytes
+        return max(0.0, -self.tokens / self.rate)
+
+    def is_idle(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class BandwidthLimiter:
+    """
+    محدد عرض النطاق لاتجاه واحد (التنزيل من تيليجرام أو الرفع إلى Drive)
+
+    - rate: الحد الأقصى للبوت كله بالبايت في الثانية (0 بلا حد)
+    - per_user_rate: الحد الأقصى لكل مستخدم بالبايت في الثانية (0 بلا حد)
+    - quantum: حجم الجزء الذي يُحجز في كل مرة؛ الأجزاء الأصغر تعني تناوباً أدق بين العمليات
+    - burst_seconds: الرصيد الذي يتجمع أثناء الخمول (بثواني المعدل)
+    - on_wait: دالة تُستدعى بعدد الثواني عند كل انتظار (للمقاييس)
+    """
+
+    def __init__(self, rate: float = 0, per_user_rate: float = 0, quantum: int = DEFAULT_QUANTUM,
+                 burst_seconds: float = 0.25, max_users: int = 1024, on_wait=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.per_user_rate = per_user_rate
+        self.quantum = max(1, quantum)
+        self.burst_seconds = burst_seconds
+        self.max_users = max_users
+        self.on_wait = on_wait
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._global = self._new_bucket(rate, clock()) if rate > 0 else None
+        self._users = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self._global is not None or self.per_user_rate > 0
+
+    def _new_bucket(self, rate: float, now: float) -> _ByteBucket:
+        return _ByteBucket(rate, max(self.quantum, rate * self.burst_seconds), now)
+
+    def _user_bucket(self, user_id, now: float) -> _ByteBucket:
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            bucket = self._users[user_id] = self._new_bucket(self.per_user_rate, now)
+            # حذف دلاء المستخدمين الخاملين (الممتلئة) الأقدم استخداماً
+            for old_id in list(self._users)[:max(0, len(self._users) - self.max_users)]:
+                if self._users[old_id].is_idle(now):
+                    del self._users[old_id]
+        else:
+            self._users.move_to_end(user_id)
+        return bucket
+
+    def _reserve(self, user_id, nbytes: int) -> float:
+        """حجز جزء واحد من الرصيد العام ورصيد المستخدم وإرجاع مدة الانتظار"""
+        with self._lock:
+            now = self._clock()
+            delay = 0.0
+            if self._global is not None:
+                delay = self._global.reserve(nbytes, now)
+            if self.per_user_rate > 0 and user_id is not None:
+                delay = max(delay, self._user_bucket(user_id, now).reserve(nbytes, now))
+        if delay and self.on_wait is not None:
+            self.on_wait(delay)
+        return delay
+
+    def _quanta(self, nbytes: int):
+        while nbytes > 0:
+            size = min(self.quantum, nbytes)
+            nbytes -= size
+            yield size
+
+    def consume(self, user_id, nbytes: int) -> float:
+        """
+        انتظار رصيد nbytes قبل إرسالها (للخيوط المتزامنة مثل رفع Drive)
+
+        Returns:
+            إجمالي الثواني التي انتظرها النقل
+        """
+        if not self.enabled:
+            return 0.0
+        waited = 0.0
+        for size in self._quanta(nbytes):
+            delay = self._reserve(user_id, size)
+            if delay:
+                self._sleep(delay)
+                waited += delay
+        return waited
+
+    async def aconsume(self, user_id, nbytes: int) -> float:
+        """مثل consume لكن دون حجب حلقة الأحداث (لتنزيل aiohttp)"""
+        if not self.enabled:
+            return 0.0
+        waited = 0.0
+        for size in self._quanta(nbytes):
+            delay = self._reserve(user_id, size)
+            if delay:
+                await asyncio.sleep(delay)
+                waited += delay
+        return waited
@@ -0,0 +1,585 @@
+#!/usr/bin/env python3
+"""
+قياس أداء مسار النقل من البداية إلى النهاية دون اتصال بالإنترنت
+يشغّل خادم ملفات Bot API وهمياً وخادم رفع متقطع وهمياً لـ Google Drive (aiohttp) مع إمكانية
+إضافة تأخير وحد للسرعة وأخطاء 5xx، ثم يمرر ملفات بأحجام مختلفة عبر handle_media (مستندات أو فيديو أو صوت...)
+بمستويات توازٍ مختلفة ويعرض السرعة وزمن الملف (p50/p99) وأقصى استهلاك للذاكرة
+
+مثال:
+    python3 benchmark_transfers.py --sizes 1MB,64MB,512MB --concurrency 1,4 --files 8
+    python3 benchmark_transfers.py --sizes 2GB --concurrency 1 --bandwidth-mbps 400 --error-rate 0.01
+    python3 benchmark_transfers.py --sizes 64MB --concurrency 40 --memory-budget-mb 256 --max-rss-growth-mb 512
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import resource
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from aiohttp import web
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.discovery import build_from_document
+
+from drive_services import DriveServiceCache, get_drive_discovery_document
+
+logger = logging.getLogger(__name__)
+
+BENCH_TOKEN = "123456:BENCHMARK"
+PATTERN_BLOCK = 64 * 1024
+SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+# أنواع الوسائط التي يمكن إرسالها في القياس (كائن واحد في الرسالة)
+MEDIA_KINDS = ('document', 'video', 'audio', 'voice', 'video_note', 'animation')
+
+
+def parse_size(text: str) -> int:
+    """تحويل حجم مثل 64MB أو 2GB إلى بايتات"""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMG]?B)?\s*', text.upper())
+    if not match:
+        raise ValueError(f"حجم غير صالح: {text}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2) or 'B'])
+
+
+def percentile(values: list, fraction: float) -> float:
+    """المئين بطريقة أقرب رتبة"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+class FaultProfile:
+    """
+    الأعطال المحقونة في الخوادم الوهمية
+
+    - latency: تأخير قبل الرد على كل طلب (ثوان)
+    - bandwidth: الحد الأقصى لسرعة نقل الجسم (بايت/ث، 0 بلا حد)
+    - error_rate: احتمال الرد بخطأ 503 على أي طلب
+    - corruption_rate: احتمال أن يعيد Drive الوهمي مجموعاً اختبارياً لا يطابق الملف المستلم
+    - max_consecutive_failures: أقصى عدد أخطاء متتالية لنفس الطلب (0 بلا حد)؛ أقل من عدد المحاولات
+      يضمن نجاح كل ملف مهما كان ترتيب سحب الطلبات المتزامنة من المولد العشوائي
+    """
+
+    def __init__(self, latency: float = 0.0, bandwidth: float = 0.0, error_rate: float = 0.0, seed: int = None,
+                 corruption_rate: float = 0.0, max_consecutive_failures: int = 0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.corruption_rate = corruption_rate
+        self.max_consecutive_failures = max_consecutive_failures
+        self._random = random.Random(seed)
+        self._consecutive = {}
+        self.injected_errors = 0
+        self.corrupted_files = 0
+
+    async def delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def should_fail(self, key=None) -> bool:
+        """
+        هل يُرد على الطلب بخطأ 503
+
+        Args:
+            key: هوية الطلب التي تبقى ثابتة عند إعادته (مثل الجلسة وموضع الجزء)، لحساب الأخطاء المتتالية
+        """
+        failures = self._consecutive.get(key, 0)
+        capped = self.max_consecutive_failures and failures >= self.max_consecutive_failures
+        if self.error_rate and not capped and self._random.random() < self.error_rate:
+            self._consecutive[key] = failures + 1
+            self.injected_errors += 1
+            return True
+        self._consecutive.pop(key, None)
+        return False
+
+    def should_corrupt(self) -> bool:
+        if self.corruption_rate and self._random.random() < self.corruption_rate:
+            self.corrupted_files += 1
+            return True
+        return False
+
+
+class _Throttle:
+    """تقييد سرعة تدفق واحد بالنوم حسب البايتات المنقولة"""
+
+    def __init__(self, bandwidth: float):
+        self.bandwidth = bandwidth
+        self.started = time.monotonic()
+        self.transferred = 0
+
+    async def account(self, nbytes: int):
+        self.transferred += nbytes
+        if not self.bandwidth:
+            return
+        ahead = self.transferred / self.bandwidth - (time.monotonic() - self.started)
+        if ahead > 0:
+            await asyncio.sleep(ahead)
+
+
+class _FakeServer:
+    """أساس مشترك للخوادم الوهمية: التشغيل على منفذ محلي والإيقاف"""
+
+    def __init__(self, faults: FaultProfile = None):
+        self.faults = faults or FaultProfile()
+        self.requests = 0
+        self._runner = None
+
+    def routes(self, app: web.Application):
+        raise NotImplementedError
+
+    @property
+    def url(self) -> str:
+        for address in self._runner.addresses:
+            return f"http://127.0.0.1:{address[1]}"
+        raise RuntimeError("الخادم لم يبدأ")
+
+    async def start(self):
+        app = web.Application(client_max_size=0)
+        self.routes(app)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '127.0.0.1', 0).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class FakeBotApiServer(_FakeServer):
+    """
+    خادم ملفات Bot API وهمي
+
+    مسار الملف bench/<الحجم>/<الاسم> ويُولّد المحتوى أثناء الإرسال دون تخزينه، مع دعم Range
+    (يمكن تعطيله لاختبار الرجوع إلى التدفق الواحد). حد bandwidth في FaultProfile يطبق على كل اتصال
+    """
+
+    def __init__(self, faults: FaultProfile = None, ranges: bool = True):
+        super().__init__(faults)
+        self.ranges = ranges
+        self._block = bytes(range(256)) * (PATTERN_BLOCK // 256)
+        self.bytes_sent = 0
+
+    def routes(self, app: web.Application):
+        app.router.add_get('/file/bot{token}/bench/{size}/{name}', self.handle_file)
+
+    @staticmethod
+    def file_path(size: int, name: str) -> str:
+        return f"bench/{size}/{name}"
+
+    async def handle_file(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        await self.faults.delay()
+        size = int(request.match_info['size'])
+        start, end = 0, size
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', request.headers.get('Range', '')) if self.ranges else None
+        if self.faults.should_fail(('file', request.match_info['name'], request.headers.get('Range'))):
+            return web.Response(status=503)
+        if match:
+            start = min(int(match.group(1)), size)
+            if match.group(2):
+                end = min(int(match.group(2)) + 1, size)
+
+        response = web.StreamResponse(status=206 if match else 200)
+        response.content_length = end - start
+        response.content_type = 'application/octet-stream'
+        if match:
+            response.headers['Content-Range'] = f"bytes {start}-{end - 1}/{size}"
+        await response.prepare(request)
+
+        throttle = _Throttle(self.faults.bandwidth)
+        position = start
+        while position < end:
+            offset = position % PATTERN_BLOCK
+            chunk = self._block[offset:offset + min(PATTERN_BLOCK - offset, end - position)]
+            await response.write(chunk)
+            position += len(chunk)
+            self.bytes_sent += len(chunk)
+            await throttle.account(len(chunk))
+        await response.write_eof()
+        return response
+
+
+class FakeDriveServer(_FakeServer):
+    """
+    نقطة رفع متقطع وهمية تحاكي بروتوكول Google Drive
+
+    POST يفتح جلسة ويعيدها في ترويسة Location، وكل PUT يضيف جزءاً ويرد بـ 308 مع Range
+    حتى اكتمال الملف فيرد بـ 200 وبيانات الملف مع md5Checksum و sha256Checksum.
+    البيانات المستلمة تُعدّ وتُحسب مجاميعها ولا تُخزن
+    """
+
+    def __init__(self, faults: FaultProfile = None):
+        super().__init__(faults)
+        self.sessions = {}
+        self.completed = {}
+        self.deleted = []
+        self.bytes_received = 0
+
+    def routes(self, app: web.Application):
+        app.router.add_post('/upload/drive/v3/files', self.handle_start)
+        app.router.add_put('/upload/session/{session_id}', self.handle_chunk)
+        app.router.add_delete('/drive/v3/files/{file_id}', self.handle_delete)
+
+    async def handle_delete(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        self.deleted.append(request.match_info['file_id'])
+        return web.Response(status=204)
+
+    async def handle_start(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await self.faults.delay()
+        metadata = await request.json()
+        if self.faults.should_fail(('start', metadata.get('name'))):
+            return web.Response(status=503)
+
+        session_id = uuid.uuid4().hex
+        length = request.headers.get('X-Upload-Content-Length')
+        self.sessions[session_id] = {
+            'name': metadata.get('name'),
+            'size': int(length) if length else None,
+            'received': 0,
+            'md5': hashlib.md5(),
+            'sha256': hashlib.sha256(),
+        }
+        return web.Response(headers={'Location': f"{self.url}/upload/session/{session_id}"})
+
+    def _range_response(self, session: dict) -> web.Response:
+        headers = {'Range': f"bytes=0-{session['received'] - 1}"} if session['received'] else {}
+        return web.Response(status=308, headers=headers)
+
+    async def handle_chunk(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await self.faults.delay()
+        session_id = request.match_info['session_id']
+        session = self.sessions.get(session_id)
+        if session is None:
+            return web.Response(status=404)
+
+        content_range = request.headers.get('Content-Range', '')
+        match = re.fullmatch(r'bytes (\d+)-(\d+)/(\d+|\*)', content_range)
+        status_query = re.fullmatch(r'bytes \*/(\d+|\*)', content_range)
+
+        # قراءة الجسم دائماً حتى يبقى الاتصال صالحاً لإعادة الاستخدام
+        throttle = _Throttle(self.faults.bandwidth)
+        received = 0
+        md5, sha256 = session['md5'].copy(), session['sha256'].copy()
+        while True:
+            data = await request.content.read(PATTERN_BLOCK)
+            if not data:
+                break
+            received += len(data)
+            md5.update(data)
+            sha256.update(data)
+            await throttle.account(len(data))
+
+        # الجزء المعاد يبدأ من نفس الموضع لكن قد يصغر حجمه بعد الخطأ
+        key = ('status', session_id) if status_query else ('chunk', session_id, match and match.group(1))
+        if self.faults.should_fail(key):
+            return web.Response(status=503)
+        if status_query:
+            return self._range_response(session)
+        if not match:
+            return web.Response(status=400)
+
+        start, total = int(match.group(1)), match.group(3)
+        if start != session['received']:
+            # جزء لا يبدأ من آخر موضع مؤكد: إبلاغ العميل بالموضع الصحيح
+            return self._range_response(session)
+
+        session['received'] += received
+        session['md5'], session['sha256'] = md5, sha256
+        self.bytes_received += received
+        if total != '*':
+            session['size'] = int(total)
+        if session['size'] is not None and session['received'] >= session['size']:
+            del self.sessions[session_id]
+            file_id = session_id[:16]
+            self.completed[file_id] = session
+            if self.faults.should_corrupt():
+                md5.update(b'corrupted')
+            return web.json_response({
+                'id': file_id,
+                'name': session['name'],
+                'webViewLink': f"https://drive.example/file/{file_id}",
+                'md5Checksum': md5.hexdigest(),
+                'sha256Checksum': sha256.hexdigest(),
+            })
+        return self._range_response(session)
+
+
+class FakeDriveServiceCache(DriveServiceCache):
+    """خدمات Drive تتصل بالخادم الوهمي بدلاً من googleapis.com"""
+
+    def __init__(self, root_url: str, **kwargs):
+        super().__init__(**kwargs)
+        document = dict(get_drive_discovery_document())
+        document['rootUrl'] = f"{root_url}/"
+        document['baseUrl'] = f"{root_url}/drive/v3/"
+        self._document = document
+
+    def _build(self, credentials):
+        return build_from_document(self._document, credentials=credentials)
+
+
+class _FakeMessage:
+    """رسالة تيليجرام وهمية تسجل آخر نص معروض فيها"""
+
+    _next_id = 1
+
+    def __init__(self, text: str = ""):
+        self.message_id = _FakeMessage._next_id
+        _FakeMessage._next_id += 1
+        self.text = text
+        self.edits = 0
+
+    async def reply_text(self, text: str, **kwargs):
+        return _FakeMessage(text)
+
+    async def edit_text(self, text: str, **kwargs):
+        self.text = text
+        self.edits += 1
+        return self
+
+
+class _RecordingMessage(_FakeMessage):
+    """رسالة المستخدم: تحتفظ بالردود لقراءة النتيجة النهائية"""
+
+    def __init__(self, **media):
+        super().__init__()
+        self.media_group_id = None
+        for kind in MEDIA_KINDS + ('photo', 'sticker'):
+            setattr(self, kind, media.get(kind))
+        self.date = datetime.now(timezone.utc)
+        self.chat = SimpleNamespace(id=0, effective_name='benchmark')
+        self.forward_origin = None
+        self.replies = []
+
+    async def reply_text(self, text: str, **kwargs):
+        reply = _FakeMessage(text)
+        self.replies.append(reply)
+        return reply
+
+
+class _RssSampler:
+    """قياس أقصى استهلاك للذاكرة (RSS) خلال فترة محددة وزيادته عن بدايتها"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.baseline = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def current() -> int:
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError):
+            # لا يوجد /proc: أقصى استهلاك منذ بدء العملية
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def __enter__(self):
+        self.baseline = self.peak = self.current()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+async def run_scenario(file_size: int, concurrency: int, files: int, kind: str = 'document',
+                       faults: FaultProfile = None, drive_faults: FaultProfile = None,
+                       bot_options: dict = None) -> dict:
+    """
+    تشغيل سيناريو واحد: files ملفاً بحجم file_size يُرسل منها concurrency في نفس الوقت
+
+    Returns:
+        ملخص النتائج (السرعة الكلية وزمن الملف وعدد الإخفاقات وأقصى RSS)
+    """
+    from telegram_drive_bot_large_files import TelegramDriveBotLargeFiles
+
+    bot_api = FakeBotApiServer(faults)
+    drive = FakeDriveServer(drive_faults or faults)
+    await bot_api.start()
+    await drive.start()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        options = {
+            'max_workers': concurrency,
+            'max_concurrent_uploads': concurrency,
+            'db_path': os.path.join(temp_dir, 'bench.db'),
+            'dedup_mode': 'off',
+        }
+        options.update(bot_options or {})
+        bot = TelegramDriveBotLargeFiles(BENCH_TOKEN, 'unused', bot_api.url, **options)
+        bot.drive_services = FakeDriveServiceCache(drive.url, max_idle_per_user=bot.max_workers)
+
+        async def get_file(file_id):
+            return SimpleNamespace(file_path=FakeBotApiServer.file_path(file_size, file_id))
+
+        context = SimpleNamespace(bot=SimpleNamespace(get_file=get_file))
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+        failures = 0
+
+        async def send(index: int):
+            nonlocal failures
+            # مستخدم مختلف لكل ملف حتى لا يحد التوازي الحد الخاص بكل مستخدم
+            user_id = 1000 + index
+            bot.user_credentials[user_id] = {'credentials': AnonymousCredentials()}
+            name = f"bench_{index}.bin"
+            media = SimpleNamespace(
+                file_id=name, file_unique_id=f"bench-{index}", file_name=name, file_size=file_size,
+                mime_type='application/octet-stream', duration=60, width=1280, height=720
+            )
+            message = _RecordingMessage(**{kind: media})
+            update = SimpleNamespace(
+                effective_user=SimpleNamespace(id=user_id),
+                effective_chat=SimpleNamespace(id=user_id),
+                message=message,
+                effective_message=message,
+            )
+            async with semaphore:
+                started = time.monotonic()
+                await bot.handle_media(update, context)
+                latencies.append(time.monotonic() - started)
+            if not any(reply.text.lstrip().startswith('✅') for reply in message.replies):
+                failures += 1
+
+        await bot.get_http_session()
+        try:
+            with _RssSampler() as rss:
+                started = time.monotonic()
+                await asyncio.gather(*(send(index) for index in range(files)))
+                elapsed = time.monotonic() - started
+        finally:
+            await bot.post_shutdown(None)
+            bot.drive_executor.shutdown(wait=True)
+            await bot_api.stop()
+            await drive.stop()
+
+    succeeded = files - failures
+    return {
+        'kind': kind,
+        'file_size': file_size,
+        'concurrency': concurrency,
+        'files': files,
+        'failed': failures,
+        'seconds': elapsed,
+        'throughput_mbps': succeeded * file_size * 8 / elapsed / 1e6 if elapsed else 0.0,
+        'p50_seconds': percentile(latencies, 0.50),
+        'p99_seconds': percentile(latencies, 0.99),
+        'peak_rss_mb': rss.peak / (1024 * 1024),
+        'rss_growth_mb': (rss.peak - rss.baseline) / (1024 * 1024),
+        'memory_budget_mb': bot.memory.limit / (1024 * 1024),
+        'memory_budget_peak_mb': bot.memory.peak / (1024 * 1024),
+        'drive_requests': drive.requests,
+        'verified_files': int(bot.metrics.integrity_checks.value(result='ok')),
+        'checksum_mismatches': int(bot.metrics.integrity_checks.value(result='mismatch')),
+        'retries': int(sum(value for _, value in bot.metrics.retries.samples())),
+        'injected_errors': (faults.injected_errors if faults else 0) + (
+            drive_faults.injected_errors if drive_faults and drive_faults is not faults else 0
+        ),
+    }
+
+
+def format_report(results: list) -> str:
+    """جدول نصي للنتائج"""
+    header = (f"{'النوع':<9}{'الحجم':>10}{'التوازي':>9}{'الملفات':>9}{'فشل':>6}"
+              f"{'Mbps':>10}{'p50 ث':>9}{'p99 ث':>9}{'RSS ميجا':>10}")
+    lines = [header, '-' * len(header)]
+    for result in results:
+        size = result['file_size']
+        size_text = f"{size / SIZE_UNITS['GB']:.1f}GB" if size >= SIZE_UNITS['GB'] else f"{size / SIZE_UNITS['MB']:.0f}MB"
+        lines.append(
+            f"{result['kind']:<9}{size_text:>10}{result['concurrency']:>9}{result['files']:>9}"
+            f"{result['failed']:>6}{result['throughput_mbps']:>10.1f}{result['p50_seconds']:>9.2f}"
+            f"{result['p99_seconds']:>9.2f}{result['peak_rss_mb']:>10.0f}"
+        )
+    return "\n".join(lines)
+
+
+async def run_benchmark(args) -> list:
+    results = []
+    for size in args.sizes:
+        for concurrency in args.concurrency:
+            faults = FaultProfile(
+                args.latency_ms / 1000, args.bandwidth_mbps * 1e6 / 8, args.error_rate, args.seed,
+                max_consecutive_failures=args.max_consecutive_errors
+            )
+            bot_options = {'chunk_size': args.chunk_mb * 1024 * 1024}
+            if args.memory_budget_mb is not None:
+                bot_options['memory_budget'] = args.memory_budget_mb * 1024 * 1024
+            result = await run_scenario(
+                size, concurrency, args.files or concurrency, args.kind, faults, bot_options=bot_options
+            )
+            results.append(result)
+            logger.info(
+                f"{size} بايت × {result['files']} بتوازي {concurrency}: "
+                f"{result['throughput_mbps']:.1f} Mbps، فشل {result['failed']}"
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس أداء النقل من تيليجرام إلى Drive بخوادم وهمية محلية")
+    parser.add_argument('--sizes', default='1MB,16MB,128MB',
+                        type=lambda text: [parse_size(part) for part in text.split(',')],
+                        help="أحجام الملفات مفصولة بفواصل (مثلاً 1MB,512MB,2GB)")
+    parser.add_argument('--concurrency', default='1,4',
+                        type=lambda text: [int(part) for part in text.split(',')],
+                        help="مستويات التوازي مفصولة بفواصل")
+    parser.add_argument('--files', type=int, default=0, help="عدد الملفات لكل سيناريو (افتراضياً = التوازي)")
+    parser.add_argument('--kind', choices=MEDIA_KINDS, default='document', help="نوع الوسائط المرسلة")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="تأخير كل طلب في الخوادم الوهمية")
+    parser.add_argument('--bandwidth-mbps', type=float, default=0.0, help="حد السرعة لكل تدفق (0 بلا حد)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="احتمال الرد بخطأ 503 على أي طلب")
+    parser.add_argument('--chunk-mb', type=int, default=8, help="الحجم الابتدائي لجزء الرفع")
+    parser.add_argument('--seed', type=int, default=None, help="بذرة الأعطال العشوائية (لنتائج قابلة للتكرار)")
+    parser.add_argument('--max-consecutive-errors', type=int, default=0,
+                        help="أقصى أخطاء متتالية لنفس الطلب (0 بلا حد)")
+    parser.add_argument('--memory-budget-mb', type=int, default=None,
+                        help="حد ذاكرة مخازن النقل للبوت (افتراضياً إعداد البوت، 0 بلا حد)")
+    parser.add_argument('--max-rss-growth-mb', type=float, default=0,
+                        help="إنهاء القياس بخطأ إذا زادت الذاكرة (RSS) في أي سيناريو أكثر من هذا")
+    parser.add_argument('--json', dest='json_path', help="حفظ النتائج بصيغة JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logger.setLevel(logging.INFO)
+
+    results = asyncio.run(run_benchmark(args))
+    print(format_report(results))
+    if args.json_path:
+        with open(args.json_path, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    exceeded = [result for result in results if args.max_rss_growth_mb and result['rss_growth_mb'] > args.max_rss_growth_mb]
+    for result in exceeded:
+        print(f"❌ زيادة الذاكرة {result['rss_growth_mb']:.0f} ميجابايت تتجاوز {args.max_rss_growth_mb:.0f} "
+              f"({result['file_size']} بايت بتوازي {result['concurrency']})")
+    if exceeded:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+مقاييس أداء النقل بصيغة Prometheus النصية
+عدادات ومقاييس لحظية ومدرجات تكرارية بسيطة دون مكتبات إضافية، تُقرأ من خادم HTTP محلي
+ويمكن تحديثها من حلقة الأحداث ومن خيوط Drive
+"""
+
+import logging
+import math
+import threading
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# حدود المدرجات: المدة بالثواني والسرعة بالبايت في الثانية
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+THROUGHPUT_BUCKETS = tuple(2 ** power * 1024 for power in range(6, 18, 1))  # 64 كيلوبايت/ث حتى 128 ميجابايت/ث
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class _Metric:
+    """أساس مشترك: اسم ووصف وقيم لكل مجموعة تسميات (labels)"""
+
+    TYPE = ''
+
+    def __init__(self, name: str, description: str, labelnames: tuple = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"تسميات غير صحيحة للمقياس {self.name}: {sorted(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """أزواج (الاسم مع التسميات، القيمة) للعرض"""
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(labels)}", value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.TYPE}"]
+        lines.extend(f"{name} {_format_value(value)}" for name, value in self.samples())
+        return lines
+
+
+class Counter(_Metric):
+    """عداد متزايد فقط"""
+
+    TYPE = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """
+    قيمة لحظية تزيد وتنقص
+
+    إذا حُددت function تُقرأ القيمة منها عند كل عرض (مثل طول قائمة الانتظار)
+    """
+
+    TYPE = 'gauge'
+
+    def __init__(self, name: str, description: str, labelnames: tuple = (), function=None):
+        super().__init__(name, description, labelnames)
+        self.function = function
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        if self.function is not None:
+            return self.function()
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        if self.function is None:
+            yield from super().samples()
+            return
+        try:
+            yield self.name, self.function()
+        except Exception as e:
+            logger.warning(f"تعذر قراءة المقياس {self.name}: {e}")
+
+
+class Histogram(_Metric):
+    """مدرج تكراري تراكمي بحدود ثابتة مع المجموع والعدد"""
+
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, description: str, buckets: tuple = DURATION_BUCKETS, labelnames: tuple = ()):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts, _, _ = state
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(state[0]), state[1], state[2]) for labels, state in self._values.items()]
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = labels + (('le', _format_value(bound)),)
+                yield f"{self.name}_bucket{_format_labels(bucket_labels)}", cumulative
+            yield f"{self.name}_sum{_format_labels(labels)}", total
+            yield f"{self.name}_count{_format_labels(labels)}", count
+
+
+class MetricsRegistry:
+    """مجموعة المقاييس التي يعرضها خادم المقاييس"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"المقياس {metric.name} مسجل مسبقاً")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, description, labelnames))
+
+    def gauge(self, name: str, description: str, labelnames: tuple = (), function=None) -> Gauge:
+        return self._register(Gauge(name, description, labelnames, function))
+
+    def histogram(self, name: str, description: str, buckets: tuple = DURATION_BUCKETS,
+                  labelnames: tuple = ()) -> Histogram:
+        return self._register(Histogram(name, description, buckets, labelnames))
+
+    def get(self, name: str) -> _Metric:
+        return self._metrics[name]
+
+    def render(self) -> str:
+        """كل المقاييس بصيغة Prometheus النصية"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class TransferMetrics:
+    """مقاييس مسار النقل: التنزيل من تيليجرام والرفع إلى Drive وقائمة الانتظار"""
+
+    def __init__(self, registry: MetricsRegistry = None):
+        self.registry = registry or MetricsRegistry()
+        registry = self.registry
+
+        self.download_seconds = registry.histogram(
+            'telegram_download_seconds', 'مدة تنزيل الملف من خادم Bot API', DURATION_BUCKETS
+        )
+        self.download_bytes = registry.counter(
+            'telegram_download_bytes_total', 'البايتات المنزّلة من خادم Bot API'
+        )
+        self.downloads = registry.counter(
+            'telegram_downloads_total', 'عمليات التنزيل من خادم Bot API حسب النتيجة', ('result',)
+        )
+        self.upload_seconds = registry.histogram(
+            'drive_upload_seconds', 'مدة رفع الملف إلى Google Drive', DURATION_BUCKETS
+        )
+        self.upload_bytes = registry.counter(
+            'drive_upload_bytes_total', 'البايتات التي أكد Google Drive استلامها'
+        )
+        self.uploads = registry.counter(
+            'drive_uploads_total', 'عمليات الرفع إلى Google Drive حسب النتيجة', ('result',)
+        )
+        self.upload_chunks = registry.counter(
+            'drive_upload_chunks_total', 'أجزاء الرفع المتقطع التي أكد Google Drive استلامها'
+        )
+        self.upload_chunk_errors = registry.counter(
+            'drive_upload_chunk_errors_total', 'أجزاء الرفع المتقطع التي فشلت وأعيدت'
+        )
+        self.upload_chunk_size = registry.gauge(
+            'drive_upload_chunk_size_bytes', 'حجم جزء الرفع الذي وصل إليه الضبط التلقائي في آخر عملية رفع'
+        )
+        self.throughput = registry.histogram(
+            'transfer_throughput_bytes_per_second', 'سرعة نقل كل ملف', THROUGHPUT_BUCKETS, ('direction',)
+        )
+        self.drive_errors = registry.counter(
+            'drive_api_errors_total', 'أخطاء Google Drive API حسب رمز حالة HTTP (network لأخطاء الاتصال)',
+            ('status',)
+        )
+        self.retries = registry.counter(
+            'transfer_retries_total', 'إعادة المحاولات بعد الأخطاء المؤقتة حسب العملية والسبب',
+            ('operation', 'reason')
+        )
+        self.rate_limit_wait = registry.counter(
+            'drive_rate_limit_wait_seconds_total', 'ثواني انتظار طلبات Drive لرصيد محدد المعدل حسب النطاق (user أو client)',
+            ('scope',)
+        )
+        self.bandwidth_wait = registry.counter(
+            'bandwidth_throttle_seconds_total', 'ثواني انتظار النقل بسبب حد عرض النطاق حسب الاتجاه',
+            ('direction',)
+        )
+        self.integrity_checks = registry.counter(
+            'drive_integrity_checks_total', 'مقارنات المجموع الاختباري للملفات المرفوعة حسب النتيجة (ok أو mismatch أو skipped)',
+            ('result',)
+        )
+        self.token_refreshes = registry.counter(
+            'google_token_refreshes_total', 'تحديثات رموز وصول Google حسب النتيجة', ('result',)
+        )
+        self.memory_wait = registry.counter(
+            'memory_budget_wait_seconds_total', 'ثواني انتظار عمليات النقل لذاكرة ضمن حد الذاكرة'
+        )
+        self.temp_disk_bytes = registry.gauge(
+            'temp_disk_bytes', 'حجم الملفات المؤقتة على القرص بالبايت'
+        )
+        self.update_latency = registry.histogram(
+            'telegram_update_latency_seconds', 'الزمن بين إرسال الرسالة وبدء معالجتها',
+            LATENCY_BUCKETS
+        )
+
+    def observe_download(self, nbytes: int, seconds: float, ok: bool = True):
+        """تسجيل تنزيل ملف (أو جزء منه عند الفشل)"""
+        self.downloads.inc(result='ok' if ok else 'error')
+        self.download_bytes.inc(nbytes)
+        if ok:
+            self.download_seconds.observe(seconds)
+            if seconds > 0 and nbytes:
+                self.throughput.observe(nbytes / seconds, direction='download')
+
+    def observe_upload(self, nbytes: int, seconds: float, ok: bool = True):
+        """تسجيل رفع ملف إلى Drive"""
+        self.uploads.inc(result='ok' if ok else 'error')
+        self.upload_bytes.inc(nbytes)
+        if ok:
+            self.upload_seconds.observe(seconds)
+            if seconds > 0 and nbytes:
+                self.throughput.observe(nbytes / seconds, direction='upload')
+
+    def observe_drive_error(self, error: Exception):
+        """تسجيل خطأ Drive حسب رمز حالة HTTP"""
+        response = getattr(error, 'resp', None)
+        status = getattr(response, 'status', None)
+        self.drive_errors.inc(status=str(status) if status else 'network')
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+class MetricsServer:
+    """خادم HTTP محلي يعرض المقاييس للقراءة الدورية (scrape)"""
+
+    def __init__(self, registry, listen: str = '127.0.0.1', port: int = 9108, path: str = '/metrics'):
+        """
+        Args:
+            registry: كائن يوفر render() (MetricsRegistry أو TransferMetrics)
+            listen: عنوان الاستماع (محلي افتراضياً)
+            port: منفذ الاستماع
+            path: مسار المقاييس
+        """
+        self.registry = registry
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self._runner = None
+
+    @property
+    def bound_port(self) -> int:
+        """المنفذ الفعلي بعد البدء (مفيد عند استخدام المنفذ 0)"""
+        for address in self._runner.addresses:
+            return address[1]
+        return self.port
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.registry.render().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+    async def start(self):
+        """بدء الاستماع"""
+        app = web.Application()
+        app.router.add_get(self.path, self.handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.listen, self.port)
+        await site.start()
+        logger.info(f"خادم المقاييس يستمع على {self.listen}:{self.bound_port}{self.path}")
+
+    async def stop(self):
+        """إيقاف الخادم"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
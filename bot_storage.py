@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+تخزين حالة البوت في قاعدة بيانات SQLite محلية
+يتم فتح قاعدة البيانات عند أول استخدام فقط، ويمكن استخدامها من عدة خيوط
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import timezone
+from typing import List, Optional
+
+from google.oauth2.credentials import Credentials
+
+logger = logging.getLogger(__name__)
+
+
+def credentials_expiry(credentials: Credentials) -> Optional[float]:
+    """وقت انتهاء صلاحية رمز الوصول كطابع زمني (expiry في Google بتوقيت UTC دون منطقة زمنية)"""
+    if credentials.expiry is None:
+        return None
+    return credentials.expiry.replace(tzinfo=timezone.utc).timestamp()
+
+
+class SQLiteStore:
+    """أساس مشترك لمخازن SQLite: اتصال كسول وقفل وإنشاء الجداول"""
+
+    SCHEMA = ""
+    # أعمدة أضيفت بعد إنشاء الجداول: (الجدول، العمود، النوع)
+    COLUMNS = ()
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: مسار ملف قاعدة البيانات
+        """
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.RLock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """فتح الاتصال وإنشاء الجداول عند أول استخدام"""
+        if self._conn is None:
+            directory = os.path.dirname(os.path.abspath(self.db_path))
+            os.makedirs(directory, exist_ok=True)
+            is_new = not os.path.exists(self.db_path)
+
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+            for table, column, column_type in self.COLUMNS:
+                existing = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+            conn.commit()
+
+            if is_new:
+                # الملف يحتوي على رموز وصول فلا يجب أن يقرأه غير مالكه
+                os.chmod(self.db_path, 0o600)
+            self._conn = conn
+        return self._conn
+
+    def exists(self) -> bool:
+        """هل تم إنشاء قاعدة البيانات بالفعل"""
+        return self._conn is not None or os.path.exists(self.db_path)
+
+    def execute(self, sql: str, params=()) -> List[sqlite3.Row]:
+        """تنفيذ استعلام وإرجاع النتائج مع حفظ التغييرات"""
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(sql, params).fetchall()
+            conn.commit()
+            return rows
+
+    def close(self):
+        """إغلاق الاتصال"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class CredentialStore(SQLiteStore):
+    """مخزن دائم لبيانات اعتماد Google لكل مستخدم مفهرس حسب وقت انتهاء الصلاحية"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS credentials (
+            user_id INTEGER PRIMARY KEY,
+            token_json TEXT NOT NULL,
+            expiry REAL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_credentials_expiry ON credentials (expiry);
+    """
+
+    def __init__(self, db_path: str, scopes: List[str]):
+        """
+        Args:
+            db_path: مسار ملف قاعدة البيانات
+            scopes: نطاقات Google المطلوبة
+        """
+        super().__init__(db_path)
+        self.scopes = scopes
+
+    def save(self, user_id: int, credentials: Credentials):
+        """حفظ أو تحديث بيانات اعتماد المستخدم"""
+        self.execute(
+            "INSERT OR REPLACE INTO credentials (user_id, token_json, expiry, updated_at) VALUES (?, ?, ?, ?)",
+            (user_id, credentials.to_json(), credentials_expiry(credentials), time.time())
+        )
+
+    def load(self, user_id: int) -> Optional[Credentials]:
+        """تحميل بيانات اعتماد المستخدم أو None إذا لم يكن مربوطاً"""
+        rows = self.execute("SELECT token_json FROM credentials WHERE user_id = ?", (user_id,))
+        if not rows:
+            return None
+        try:
+            return Credentials.from_authorized_user_info(json.loads(rows[0]['token_json']), self.scopes)
+        except (ValueError, KeyError) as e:
+            logger.error(f"بيانات اعتماد تالفة للمستخدم {user_id}: {e}")
+            return None
+
+    def delete(self, user_id: int):
+        """حذف بيانات اعتماد المستخدم"""
+        self.execute("DELETE FROM credentials WHERE user_id = ?", (user_id,))
+
+    def expiring_before(self, timestamp: float) -> List[int]:
+        """المستخدمون الذين تنتهي صلاحية رموزهم قبل الوقت المحدد"""
+        rows = self.execute(
+            "SELECT user_id FROM credentials WHERE expiry IS NOT NULL AND expiry < ? ORDER BY expiry",
+            (timestamp,)
+        )
+        return [row['user_id'] for row in rows]
+
+
+class UploadIndex(SQLiteStore):
+    """
+    فهرس الملفات المرفوعة لكل مستخدم حسب file_unique_id في تيليجرام
+
+    يُحفظ مع كل ملف مجموعه الاختباري (MD5 واختيارياً SHA-256) بعد التحقق منه مقابل Drive
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS uploads (
+            user_id INTEGER NOT NULL,
+            file_unique_id TEXT NOT NULL,
+            drive_file_id TEXT NOT NULL,
+            web_link TEXT,
+            file_name TEXT,
+            file_size INTEGER,
+            md5 TEXT,
+            uploaded_at REAL NOT NULL,
+            PRIMARY KEY (user_id, file_unique_id)
+        );
+    """
+    COLUMNS = (
+        ('uploads', 'sha256', 'TEXT'),
+    )
+
+    def get(self, user_id: int, file_unique_id: str) -> Optional[dict]:
+        """البحث عن ملف مرفوع مسبقاً"""
+        rows = self.execute(
+            "SELECT * FROM uploads WHERE user_id = ? AND file_unique_id = ?",
+            (user_id, file_unique_id)
+        )
+        return dict(rows[0]) if rows else None
+
+    def record(self, user_id: int, file_unique_id: str, drive_file_id: str, web_link: str,
+               file_name: str = None, file_size: int = None, md5: str = None, sha256: str = None):
+        """تسجيل ملف بعد رفعه بنجاح"""
+        self.execute(
+            "INSERT OR REPLACE INTO uploads "
+            "(user_id, file_unique_id, drive_file_id, web_link, file_name, file_size, md5, sha256, uploaded_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (user_id, file_unique_id, drive_file_id, web_link, file_name, file_size, md5, sha256, time.time())
+        )
+
+    def forget(self, user_id: int, file_unique_id: str):
+        """حذف ملف من الفهرس (مثلاً إذا حُذف من Drive)"""
+        self.execute(
+            "DELETE FROM uploads WHERE user_id = ? AND file_unique_id = ?",
+            (user_id, file_unique_id)
+        )
+
+
+class UserSettings(SQLiteStore):
+    """إعدادات كل مستخدم: مجلد الوجهة على Drive وتنظيم المجلدات الفرعية"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS user_settings (
+            user_id INTEGER PRIMARY KEY,
+            folder_id TEXT,
+            folder_layout TEXT,
+            updated_at REAL NOT NULL
+        );
+    """
+
+    def get(self, user_id: int) -> dict:
+        """إعدادات المستخدم (قيم None لما لم يحدده)"""
+        rows = self.execute("SELECT folder_id, folder_layout FROM user_settings WHERE user_id = ?", (user_id,))
+        return dict(rows[0]) if rows else {'folder_id': None, 'folder_layout': None}
+
+    def update(self, user_id: int, **values):
+        """
+        تحديث إعدادات المستخدم
+
+        Args:
+            values: folder_id و/أو folder_layout (None يعيد القيمة الافتراضية)
+        """
+        unknown = set(values) - {'folder_id', 'folder_layout'}
+        if unknown:
+            raise ValueError(f"إعدادات غير معروفة: {sorted(unknown)}")
+        settings = self.get(user_id)
+        settings.update(values)
+        self.execute(
+            "INSERT OR REPLACE INTO user_settings (user_id, folder_id, folder_layout, updated_at) "
+            "VALUES (?, ?, ?, ?)",
+            (user_id, settings['folder_id'], settings['folder_layout'], time.time())
+        )
+
+
+class JobStore(SQLiteStore):
+    """
+    سجل عمليات الرفع الجارية حتى يمكن متابعتها بعد إعادة تشغيل البوت
+
+    يُحفظ لكل عملية مصدر الملف (file_id أو المسار المحلي) ورابط جلسة الرفع
+    المتقطع وآخر موضع أكده Google Drive، ويُحذف السجل عند انتهاء العملية.
+
+    يعمل السجل أيضاً كقائمة انتظار مشتركة بين عدة عمليات (processes): الواجهة تضيف
+    العمليات بحالة queued، وكل عامل يحجز عملية بعقد إيجار (lease) يجدده دورياً،
+    فإذا توقف العامل انتهى العقد وأصبحت العملية متاحة لعامل آخر يستكملها من آخر موضع
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS upload_jobs (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            chat_id INTEGER,
+            message_id INTEGER,
+            file_id TEXT NOT NULL,
+            file_unique_id TEXT,
+            file_name TEXT NOT NULL,
+            file_size INTEGER NOT NULL,
+            local_path TEXT,
+            session_uri TEXT,
+            offset INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+    """
+    COLUMNS = (
+        ('upload_jobs', 'parent_id', 'TEXT'),
+        ('upload_jobs', 'status', "TEXT NOT NULL DEFAULT 'running'"),
+        ('upload_jobs', 'lease_owner', 'TEXT'),
+        ('upload_jobs', 'lease_expires', 'REAL'),
+        ('upload_jobs', 'attempts', 'INTEGER NOT NULL DEFAULT 0'),
+        ('upload_jobs', 'folder_path', 'TEXT'),
+        ('upload_jobs', 'mime_type', 'TEXT'),
+    )
+
+    # عمليات العامل الأخرى النشطة للمستخدم (لتوزيع العمال بالتناوب بين المستخدمين)
+    _ACTIVE_FOR_USER = (
+        "(SELECT COUNT(*) FROM upload_jobs AS active WHERE active.user_id = candidate.user_id "
+        "AND active.status = 'running' AND active.lease_expires >= :now)"
+    )
+
+    def create(self, user_id: int, chat_id: int, message_id: int, file_id: str, file_unique_id: str,
+               file_name: str, file_size: int, local_path: str = None, parent_id: str = None,
+               status: str = 'running', folder_path: str = None, mime_type: str = None) -> int:
+        """
+        تسجيل عملية رفع جديدة وإرجاع معرفها
+
+        Args:
+            status: running لعملية تنفذها العملية الحالية، أو queued لعملية ينفذها أحد العمال
+            folder_path: مسار مجلد الوجهة النسبي إذا لم يُحدد parent_id (يحوّله العامل إلى معرف)
+            mime_type: نوع محتوى الملف (يُرسل إلى Drive عند بدء الرفع)
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute(
+                "INSERT INTO upload_jobs "
+                "(user_id, chat_id, message_id, file_id, file_unique_id, file_name, file_size, local_path, "
+                "parent_id, status, folder_path, mime_type, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, chat_id, message_id, file_id, file_unique_id, file_name, file_size, local_path,
+                 parent_id, status, folder_path, mime_type, now, now)
+            )
+            conn.commit()
+            return cursor.lastrowid
+
+    def update_session(self, job_id: int, session_uri: str, offset: int):
+        """حفظ رابط جلسة الرفع وآخر موضع أكده الخادم"""
+        self.execute(
+            "UPDATE upload_jobs SET session_uri = ?, offset = ?, updated_at = ? WHERE job_id = ?",
+            (session_uri, offset, time.time(), job_id)
+        )
+
+    def get(self, job_id: int) -> Optional[dict]:
+        """قراءة عملية رفع"""
+        rows = self.execute("SELECT * FROM upload_jobs WHERE job_id = ?", (job_id,))
+        return dict(rows[0]) if rows else None
+
+    def pending(self) -> List[dict]:
+        """العمليات التي لم تكتمل ولا يحجزها عامل نشط (بترتيب إنشائها)"""
+        rows = self.execute(
+            "SELECT * FROM upload_jobs WHERE lease_expires IS NULL OR lease_expires < ? ORDER BY job_id",
+            (time.time(),)
+        )
+        return [dict(row) for row in rows]
+
+    def count_queued(self, user_id: int = None) -> int:
+        """عدد العمليات التي تنتظر عاملاً (للمستخدم أو للجميع)"""
+        if user_id is None:
+            rows = self.execute("SELECT COUNT(*) AS queued FROM upload_jobs WHERE status = 'queued'")
+        else:
+            rows = self.execute(
+                "SELECT COUNT(*) AS queued FROM upload_jobs WHERE user_id = ? AND status = 'queued'",
+                (user_id,)
+            )
+        return rows[0]['queued']
+
+    def claim(self, owner: str, lease_seconds: float, per_user_limit: int = None,
+              exclude_users=()) -> Optional[dict]:
+        """
+        حجز أقدم عملية متاحة لعامل
+
+        العملية المتاحة هي المنتظرة أو التي انتهى عقد عاملها. يُفضّل المستخدم الذي لديه
+        أقل عدد من العمليات الجارية، ولا يتجاوز أي مستخدم per_user_limit عملية جارية.
+        يتم الاختيار والحجز داخل معاملة BEGIN IMMEDIATE فلا يحجز عاملان نفس العملية
+
+        Args:
+            owner: معرف العامل
+            lease_seconds: مدة العقد قبل أن تُعتبر العملية متروكة
+            per_user_limit: الحد الأقصى للعمليات الجارية لكل مستخدم
+            exclude_users: مستخدمون لا تُحجز عملياتهم الآن (مثل من نفد رصيدهم في محدد المعدل)
+
+        Returns:
+            العملية المحجوزة (مع عدد المحاولات بعد الزيادة) أو None
+        """
+        now = time.time()
+        params = {'now': now, 'limit': per_user_limit}
+        excluded = ''
+        if exclude_users:
+            params.update({f'excluded{index}': user_id for index, user_id in enumerate(exclude_users)})
+            excluded = "AND user_id NOT IN ({}) ".format(
+                ', '.join(f':excluded{index}' for index in range(len(exclude_users)))
+            )
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT job_id FROM upload_jobs AS candidate "
+                    "WHERE (status = 'queued' OR (status = 'running' AND lease_expires < :now)) "
+                    f"AND (:limit IS NULL OR {self._ACTIVE_FOR_USER} < :limit) {excluded}"
+                    f"ORDER BY {self._ACTIVE_FOR_USER}, job_id LIMIT 1",
+                    params
+                ).fetchone()
+                if row is None:
+                    conn.commit()
+                    return None
+                conn.execute(
+                    "UPDATE upload_jobs SET status = 'running', lease_owner = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE job_id = ?",
+                    (owner, now + lease_seconds, now, row['job_id'])
+                )
+                job = conn.execute("SELECT * FROM upload_jobs WHERE job_id = ?", (row['job_id'],)).fetchone()
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            return dict(job)
+
+    def renew(self, job_id: int, owner: str, lease_seconds: float) -> bool:
+        """
+        تجديد عقد العامل على العملية (نبضة حياة)
+
+        Returns:
+            False إذا لم يعد العامل مالكاً للعملية (انتهى عقده وحجزها عامل آخر أو حُذفت)
+        """
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute(
+                "UPDATE upload_jobs SET lease_expires = ? WHERE job_id = ? AND lease_owner = ?",
+                (time.time() + lease_seconds, job_id, owner)
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def release(self, job_id: int, owner: str):
+        """إعادة العملية إلى قائمة الانتظار (عند إيقاف العامل) مع الاحتفاظ بجلسة الرفع"""
+        self.execute(
+            "UPDATE upload_jobs SET status = 'queued', lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+            "WHERE job_id = ? AND lease_owner = ?",
+            (time.time(), job_id, owner)
+        )
+
+    def finish(self, job_id: int, owner: str = None):
+        """
+        حذف العملية بعد اكتمالها أو فشلها نهائياً
+
+        Args:
+            owner: إذا حُدد لا تُحذف العملية إلا إذا كان العامل ما زال مالكها
+        """
+        if owner is None:
+            self.execute("DELETE FROM upload_jobs WHERE job_id = ?", (job_id,))
+        else:
+            self.execute("DELETE FROM upload_jobs WHERE job_id = ? AND lease_owner = ?", (job_id, owner))
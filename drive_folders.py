@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+تحديد مجلد الوجهة على Google Drive لكل ملف مرفوع
+المسار النسبي (مثل Videos/2026-10) يُحوّل إلى معرف مجلد عبر فهرس محلي بمدة صلاحية،
+فلا يضيف تنظيم الملفات طلبي files.list و files.create إلى كل ملف، وإنشاء المجلد
+الناقص محمي من التكرار عند رفع عدة ملفات إلى نفس المسار في وقت واحد
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+# مكونات تنظيم المجلدات الفرعية المتاحة
+LAYOUT_TOKENS = ('type', 'date', 'chat')
+
+# أسماء مجلدات الأنواع (التنظيم حسب type)
+TYPE_FOLDERS = {
+    'document': 'Documents',
+    'photo': 'Photos',
+    'video': 'Videos',
+    'album': 'Albums',
+    'audio': 'Audio',
+    'voice': 'Voice',
+    'video_note': 'Video Notes',
+    'animation': 'Animations',
+    'sticker': 'Stickers',
+}
+
+DRIVE_ID = re.compile(r'[A-Za-z0-9_-]{19,}')
+DRIVE_FOLDER_LINK = re.compile(r'/folders/([A-Za-z0-9_-]+)|[?&]id=([A-Za-z0-9_-]+)')
+
+
+def parse_layout(value: str) -> tuple:
+    """
+    تحويل وصف التنظيم (مثل "type/date") إلى مكوناته
+
+    Raises:
+        ValueError: إذا احتوى على مكون غير معروف
+    """
+    tokens = tuple(token.strip().lower() for token in re.split(r'[/,\s]+', value or '') if token.strip())
+    unknown = [token for token in tokens if token not in LAYOUT_TOKENS]
+    if unknown:
+        raise ValueError(f"مكونات تنظيم غير معروفة: {', '.join(unknown)}")
+    return tokens
+
+
+def parse_folder_id(value: str) -> Optional[str]:
+    """استخراج معرف المجلد من رابط Drive أو قبوله كما هو، أو None إذا لم يكن معرفاً"""
+    value = (value or '').strip()
+    match = DRIVE_FOLDER_LINK.search(value)
+    if match:
+        return match.group(1) or match.group(2)
+    return value if DRIVE_ID.fullmatch(value) else None
+
+
+def clean_folder_name(name: str) -> str:
+    """اسم صالح لمكون واحد من المسار (دون / وبطول معقول)"""
+    name = re.sub(r'[/\\\x00-\x1f]+', '_', str(name)).strip(' .')
+    return name[:100] or '_'
+
+
+def folder_path(layout: tuple, kind: str = None, chat: str = None, when: datetime = None) -> str:
+    """
+    المسار النسبي للمجلد الفرعي حسب التنظيم
+
+    Args:
+        layout: مكونات التنظيم بالترتيب (من parse_layout)
+        kind: نوع الوسائط (document أو photo أو video أو audio أو voice أو video_note أو animation أو sticker)
+        chat: اسم المحادثة أو مصدر الرسالة المعاد توجيهها
+        when: تاريخ الرسالة (افتراضياً الآن)
+    """
+    parts = []
+    for token in layout:
+        if token == 'type':
+            parts.append(TYPE_FOLDERS.get(kind, 'Files'))
+        elif token == 'date':
+            parts.append((when or datetime.now()).strftime('%Y-%m'))
+        elif token == 'chat' and chat:
+            parts.append(clean_folder_name(chat))
+    return '/'.join(parts)
+
+
+def _quote(value: str) -> str:
+    """تهريب النص داخل استعلام files.list"""
+    return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+class FolderResolver:
+    """
+    تحويل المسارات إلى معرفات مجلدات Drive مع فهرس محلي
+
+    - ttl: مدة صلاحية كل معرف في الفهرس بالثواني (المجلد قد يُحذف أو يُنقل من Drive)
+    - max_entries: الحد الأقصى لعناصر الفهرس (تُحذف الأقدم استخداماً)
+
+    الدوال التي تتصل بـ Drive تعمل داخل منفذ Drive وتستقبل الخدمة ودالة execute
+    تنفذ الطلب (مع تحديد المعدل وإعادة المحاولة) وتعيد استجابته
+    """
+
+    LOCK_STRIPES = 64
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 4096, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # قفل لكل مجموعة من المسارات: يمنع إنشاء نفس المجلد مرتين دون قفل لكل مسار
+        self._locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key: tuple):
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= self._clock():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return value
+
+    def _put(self, key: tuple, value):
+        with self._cache_lock:
+            self._cache[key] = (value, self._clock() + self.ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        """حذف كل مجلدات المستخدم من الفهرس (مثلاً بعد رفض Drive لمجلد محذوف)"""
+        with self._cache_lock:
+            for key in [key for key in self._cache if key[0] == user_id]:
+                del self._cache[key]
+
+    def is_accessible(self, user_id: int, folder_id: str, service, execute) -> bool:
+        """
+        هل يستطيع البوت الرفع إلى المجلد (موجود وغير محذوف ومن نوع مجلد)
+
+        تُحفظ النتيجة في الفهرس أيضاً حتى لا يُطلب المجلد الجذر مع كل ملف
+        """
+        key = (user_id, folder_id, None)
+        cached = self._get(key)
+        if cached is not None:
+            return cached
+        try:
+            metadata = execute('drive_get_folder', service.files().get(
+                fileId=folder_id, fields='id,mimeType,trashed'
+            ))
+            accessible = metadata.get('mimeType') == FOLDER_MIME_TYPE and not metadata.get('trashed')
+        except Exception as e:
+            status = getattr(getattr(e, 'resp', None), 'status', None)
+            if status not in (403, 404):
+                raise
+            accessible = False
+        self._put(key, accessible)
+        return accessible
+
+    def resolve(self, user_id: int, root_id: Optional[str], path: str, service, execute) -> Optional[str]:
+        """
+        معرف المجلد الموافق للمسار تحت root_id (None للمجلد الرئيسي)، مع إنشاء الناقص
+
+        Returns:
+            معرف المجلد الأخير في المسار، أو root_id إذا كان المسار فارغاً
+        """
+        parent_id = root_id
+        for name in filter(None, (part.strip() for part in (path or '').split('/'))):
+            parent_id = self._child(user_id, parent_id, clean_folder_name(name), service, execute)
+        return parent_id
+
+    def _child(self, user_id: int, parent_id: Optional[str], name: str, service, execute) -> str:
+        key = (user_id, parent_id or 'root', name)
+        folder_id = self._get(key)
+        if folder_id is not None:
+            self.hits += 1
+            return folder_id
+
+        with self._locks[hash(key) % self.LOCK_STRIPES]:
+            # ربما أنشأه خيط آخر أثناء الانتظار
+            folder_id = self._get(key)
+            if folder_id is not None:
+                self.hits += 1
+                return folder_id
+            self.misses += 1
+            folders = self._find(parent_id, name, service, execute)
+            if folders:
+                folder_id = folders[0]['id']
+            else:
+                folder_id = self._create(parent_id, name, service, execute)
+            self._put(key, folder_id)
+            return folder_id
+
+    def _find(self, parent_id: Optional[str], name: str, service, execute) -> list:
+        """المجلدات بهذا الاسم تحت الأب مرتبة من الأقدم"""
+        query = (
+            f"name = {_quote(name)} and {_quote(parent_id or 'root')} in parents "
+            f"and mimeType = '{FOLDER_MIME_TYPE}' and trashed = false"
+        )
+        response = execute('drive_find_folder', service.files().list(
+            q=query, spaces='drive', fields='files(id,createdTime)', pageSize=10
+        ))
+        return sorted(response.get('files', []), key=lambda folder: (folder.get('createdTime', ''), folder['id']))
+
+    def _create(self, parent_id: Optional[str], name: str, service, execute) -> str:
+        """
+        إنشاء المجلد ثم التحقق من عدم إنشاء عملية أخرى (عامل آخر) لنفس المجلد في نفس الوقت
+
+        إذا وُجد أكثر من مجلد يُعتمد الأقدم في كل العمليات، ويُحذف المجلد الذي أنشأناه
+        إذا لم يكن هو الأقدم (لم يُرفع إليه شيء بعد لأنه لم يُعد لأحد)
+        """
+        metadata = {'name': name, 'mimeType': FOLDER_MIME_TYPE}
+        if parent_id:
+            metadata['parents'] = [parent_id]
+        created = execute('drive_create_folder', service.files().create(body=metadata, fields='id'))
+        folders = self._find(parent_id, name, service, execute)
+        if not folders or folders[0]['id'] == created['id']:
+            return created['id']
+
+        logger.info(f"المجلد {name} أُنشئ من عملية أخرى في نفس الوقت، استخدام الأقدم {folders[0]['id']}")
+        try:
+            execute('drive_delete_folder', service.files().delete(fileId=created['id']))
+        except Exception as e:
+            logger.warning(f"تعذر حذف المجلد المكرر {created['id']}: {e}")
+        return folders[0]['id']
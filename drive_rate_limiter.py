@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+تحديد معدل طلبات Google Drive API بدلاء رموز (token bucket)
+دلو لكل حساب Google (مستخدم) ودلو مشترك لعميل OAuth (مشروع Google Cloud)، حتى
+يتأخر العمل قبل إرسال الطلب بدلاً من أن يرفضه Drive بخطأ 403 أو 429
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from googleapiclient.errors import HttpError
+
+from retry_policy import drive_error_reason, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+# أسباب أخطاء Drive حسب نطاق الحد الذي تم تجاوزه
+USER_LIMIT_REASONS = {'userRateLimitExceeded'}
+CLIENT_LIMIT_REASONS = {'rateLimitExceeded'}
+
+
+class TokenBucket:
+    """
+    دلو رموز: يمتلئ بمعدل rate رمز في الثانية حتى capacity
+
+    ليس آمناً للخيوط بمفرده؛ يحميه قفل DriveRateLimiter
+    """
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = now
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        start = max(self.updated, self.paused_until)
+        if now > start:
+            self.tokens = min(self.capacity, self.tokens + (now - start) * self.rate)
+        self.updated = max(self.updated, now)
+
+    def wait_time(self, tokens: float, now: float) -> float:
+        """الثواني حتى يتوفر العدد المطلوب من الرموز (0 إذا كان متاحاً الآن)"""
+        self._refill(now)
+        tokens = min(tokens, self.capacity)
+        wait = max(0.0, self.paused_until - now)
+        missing = tokens - self.tokens
+        if missing > 1e-9:  # تجاهل أخطاء التقريب في الكسور العشرية
+            wait += missing / self.rate
+        return wait
+
+    def consume(self, tokens: float):
+        self.tokens -= min(tokens, self.capacity)
+
+    def pause(self, seconds: float, now: float):
+        """إفراغ الدلو وإيقاف امتلائه (بعد رفض Drive لتجاوز الحد)"""
+        self._refill(now)
+        self.tokens = 0.0
+        self.paused_until = max(self.paused_until, now + seconds)
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class DriveRateLimiter:
+    """
+    محدد معدل طلبات Drive
+
+    - user_rate / user_burst: المعدل المستمر (طلب/ث) وأقصى دفعة لكل حساب Google
+    - client_rate / client_burst: نفس الحدين لكل طلبات عميل OAuth (كل الحسابات معاً)
+    - cooldown: مدة إيقاف الدلو بعد خطأ تجاوز الحد إذا لم يحدد Drive ترويسة Retry-After
+    - on_wait: دالة تُستدعى بـ (النطاق، الثواني) عند كل انتظار (للمقاييس)
+
+    المعدل 0 يعطل الحد في ذلك النطاق. الحدود خاصة بكل عملية: عند تشغيل عدة عمال
+    يُقسم حد العميل على عددهم
+    """
+
+    def __init__(self, user_rate: float = 10.0, user_burst: float = 20, client_rate: float = 100.0,
+                 client_burst: float = 200, cooldown: float = 5.0, max_users: int = 1024,
+                 on_wait=None, clock=time.monotonic, sleep=time.sleep):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.cooldown = cooldown
+        self.max_users = max_users
+        self.on_wait = on_wait
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+        self._client = TokenBucket(client_rate, client_burst, clock()) if client_rate > 0 else None
+
+    @property
+    def enabled(self) -> bool:
+        return self._client is not None or self.user_rate > 0
+
+    def _user_bucket(self, user_id: int, now: float) -> Optional[TokenBucket]:
+        """دلو المستخدم (يُنشأ عند أول طلب، وتُحذف الدلاء الممتلئة الأقدم استخداماً)"""
+        if self.user_rate <= 0:
+            return None
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            bucket = self._users[user_id] = TokenBucket(self.user_rate, self.user_burst, now)
+            # الدلو الممتلئ لا يحمل حالة، فحذفه لا يغير المعدل
+            for old_id in list(self._users)[:max(0, len(self._users) - self.max_users)]:
+                if self._users[old_id].is_full(now):
+                    del self._users[old_id]
+        else:
+            self._users.move_to_end(user_id)
+        return bucket
+
+    def _wait_times(self, user_id: int, tokens: float, now: float) -> tuple:
+        user_bucket = self._user_bucket(user_id, now)
+        user_wait = user_bucket.wait_time(tokens, now) if user_bucket else 0.0
+        client_wait = self._client.wait_time(tokens, now) if self._client else 0.0
+        return user_bucket, user_wait, client_wait
+
+    def ready_in(self, user_id: int) -> float:
+        """الثواني حتى يمكن إرسال طلب واحد لهذا المستخدم (دون استهلاك رصيد)"""
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            _, user_wait, client_wait = self._wait_times(user_id, 1, self._clock())
+        return max(user_wait, client_wait)
+
+    def client_ready_in(self) -> float:
+        """الثواني حتى يتوفر رصيد في دلو عميل OAuth"""
+        if self._client is None:
+            return 0.0
+        with self._lock:
+            return self._client.wait_time(1, self._clock())
+
+    def acquire(self, user_id: int, tokens: float = 1) -> float:
+        """
+        انتظار الرصيد ثم استهلاكه قبل إرسال طلب (يعمل داخل منفذ Drive)
+
+        Args:
+            user_id: معرف المستخدم صاحب حساب Google
+            tokens: عدد الطلبات (مثلاً عدد عناصر الطلب المجمّع)
+
+        Returns:
+            إجمالي الثواني التي انتظرها الطلب
+        """
+        if not self.enabled:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                user_bucket, user_wait, client_wait = self._wait_times(user_id, tokens, now)
+                if not user_wait and not client_wait:
+                    if user_bucket is not None:
+                        user_bucket.consume(tokens)
+                    if self._client is not None:
+                        self._client.consume(tokens)
+                    return waited
+            delay = max(user_wait, client_wait)
+            if self.on_wait is not None:
+                self.on_wait('user' if user_wait >= client_wait else 'client', delay)
+            self._sleep(delay)
+            waited += delay
+
+    def observe_error(self, user_id: int, error: Exception):
+        """
+        إيقاف الدلو المناسب إذا رفض Drive الطلب لتجاوز الحد
+
+        429 و userRateLimitExceeded تخص حساب المستخدم، و rateLimitExceeded تخص المشروع كله
+        """
+        if not isinstance(error, HttpError):
+            return
+        status = error.resp.status
+        reason = drive_error_reason(error) if status == 403 else None
+        if status != 429 and reason not in USER_LIMIT_REASONS | CLIENT_LIMIT_REASONS:
+            return
+        pause = parse_retry_after(error.resp.get('retry-after'))
+        pause = self.cooldown if pause is None else pause
+        with self._lock:
+            now = self._clock()
+            if reason in CLIENT_LIMIT_REASONS:
+                if self._client is not None:
+                    self._client.pause(pause, now)
+            else:
+                bucket = self._user_bucket(user_id, now)
+                if bucket is not None:
+                    bucket.pause(pause, now)
+        logger.warning(f"تجاوز حد معدل Drive ({reason or status}) للمستخدم {user_id}: إيقاف الطلبات {pause:.1f} ثانية")
+
+    def throttled_users(self) -> list:
+        """المستخدمون الذين لا يملكون رصيداً لطلب واحد الآن"""
+        with self._lock:
+            now = self._clock()
+            return [user_id for user_id, bucket in self._users.items() if bucket.wait_time(1, now) > 0]
+
+    def client_tokens(self) -> float:
+        """الرصيد المتاح حالياً في دلو عميل OAuth (-1 إذا كان الحد معطلاً)"""
+        if self._client is None:
+            return -1
+        with self._lock:
+            self._client.wait_time(0, self._clock())
+            return self._client.tokens
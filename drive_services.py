@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+ذاكرة مؤقتة لخدمات Google Drive لكل مستخدم
+تتجنب إعادة تحليل وثيقة الاكتشاف (discovery) وإنشاء اتصال HTTP جديد مع كل ملف
+"""
+
+import json
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+logger = logging.getLogger(__name__)
+
+_discovery_document = None
+_discovery_lock = threading.Lock()
+
+
+def get_drive_discovery_document() -> dict:
+    """
+    تحميل وثيقة اكتشاف Drive v3 المرفقة مع المكتبة مرة واحدة فقط
+
+    الوثيقة مضمنة في حزمة google-api-python-client، لذلك لا يحتاج أول رفع
+    بعد التشغيل إلى طلب شبكة لجلبها
+    """
+    global _discovery_document
+    with _discovery_lock:
+        if _discovery_document is None:
+            _discovery_document = json.loads(get_static_doc('drive', 'v3'))
+        return _discovery_document
+
+
+class _CachedUser:
+    """خدمات Drive الخاملة لمستخدم واحد مرتبطة ببيانات اعتماده"""
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self.idle = []
+
+
+class DriveServiceCache:
+    """
+    ذاكرة مؤقتة (LRU) لكائنات خدمة Drive لكل مستخدم
+
+    كائنات httplib2 ليست آمنة للاستخدام من عدة خيوط، لذلك يحصل كل رفع على
+    خدمة حصرية ويعيدها بعد الانتهاء ليعاد استخدام اتصالها (keep-alive).
+    عند تغير كائن بيانات الاعتماد (ربط جديد عبر /auth) يتم تجاهل الخدمات القديمة.
+    تحديث الرمز في نفس الكائن لا يتطلب إعادة البناء لأن الخدمة تشير إليه مباشرة.
+    """
+
+    def __init__(self, max_users: int = 128, max_idle_per_user: int = 4):
+        """
+        Args:
+            max_users: عدد المستخدمين المحتفظ بخدماتهم قبل حذف الأقدم استخداماً
+            max_idle_per_user: الحد الأقصى للخدمات الخاملة لكل مستخدم
+        """
+        self.max_users = max_users
+        self.max_idle_per_user = max_idle_per_user
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _build(self, credentials):
+        """بناء خدمة Drive جديدة من الوثيقة المحملة مسبقاً"""
+        return build_from_document(get_drive_discovery_document(), credentials=credentials)
+
+    def acquire(self, user_id: int, credentials):
+        """الحصول على خدمة Drive حصرية للمستخدم (من الذاكرة أو جديدة)"""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and entry.credentials is credentials:
+                self._users.move_to_end(user_id)
+                if entry.idle:
+                    return entry.idle.pop()
+
+        return self._build(credentials)
+
+    def release(self, user_id: int, credentials, service):
+        """إعادة الخدمة إلى الذاكرة بعد انتهاء الرفع"""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None or entry.credentials is not credentials:
+                entry = _CachedUser(credentials)
+                self._users[user_id] = entry
+            self._users.move_to_end(user_id)
+
+            if len(entry.idle) < self.max_idle_per_user:
+                entry.idle.append(service)
+
+            while len(self._users) > self.max_users:
+                evicted_id, _ = self._users.popitem(last=False)
+                logger.debug(f"حذف خدمات Drive للمستخدم {evicted_id} من الذاكرة المؤقتة")
+
+    @contextmanager
+    def service(self, user_id: int, credentials):
+        """استخدام خدمة Drive ضمن with ثم إعادتها تلقائياً"""
+        service = self.acquire(user_id, credentials)
+        yield service
+        # لا تُعاد الخدمة عند حدوث خطأ لأن حالة اتصالها غير معروفة
+        self.release(user_id, credentials, service)
+
+    def invalidate(self, user_id: int):
+        """حذف خدمات المستخدم (مثلاً عند إعادة الربط)"""
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._users)
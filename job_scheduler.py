@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+جدولة عمليات الرفع مع حدود للتوازي لكل مستخدم وعلى مستوى البوت
+يتم توزيع الأماكن المتاحة بالتناوب بين المستخدمين حتى لا يحتكر مستخدم واحد البوت،
+ويتخطى المجدول المستخدمين الذين نفد رصيدهم في محدد معدل Drive حتى يمتلئ من جديد
+"""
+
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """يُرفع عند تجاوز الحد الأقصى للملفات المنتظرة (ضغط عكسي)"""
+
+
+class UploadScheduler:
+    """
+    مجدول عادل لعمليات الرفع
+
+    - max_concurrent: عدد عمليات الرفع المتزامنة على مستوى البوت
+    - per_user_concurrent: عدد عمليات الرفع المتزامنة لكل مستخدم
+    - max_queued_per_user: عدد الملفات المنتظرة لكل مستخدم قبل رفض الجديدة
+    - max_queued_total: عدد الملفات المنتظرة على مستوى البوت قبل رفض الجديدة
+    - rate_limiter: محدد معدل Drive (اختياري)؛ لا يبدأ رفع مستخدم ليس لديه رصيد لطلب واحد
+    """
+
+    def __init__(self, max_concurrent: int = 4, per_user_concurrent: int = 2,
+                 max_queued_per_user: int = 20, max_queued_total: int = 500, rate_limiter=None):
+        self.max_concurrent = max(1, max_concurrent)
+        self.per_user_concurrent = max(1, per_user_concurrent)
+        self.max_queued_per_user = max_queued_per_user
+        self.max_queued_total = max_queued_total
+        self.rate_limiter = rate_limiter
+        self._wakeup = None  # مؤقت إعادة التوزيع عند امتلاء رصيد مستخدم متأخر
+
+        self._pending = {}  # user_id -> deque من futures المنتظرة
+        self._rotation = deque()  # المستخدمون الذين لديهم ملفات منتظرة بترتيب التناوب
+        self._running = {}  # user_id -> عدد عمليات الرفع الجارية
+        self._active = 0
+
+    @property
+    def active(self) -> int:
+        """عدد عمليات الرفع الجارية حالياً"""
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        """عدد الملفات المنتظرة حالياً"""
+        return sum(len(waiters) for waiters in self._pending.values())
+
+    def position(self, user_id: int, waiter: asyncio.Future) -> int:
+        """تقدير ترتيب الملف في قائمة الانتظار مع مراعاة التناوب بين المستخدمين"""
+        waiters = self._pending.get(user_id)
+        if not waiters or waiter not in waiters:
+            return 0
+
+        index = waiters.index(waiter)
+        ahead = index
+        for other_id, other in self._pending.items():
+            if other_id != user_id:
+                ahead += min(len(other), index + 1)
+        return ahead + 1
+
+    def _schedule_wakeup(self, delay: float):
+        """إعادة التوزيع بعد delay ثانية (أو قبلها إذا كان هناك مؤقت أقرب)"""
+        loop = asyncio.get_running_loop()
+        when = loop.time() + delay
+        if self._wakeup is not None:
+            if self._wakeup.when() <= when:
+                return
+            self._wakeup.cancel()
+        self._wakeup = loop.call_at(when, self._on_wakeup)
+
+    def _on_wakeup(self):
+        self._wakeup = None
+        self._dispatch()
+
+    def _dispatch(self):
+        """منح الأماكن المتاحة للمستخدمين بالتناوب"""
+        while self._active < self.max_concurrent and self._rotation:
+            granted = False
+            rate_wait = None
+            for _ in range(len(self._rotation)):
+                user_id = self._rotation[0]
+                self._rotation.rotate(-1)
+
+                if self._running.get(user_id, 0) >= self.per_user_concurrent:
+                    continue
+
+                if self.rate_limiter is not None:
+                    # تأخير الرفع حتى يتوفر رصيد بدلاً من أن يرفضه Drive
+                    wait = self.rate_limiter.ready_in(user_id)
+                    if wait > 0:
+                        rate_wait = wait if rate_wait is None else min(rate_wait, wait)
+                        continue
+
+                waiters = self._pending[user_id]
+                waiter = waiters.popleft()
+                if not waiters:
+                    del self._pending[user_id]
+                    self._rotation.remove(user_id)
+
+                # طلب أُلغي ولم يُحذف من القائمة بعد
+                if waiter.done():
+                    granted = True
+                    break
+
+                self._running[user_id] = self._running.get(user_id, 0) + 1
+                self._active += 1
+                waiter.set_result(True)
+                granted = True
+                break
+
+            if not granted:
+                if rate_wait is not None:
+                    self._schedule_wakeup(rate_wait)
+                break
+
+    def _release(self, user_id: int):
+        """تحرير مكان بعد انتهاء الرفع"""
+        self._active -= 1
+        self._running[user_id] -= 1
+        if not self._running[user_id]:
+            del self._running[user_id]
+        self._dispatch()
+
+    async def acquire(self, user_id: int, on_queued=None) -> bool:
+        """
+        انتظار مكان متاح للمستخدم
+
+        Args:
+            user_id: معرف المستخدم
+            on_queued: دالة async تُستدعى بترتيب الملف إذا اضطر للانتظار
+
+        Returns:
+            True إذا انتظر الملف في القائمة قبل البدء
+
+        Raises:
+            QueueFull: إذا تجاوز المستخدم أو البوت حد الملفات المنتظرة
+        """
+        if len(self._pending.get(user_id, ())) >= self.max_queued_per_user:
+            raise QueueFull(f"المستخدم {user_id} لديه ملفات كثيرة في الانتظار")
+        if self.queued >= self.max_queued_total:
+            raise QueueFull("قائمة الانتظار ممتلئة")
+
+        waiter = asyncio.get_running_loop().create_future()
+        if user_id not in self._pending:
+            self._pending[user_id] = deque()
+            self._rotation.append(user_id)
+        self._pending[user_id].append(waiter)
+        self._dispatch()
+
+        if waiter.done():
+            return False
+
+        try:
+            if on_queued is not None:
+                try:
+                    await on_queued(self.position(user_id, waiter))
+                except Exception as e:
+                    logger.warning(f"تعذر إبلاغ المستخدم بترتيبه في قائمة الانتظار: {e}")
+            await waiter
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # تم منح المكان لكن الطلب أُلغي قبل البدء
+                self._release(user_id)
+            else:
+                self._discard(user_id, waiter)
+            raise
+
+        return True
+
+    def _discard(self, user_id: int, waiter: asyncio.Future):
+        """إزالة ملف منتظر من القائمة (عند الإلغاء)"""
+        waiter.cancel()
+        waiters = self._pending.get(user_id)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self._pending[user_id]
+                self._rotation.remove(user_id)
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, on_queued=None):
+        """
+        حجز مكان رفع للمستخدم طوال كتلة with
+
+        Yields:
+            True إذا انتظر الملف في القائمة قبل البدء
+        """
+        waited = await self.acquire(user_id, on_queued)
+        try:
+            yield waited
+        finally:
+            self._release(user_id)
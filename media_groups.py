@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+تجميع رسائل الألبوم (media_group_id) قبل معالجتها
+يرسل تيليجرام كل عنصر من الألبوم في تحديث مستقل، فيتم انتظار نافذة قصيرة
+بعد آخر عنصر ثم معالجة الألبوم كاملاً كعملية واحدة
+"""
+
+import asyncio
+
+
+class _PendingGroup:
+    """عناصر ألبوم قيد التجميع"""
+
+    def __init__(self, item, now: float):
+        self.items = [item]
+        self.touched = now
+
+
+class MediaGroupCollector:
+    """
+    مجمّع عناصر الألبوم
+
+    أول تحديث في الألبوم ينتظر حتى تمر window ثانية دون عناصر جديدة ثم يستلم
+    كل العناصر، وبقية التحديثات تنتهي فوراً. يتطلب معالجة التحديثات بالتوازي.
+    """
+
+    def __init__(self, window: float = 1.0):
+        """
+        Args:
+            window: مدة الانتظار بعد آخر عنصر قبل اعتبار الألبوم مكتملاً
+        """
+        self.window = window
+        self._groups = {}
+
+    def __len__(self):
+        return len(self._groups)
+
+    async def collect(self, key, item):
+        """
+        إضافة عنصر إلى ألبومه
+
+        Returns:
+            قائمة كل عناصر الألبوم لأول مستدعٍ، وNone لبقية العناصر
+        """
+        loop = asyncio.get_running_loop()
+        group = self._groups.get(key)
+        if group is not None:
+            group.items.append(item)
+            group.touched = loop.time()
+            return None
+
+        group = _PendingGroup(item, loop.time())
+        self._groups[key] = group
+        try:
+            while True:
+                remaining = group.touched + self.window - loop.time()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(remaining)
+        finally:
+            del self._groups[key]
+        return group.items
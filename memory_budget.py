@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+حد مشترك للذاكرة التي تحجزها عمليات النقل لمخازنها
+كل عملية تحجز ذاكرة مخازنها (الملف في الذاكرة، أنبوب النقل المباشر وأجزاء الرفع، نافذة
+التنزيل المقسم) قبل إنشائها، فلا يتجاوز مجموعها الحد مهما كان عدد العمليات المتزامنة،
+وعند نفاده تنتقل العملية إلى القرص أو تعمل بمخازن أصغر أو تنتظر دورها
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class _Waiter:
+    """عملية تنتظر الذاكرة بترتيب الوصول"""
+
+    __slots__ = ('nbytes', 'minimum', 'loop', 'future', 'granted')
+
+    def __init__(self, nbytes: int, minimum: int, loop, future):
+        self.nbytes = nbytes
+        self.minimum = minimum
+        self.loop = loop
+        self.future = future
+        self.granted = 0
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class MemoryBudget:
+    """
+    حد الذاكرة بالبايت لكل البوت
+
+    - limit: الحد الأقصى بالبايت (0 بلا حد)
+    - on_wait: دالة تُستدعى بعدد الثواني بعد كل انتظار (للمقاييس)
+
+    الحجز إما كامل أو جزئي لا يقل عن minimum (تعمل العملية عندها بمخازن أصغر).
+    acquire ينتظر بترتيب الوصول، و try_acquire لا ينتظر ولا يتجاوز المنتظرين.
+    release آمنة من أي خيط
+    """
+
+    def __init__(self, limit: int = 0, on_wait=None):
+        self.limit = max(0, limit)
+        self.on_wait = on_wait
+        self.used = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+        self._waiters = deque()
+
+    def _bounds(self, nbytes: int, minimum: int = None) -> tuple:
+        """تصغير الطلب إلى الحد (حتى لا ينتظر طلب أكبر من الحد للأبد)"""
+        if self.limit:
+            nbytes = min(nbytes, self.limit)
+        minimum = nbytes if minimum is None else min(minimum, nbytes)
+        return nbytes, minimum
+
+    def _grant(self, nbytes: int, minimum: int) -> int:
+        """حجز ما يتوفر (داخل القفل)؛ 0 إذا كان المتوفر أقل من minimum"""
+        available = nbytes if not self.limit else min(nbytes, self.limit - self.used)
+        if available < minimum or available <= 0:
+            return 0
+        self.used += available
+        self.peak = max(self.peak, self.used)
+        return available
+
+    def try_acquire(self, nbytes: int, minimum: int = None) -> int:
+        """
+        حجز دون انتظار
+
+        Returns:
+            البايتات المحجوزة (بين minimum و nbytes)، أو 0 إذا لم تتوفر
+        """
+        nbytes, minimum = self._bounds(nbytes, minimum)
+        with self._lock:
+            if self._waiters:
+                return 0
+            return self._grant(nbytes, minimum)
+
+    async def acquire(self, nbytes: int, minimum: int = None) -> int:
+        """
+        حجز مع الانتظار حتى يتوفر minimum على الأقل
+
+        Returns:
+            البايتات المحجوزة (يجب تحريرها بـ release)
+        """
+        nbytes, minimum = self._bounds(nbytes, minimum)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if not self._waiters:
+                granted = self._grant(nbytes, minimum)
+                if granted:
+                    return granted
+            waiter = _Waiter(nbytes, minimum, loop, loop.create_future())
+            self._waiters.append(waiter)
+
+        started = time.monotonic()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    granted = 0
+                else:
+                    granted = waiter.granted
+            # الحجز تم قبل الإلغاء مباشرة: إعادته لمن ينتظر
+            if granted:
+                self.release(granted)
+            raise
+        if self.on_wait is not None:
+            self.on_wait(time.monotonic() - started)
+        return waiter.granted
+
+    def release(self, nbytes: int):
+        """إعادة بايتات محجوزة وإيقاظ المنتظرين الذين أصبح طلبهم متاحاً"""
+        if nbytes <= 0:
+            return
+        with self._lock:
+            self.used = max(0, self.used - nbytes)
+            while self._waiters:
+                waiter = self._waiters[0]
+                granted = self._grant(waiter.nbytes, waiter.minimum)
+                if not granted:
+                    break
+                self._waiters.popleft()
+                waiter.granted = granted
+                if waiter.loop.is_closed():
+                    self.used -= granted
+                    continue
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+
+    @property
+    def waiting(self) -> int:
+        """عدد العمليات التي تنتظر الذاكرة"""
+        with self._lock:
+            return len(self._waiters)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+عرض تقدم النقل داخل رسالة التحميل في تيليجرام
+يتم تجميع عدادات التنزيل والرفع لكل عملية وتحديث الرسائل من حلقة واحدة
+بفاصل زمني أدنى لكل رسالة وميزانية عامة للتعديلات حتى لا يتجاوز البوت حدود Telegram
+"""
+
+import asyncio
+import logging
+import threading
+import time
+
+from telegram.error import BadRequest, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+def format_size(num_bytes: float) -> str:
+    """تنسيق الحجم بالميجابايت أو الكيلوبايت"""
+    if num_bytes >= 1024 * 1024:
+        return f"{num_bytes / (1024 * 1024):.1f} ميجابايت"
+    return f"{num_bytes / 1024:.0f} كيلوبايت"
+
+
+def format_duration(seconds: float) -> str:
+    """تنسيق المدة بصيغة ساعات:دقائق:ثوان"""
+    seconds = int(seconds)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+class TransferProgress:
+    """
+    عدادات تقدم عملية نقل واحدة (أو مجموعة ملفات تُعرض في رسالة واحدة)
+
+    يحدّث التنزيل عداده من حلقة الأحداث والرفع من خيوط Drive، والقراءة تتم من حلقة الأحداث فقط.
+    الرفع يُسجل لكل جزء (ملف) على حدة ثم يُجمع حتى تعمل المجموعات بنفس الطريقة
+    """
+
+    def __init__(self, edit, filename: str, total: int, uploaded: int = 0):
+        """
+        Args:
+            edit: دالة async تستقبل النص الجديد للرسالة
+            filename: اسم الملف
+            total: الحجم الكلي بالبايت
+            uploaded: البايتات المرفوعة مسبقاً (عند متابعة رفع سابق)
+        """
+        self.edit = edit
+        self.filename = filename
+        self.total = max(1, total or 0)
+        self.offset = uploaded
+        self.downloaded = 0
+        self.uploaded = uploaded
+        self.started = time.monotonic()
+
+        self.last_edit = 0.0
+        self.last_reported = -1
+        self.speed = 0.0
+        self._sample_time = self.started
+        self._sample_uploaded = uploaded
+        self._parts = {}
+        self._parts_lock = threading.Lock()
+        self.editing = None
+
+    @property
+    def transferred(self) -> int:
+        return self.downloaded + self.uploaded
+
+    def set_part(self, part, nbytes: int):
+        """تحديث البايتات المرفوعة لملف ضمن العملية"""
+        with self._parts_lock:
+            self._parts[part] = nbytes
+            self.uploaded = sum(self._parts.values())
+
+    def _update_speed(self, now: float):
+        """تحديث متوسط سرعة الرفع (متوسط متحرك أسي)"""
+        elapsed = now - self._sample_time
+        if elapsed <= 0:
+            return
+        current = (self.uploaded - self._sample_uploaded) / elapsed
+        self.speed = current if not self.speed else 0.5 * self.speed + 0.5 * current
+        self._sample_time = now
+        self._sample_uploaded = self.uploaded
+
+    def render(self, now: float) -> str:
+        """نص رسالة التقدم"""
+        self._update_speed(now)
+        lines = [f"📤 جاري رفع {self.filename}"]
+        if self.downloaded:
+            # عند متابعة رفع سابق يبدأ التنزيل من الموضع الذي أكده Drive
+            downloaded = self.offset + self.downloaded
+            percent = min(100, int(downloaded * 100 / self.total))
+            lines.append(f"⬇️ التنزيل: {percent}% ({format_size(downloaded)} من {format_size(self.total)})")
+        percent = min(100, int(self.uploaded * 100 / self.total))
+        lines.append(f"☁️ الرفع: {percent}% ({format_size(self.uploaded)} من {format_size(self.total)})")
+        if self.speed > 0:
+            lines.append(f"⚡ السرعة: {format_size(self.speed)}/ث")
+            lines.append(f"⏱️ الوقت المتبقي: {format_duration((self.total - self.uploaded) / self.speed)}")
+        return "\n".join(lines)
+
+
+class ProgressReporter:
+    """
+    منسق تحديثات رسائل التقدم لكل العمليات الجارية
+
+    - min_interval: أقل فاصل بين تعديلين لنفس الرسالة
+    - min_delta: أقل تغير في التقدم (نسبة من الحجم) يستحق تعديلاً
+    - edits_per_minute: ميزانية التعديلات لكل البوت، تُوزع على الرسائل الأقدم تحديثاً أولاً
+    """
+
+    def __init__(self, min_interval: float = 3.0, min_delta: float = 0.02,
+                 edits_per_minute: int = 120, tick: float = 0.5):
+        self.min_interval = min_interval
+        self.min_delta = min_delta
+        self.rate = max(1, edits_per_minute) / 60.0
+        self.burst = max(1.0, self.rate * 5)
+        self.tick = tick
+
+        self._jobs = {}
+        self._links = {}  # معرف عملية -> مفتاح المجموعة التي تُعرض فيها
+        self._tokens = self.burst
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._task = None
+        self.edits = 0
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def start(self, job_id, edit, filename: str, total: int, uploaded: int = 0) -> TransferProgress:
+        """بدء تتبع عملية (يجب استدعاؤها من حلقة الأحداث)"""
+        progress = TransferProgress(edit, filename, total, uploaded)
+        self._jobs[job_id] = progress
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return progress
+
+    def link(self, job_id, key):
+        """عرض تقدم عملية ضمن رسالة مجموعة مسجلة بالمفتاح key"""
+        self._links[job_id] = key
+
+    def unlink(self, job_id):
+        self._links.pop(job_id, None)
+
+    def _get(self, job_id):
+        return self._jobs.get(self._links.get(job_id, job_id))
+
+    def add_downloaded(self, job_id, nbytes: int):
+        """إضافة بايتات منزّلة إلى عداد العملية"""
+        progress = self._get(job_id)
+        if progress is not None:
+            progress.downloaded += nbytes
+
+    def set_uploaded(self, job_id, nbytes: int):
+        """تحديث عدد البايتات التي أكد Drive استلامها (آمنة من خيط Drive)"""
+        progress = self._get(job_id)
+        if progress is not None:
+            progress.set_part(job_id, nbytes)
+
+    async def finish(self, job_id):
+        """إيقاف تتبع العملية وانتظار أي تعديل جارٍ حتى لا يغطي رسالة النتيجة"""
+        progress = self._jobs.pop(job_id, None)
+        if progress is not None and progress.editing is not None and not progress.editing.done():
+            try:
+                await progress.editing
+            except Exception:
+                pass
+
+    def _take_token(self, now: float) -> bool:
+        """استهلاك تعديل من الميزانية العامة إن توفر"""
+        if now < self._paused_until:
+            return False
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _is_due(self, progress: TransferProgress, now: float) -> bool:
+        if progress.editing is not None and not progress.editing.done():
+            return False
+        if now - progress.last_edit < self.min_interval:
+            return False
+        return progress.transferred - progress.last_reported >= self.min_delta * progress.total
+
+    async def _edit(self, progress: TransferProgress, text: str):
+        try:
+            await progress.edit(text)
+            self.edits += 1
+        except RetryAfter as e:
+            # تجاوزنا حدود Telegram: إيقاف كل التعديلات مؤقتاً
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+            self._paused_until = time.monotonic() + float(retry_after)
+            logger.warning(f"إيقاف تحديثات التقدم {retry_after} ثانية بسبب حدود Telegram")
+        except BadRequest as e:
+            # مثلاً: الرسالة لم تتغير أو حُذفت
+            logger.debug(f"تعذر تحديث رسالة التقدم: {e}")
+        except Exception as e:
+            logger.warning(f"تعذر تحديث رسالة التقدم: {e}")
+
+    async def _run(self):
+        """حلقة التحديث: تعمل ما دامت هناك عمليات جارية"""
+        while self._jobs:
+            await asyncio.sleep(self.tick)
+            now = time.monotonic()
+            due = sorted(
+                (progress for progress in self._jobs.values() if self._is_due(progress, now)),
+                key=lambda progress: progress.last_edit
+            )
+            for progress in due:
+                if not self._take_token(now):
+                    break
+                progress.last_edit = now
+                progress.last_reported = progress.transferred
+                progress.editing = asyncio.ensure_future(self._edit(progress, progress.render(now)))
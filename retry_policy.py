@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+سياسة إعادة المحاولة المشتركة لعمليات Google Drive وتيليجرام
+تميّز الأخطاء المؤقتة (429 و5xx وانقطاع الاتصال وتجاوز حدود المعدل) عن الدائمة،
+وتحسب فترة الانتظار بتراجع أسي مع عشوائية (full jitter) مع احترام Retry-After
+"""
+
+import asyncio
+import http.client
+import json
+import logging
+import random
+import socket
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional, Tuple
+
+import aiohttp
+from googleapiclient.errors import HttpError
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+logger = logging.getLogger(__name__)
+
+TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+# أسباب 403 في Drive التي تعني تجاوز حد المعدل وليس رفض الطلب
+RATE_LIMIT_REASONS = {'userRateLimitExceeded', 'rateLimitExceeded'}
+CONNECTION_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    socket.timeout,
+    http.client.HTTPException,
+    aiohttp.ClientConnectionError,
+    aiohttp.ClientPayloadError,
+    asyncio.TimeoutError,
+)
+
+
+class TransientHTTPError(Exception):
+    """استجابة HTTP برمز حالة غير متوقع أثناء التنزيل (تُصنف حسب الرمز)"""
+
+    def __init__(self, status: int, retry_after: Optional[float] = None):
+        super().__init__(f"استجابة غير متوقعة: {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """تحويل ترويسة Retry-After (ثوان أو تاريخ HTTP) إلى عدد ثوان"""
+    if value is None or value == '':
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def drive_error_reason(error: HttpError) -> Optional[str]:
+    """سبب الخطأ في استجابة Drive (مثل userRateLimitExceeded)"""
+    try:
+        content = error.content.decode('utf-8') if isinstance(error.content, bytes) else error.content
+        errors = json.loads(content)['error'].get('errors') or []
+        return errors[0].get('reason') if errors else None
+    except (AttributeError, KeyError, TypeError, ValueError, IndexError):
+        return None
+
+
+class RetryPolicy:
+    """
+    سياسة إعادة المحاولة
+
+    - max_attempts: العدد الأقصى للمحاولات لكل عملية (أو لكل جزء رفع)
+    - base_delay: فترة الانتظار الأساسية قبل أول إعادة
+    - max_delay: الحد الأقصى لفترة الانتظار (Retry-After من الخادم قد يتجاوزه حتى max_retry_after)
+    - on_retry: دالة تُستدعى بـ (العملية، السبب) عند كل إعادة (للمقاييس)
+    """
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 max_retry_after: float = 300.0, on_retry=None, rand=random.random):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.on_retry = on_retry
+        self._rand = rand
+
+    def classify(self, error: BaseException) -> Tuple[bool, Optional[float], str]:
+        """
+        تصنيف الخطأ
+
+        Returns:
+            (هل هو مؤقت، مدة Retry-After إن وُجدت، وصف مختصر للسبب)
+        """
+        if isinstance(error, HttpError):
+            status = error.resp.status
+            retry_after = parse_retry_after(error.resp.get('retry-after'))
+            if status in TRANSIENT_STATUSES:
+                return True, retry_after, str(status)
+            if status == 403:
+                reason = drive_error_reason(error)
+                if reason in RATE_LIMIT_REASONS:
+                    return True, retry_after, reason
+            return False, None, str(status)
+
+        if isinstance(error, TransientHTTPError):
+            return error.status in TRANSIENT_STATUSES, error.retry_after, str(error.status)
+
+        if isinstance(error, RetryAfter):
+            retry_after = error.retry_after
+            if hasattr(retry_after, 'total_seconds'):
+                retry_after = retry_after.total_seconds()
+            return True, float(retry_after), '429'
+        if isinstance(error, (BadRequest, Forbidden)):
+            return False, None, type(error).__name__
+        if isinstance(error, (TimedOut, NetworkError)):
+            return True, None, 'network'
+
+        if isinstance(error, CONNECTION_ERRORS):
+            return True, None, 'network'
+        return False, None, type(error).__name__
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """فترة الانتظار قبل المحاولة التالية (attempt يبدأ من 0)"""
+        delay = self._rand() * min(self.max_delay, self.base_delay * (2 ** attempt))
+        if retry_after is not None:
+            # لا نعيد قبل الموعد الذي طلبه الخادم
+            delay = max(delay, min(retry_after, self.max_retry_after))
+        return delay
+
+    def retry_delay(self, operation: str, error: BaseException, attempt: int) -> Optional[float]:
+        """
+        فترة الانتظار قبل إعادة العملية بعد الخطأ
+
+        Args:
+            operation: اسم العملية (للسجلات والمقاييس)
+            error: الخطأ الذي حدث
+            attempt: عدد المحاولات الفاشلة السابقة لهذه العملية (يبدأ من 0)
+
+        Returns:
+            عدد الثواني قبل الإعادة، أو None إذا كان الخطأ دائماً أو نفدت المحاولات
+        """
+        transient, retry_after, reason = self.classify(error)
+        if not transient or attempt + 1 >= self.max_attempts:
+            return None
+        delay = self.backoff(attempt, retry_after)
+        logger.warning(
+            f"خطأ مؤقت في {operation} ({reason}): إعادة المحاولة {attempt + 1} بعد {delay:.1f} ثانية"
+        )
+        if self.on_retry is not None:
+            self.on_retry(operation, reason)
+        return delay
+
+    def call(self, operation: str, func, *args, **kwargs):
+        """تنفيذ دالة متزامنة مع إعادة المحاولة (داخل منفذ Drive)"""
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                delay = self.retry_delay(operation, e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+
+    async def acall(self, operation: str, func, *args, **kwargs):
+        """تنفيذ دالة async مع إعادة المحاولة"""
+        attempt = 0
+        while True:
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                delay = self.retry_delay(operation, e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
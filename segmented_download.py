@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+تنزيل الملفات الكبيرة من خادم Bot API بعدة اتصالات متوازية (طلبات Range)
+اتصال TCP واحد بطيء يحد سرعة التنزيل كلها، لذلك يُقسم الملف إلى أجزاء تُنزّل بالتوازي
+وتُمرر إلى الكاتب بترتيبها داخل نافذة محدودة، ويُعاد الجزء الفاشل وحده
+"""
+
+import asyncio
+import logging
+import re
+from collections import deque
+from typing import Optional
+
+import aiohttp
+
+from retry_policy import TransientHTTPError, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+
+class RangeNotSupported(Exception):
+    """الخادم تجاهل ترويسة Range وأرسل الملف كاملاً"""
+
+
+async def probe_range_support(session: aiohttp.ClientSession, url: str) -> Optional[int]:
+    """
+    التحقق من دعم الخادم لطلبات Range بطلب البايت الأول فقط
+
+    Returns:
+        حجم الملف من ترويسة Content-Range إذا كان الدعم متوفراً، أو None
+    """
+    async with session.get(url, headers={'Range': 'bytes=0-0'}) as response:
+        if response.status != 206:
+            return None
+        match = CONTENT_RANGE.fullmatch(response.headers.get('Content-Range', ''))
+        await response.read()
+        if not match or match.group(3) == '*':
+            return None
+        return int(match.group(3))
+
+
+class SegmentedDownloader:
+    """
+    منزّل مقسم إلى أجزاء
+
+    - connections: عدد الأجزاء التي تُنزّل في نفس الوقت (وهو أيضاً عدد الأجزاء المحتفظ بها في الذاكرة)
+    - segment_size: حجم كل جزء
+    - read_size: حجم كل قراءة من الاستجابة
+    - retry_policy: سياسة إعادة المحاولة لكل جزء (RetryPolicy)
+    - on_chunk: دالة async تُستدعى بعدد البايتات بعد كل قراءة (للتقدم وتحديد عرض النطاق)
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, url: str, size: int, connections: int = 4,
+                 segment_size: int = 4 * 1024 * 1024, read_size: int = 256 * 1024, retry_policy=None,
+                 on_chunk=None):
+        self.session = session
+        self.url = url
+        self.size = size
+        self.connections = max(1, connections)
+        self.segment_size = max(1, segment_size)
+        self.read_size = read_size
+        self.retry_policy = retry_policy
+        self.on_chunk = on_chunk
+        self.segment_retries = 0
+
+    def segments(self, offset: int = 0) -> list:
+        """حدود الأجزاء [البداية، النهاية) من offset حتى نهاية الملف"""
+        return [
+            (start, min(start + self.segment_size, self.size))
+            for start in range(offset, self.size, self.segment_size)
+        ]
+
+    async def download(self, write, offset: int = 0) -> int:
+        """
+        تنزيل الملف من offset وتمرير الأجزاء بالترتيب إلى الدالة async write
+
+        Returns:
+            عدد البايتات المكتوبة
+        """
+        segments = deque(self.segments(offset))
+        window = deque()
+        written = 0
+        try:
+            while segments or window:
+                # إبقاء connections جزءاً قيد التنزيل أمام الجزء التالي في الترتيب
+                while segments and len(window) < self.connections:
+                    start, end = segments.popleft()
+                    window.append(asyncio.ensure_future(self._fetch(start, end)))
+                data = await window.popleft()
+                await write(data)
+                written += len(data)
+        finally:
+            for task in window:
+                task.cancel()
+            if window:
+                await asyncio.gather(*window, return_exceptions=True)
+        return written
+
+    async def _fetch(self, start: int, end: int) -> bytearray:
+        """تنزيل جزء واحد مع استئنافه من آخر بايت مستلم عند الأخطاء المؤقتة"""
+        buffer = bytearray()
+        attempt = 0
+        while True:
+            before = len(buffer)
+            try:
+                headers = {'Range': f'bytes={start + len(buffer)}-{end - 1}'}
+                async with self.session.get(self.url, headers=headers) as response:
+                    if response.status == 200:
+                        raise RangeNotSupported("الخادم لا يدعم طلبات Range")
+                    if response.status != 206:
+                        raise TransientHTTPError(
+                            response.status, parse_retry_after(response.headers.get('Retry-After'))
+                        )
+                    while True:
+                        chunk = await response.content.read(self.read_size)
+                        if not chunk:
+                            break
+                        buffer.extend(chunk)
+                        if self.on_chunk is not None:
+                            await self.on_chunk(len(chunk))
+                if len(buffer) > end - start:
+                    # الخادم أرسل بعد نهاية الجزء المطلوب
+                    del buffer[end - start:]
+                if len(buffer) < end - start:
+                    raise aiohttp.ClientPayloadError(f"جزء ناقص: {len(buffer)} من {end - start} بايت")
+                return buffer
+            except Exception as e:
+                if self.retry_policy is None:
+                    raise
+                if len(buffer) > before:
+                    attempt = 0
+                delay = self.retry_policy.retry_delay('telegram_download_segment', e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                self.segment_retries += 1
+                await asyncio.sleep(delay)
@@ -10,6 +10,8 @@ import logging
 from typing import Optional
 import asyncio
 import aiohttp
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 from telegram import Update, Document, PhotoSize, Video, Audio, Voice, VideoNote, Animation, Sticker
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
@@ -30,21 +32,59 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class TelegramDriveBot:
-    def __init__(self, telegram_token: str, google_credentials_file: str):
+    def __init__(self, telegram_token: str, google_credentials_file: str, max_workers: int = 4,
+                 http_pool_size: int = 32):
         """
         تهيئة البوت
         
         Args:
             telegram_token: رمز بوت التيليجرام
             google_credentials_file: مسار ملف بيانات اعتماد Google
+            max_workers: عدد خيوط تنفيذ عمليات Google Drive المتوازية
+            http_pool_size: الحد الأقصى لاتصالات HTTP المفتوحة لتنزيل الملفات من تيليجرام
         """
         self.telegram_token = telegram_token
         self.google_credentials_file = google_credentials_file
         self.drive_service = None
         self.user_credentials = {}
         
+        # منفذ محدود لعمليات Google Drive المتزامنة (حتى لا تتجمد حلقة asyncio)
+        self.max_workers = max(1, max_workers)
+        self.drive_executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='drive-io')
+        
+        # جلسة HTTP مشتركة لتنزيل الملفات من تيليجرام (تُنشأ عند بدء التشغيل)
+        self.http_session = None
+        self.http_pool_size = max(1, http_pool_size)
+        self.HTTP_KEEPALIVE_TIMEOUT = 60  # ثانية
+        
         # إعداد نطاقات Google Drive
         self.SCOPES = ['https://www.googleapis.com/auth/drive.file']
+    
+    async def get_http_session(self) -> aiohttp.ClientSession:
+        """الحصول على جلسة HTTP المشتركة (يعاد استخدام الاتصالات بين الملفات)"""
+        if self.http_session is None or self.http_session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.http_pool_size,
+                limit_per_host=self.http_pool_size,
+                keepalive_timeout=self.HTTP_KEEPALIVE_TIMEOUT
+            )
+            self.http_session = aiohttp.ClientSession(connector=connector)
+        return self.http_session
+    
+    async def post_init(self, application: Application):
+        """تهيئة الموارد المشتركة عند بدء تشغيل التطبيق"""
+        await self.get_http_session()
+    
+    async def post_shutdown(self, application: Application):
+        """إغلاق الموارد المشتركة عند إيقاف التطبيق"""
+        if self.http_session is not None and not self.http_session.closed:
+            await self.http_session.close()
+        self.http_session = None
+    
+    async def run_drive_io(self, func, *args, **kwargs):
+        """تشغيل دالة Google Drive متزامنة في منفذ Drive دون حجب حلقة الأحداث"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.drive_executor, functools.partial(func, *args, **kwargs))
         
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """معالج أمر /start"""
@@ -185,15 +225,15 @@ class TelegramDriveBot:
             # الحصول على رابط تنزيل الملف
             file_url = f"https://api.telegram.org/file/bot{self.telegram_token}/{file_id}"
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(file_url) as response:
-                    if response.status == 200:
-                        file_data = await response.read()
-                        return io.BytesIO(file_data)
-                    else:
-                        logger.error(f"فشل في تنزيل الملف: {response.status}")
-                        return None
-                        
+            session = await self.get_http_session()
+            async with session.get(file_url) as response:
+                if response.status == 200:
+                    file_data = await response.read()
+                    return io.BytesIO(file_data)
+                else:
+                    logger.error(f"فشل في تنزيل الملف: {response.status}")
+                    return None
+                    
         except Exception as e:
             logger.error(f"خطأ في تنزيل الملف: {e}")
             return None
@@ -216,30 +256,10 @@ class TelegramDriveBot:
             
             credentials = self.user_credentials[user_id]['credentials']
             
-            # التحقق من صلاحية بيانات الاعتماد
-            if not credentials.valid:
-                if credentials.expired and credentials.refresh_token:
-                    credentials.refresh(Request())
-                else:
-                    return None
-            
-            # إنشاء خدمة Drive
-            service = build('drive', 'v3', credentials=credentials)
-            
-            # إعداد بيانات الملف
-            file_metadata = {
-                'name': filename,
-                'parents': []  # يمكن تحديد مجلد معين هنا
-            }
-            
-            # رفع الملف
-            media = MediaIoBaseUpload(file_data, mimetype='application/octet-stream', resumable=True)
-            
-            file = service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id,name,webViewLink'
-            ).execute()
+            # تنفيذ التحديث والرفع في منفذ Drive حتى يبقى البوت مستجيباً
+            file = await self.run_drive_io(self._upload_to_drive_sync, file_data, filename, credentials)
+            if file is None:
+                return None
             
             return file.get('webViewLink')
             
@@ -250,6 +270,33 @@ class TelegramDriveBot:
             logger.error(f"خطأ في رفع الملف: {e}")
             return None
     
+    def _upload_to_drive_sync(self, file_data: io.BytesIO, filename: str, credentials: Credentials) -> Optional[dict]:
+        """الجزء المتزامن من الرفع (يعمل داخل منفذ Drive)"""
+        # التحقق من صلاحية بيانات الاعتماد
+        if not credentials.valid:
+            if credentials.expired and credentials.refresh_token:
+                credentials.refresh(Request())
+            else:
+                return None
+        
+        # إنشاء خدمة Drive
+        service = build('drive', 'v3', credentials=credentials)
+        
+        # إعداد بيانات الملف
+        file_metadata = {
+            'name': filename,
+            'parents': []  # يمكن تحديد مجلد معين هنا
+        }
+        
+        # رفع الملف
+        media = MediaIoBaseUpload(file_data, mimetype='application/octet-stream', resumable=True)
+        
+        return service.files().create(
+            body=file_metadata,
+            media_body=media,
+            fields='id,name,webViewLink'
+        ).execute()
+    
     async def handle_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """معالجة الملفات المرسلة"""
         user_id = update.effective_user.id
@@ -351,8 +398,15 @@ class TelegramDriveBot:
     
     def run(self):
         """تشغيل البوت"""
-        # إنشاء التطبيق
-        application = Application.builder().token(self.telegram_token).build()
+        # إنشاء التطبيق مع معالجة التحديثات بشكل متوازٍ
+        application = (
+            Application.builder()
+            .token(self.telegram_token)
+            .concurrent_updates(True)
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+            .build()
+        )
         
         # إضافة معالجات الأوامر
         application.add_handler(CommandHandler("start", self.start_command))
@@ -369,13 +423,18 @@ class TelegramDriveBot:
         
         # تشغيل البوت
         logger.info("بدء تشغيل البوت...")
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        try:
+            application.run_polling(allowed_updates=Update.ALL_TYPES)
+        finally:
+            self.drive_executor.shutdown(wait=False, cancel_futures=True)
 
 def main():
     """الدالة الرئيسية"""
     # قراءة المتغيرات البيئية
     telegram_token = os.getenv('TELEGRAM_BOT_TOKEN')
     google_credentials_file = os.getenv('GOOGLE_CREDENTIALS_FILE', 'credentials.json')
+    max_workers = int(os.getenv('MAX_WORKERS', '4'))
+    http_pool_size = int(os.getenv('HTTP_POOL_SIZE', '32'))
     
     if not telegram_token:
         print("❌ خطأ: لم يتم تعيين TELEGRAM_BOT_TOKEN")
@@ -386,7 +445,7 @@ def main():
         return
     
     # إنشاء وتشغيل البوت
-    bot = TelegramDriveBot(telegram_token, google_credentials_file)
+    bot = TelegramDriveBot(telegram_token, google_credentials_file, max_workers, http_pool_size)
     bot.run()
 
 if __name__ == '__main__':
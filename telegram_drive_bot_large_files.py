@@ -6,26 +6,50 @@
 """
 
 import os
-import io
+import json
 import logging
+import secrets
+import signal
 from typing import Optional
 import asyncio
 import aiohttp
-import tempfile
-import shutil
-from pathlib import Path
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 
-from telegram import Update, Document, PhotoSize, Video, Audio, Voice, VideoNote, Animation, Sticker
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram import Bot, Update
+from telegram.ext import Application, CommandHandler, MessageHandler, TypeHandler, filters, ContextTypes
 from telegram.constants import ParseMode
 
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload
+import google_auth_httplib2
+from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload, MediaUpload, build_http
 from googleapiclient.errors import HttpError
 
+from bandwidth_limiter import BandwidthLimiter
+from bot_metrics import MetricsServer, TransferMetrics
+from bot_storage import CredentialStore, JobStore, UploadIndex, UserSettings, credentials_expiry
+from drive_folders import FolderResolver, folder_path, parse_folder_id, parse_layout
+from drive_rate_limiter import DriveRateLimiter
+from drive_services import DriveServiceCache
+from job_scheduler import UploadScheduler, QueueFull
+from memory_budget import MemoryBudget
+from media_groups import MediaGroupCollector
+from progress_reporter import ProgressReporter
+from segmented_download import SegmentedDownloader, probe_range_support
+from transfer_spool import SpoolBuffer, TransferSpool
+from retry_policy import RetryPolicy, TransientHTTPError, parse_retry_after
+from upload_worker import UploadWorker
+from webhook_server import UpdateLatencyTracker, WebhookServer, allowed_updates_for
+from transfer_pipeline import (
+    DRIVE_CHUNK_ALIGNMENT, AdaptiveChunkSizer, AdaptiveChunkUpload, AdaptiveReadSize, ChecksumMismatch,
+    IncrementalHasher, PipeAborted, StreamingPipe, StreamingMediaUpload
+)
+
 # إعداد التسجيل
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -34,7 +58,38 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class TelegramDriveBotLargeFiles:
-    def __init__(self, telegram_token: str, google_credentials_file: str, bot_api_server: str = None):
+    # أنواع الوسائط بترتيب فحصها: (الخاصية في الرسالة، الاسم الافتراضي، نوع المحتوى الافتراضي، الوصف)
+    # الصورة المتحركة تصل أيضاً كمستند فتُفحص قبله
+    MEDIA_KINDS = (
+        ('animation', 'animation_{}.mp4', 'video/mp4', 'الصورة المتحركة'),
+        ('document', 'document_{}', None, 'الملف'),
+        ('video', 'video_{}.mp4', 'video/mp4', 'الفيديو'),
+        ('photo', 'photo_{}.jpg', 'image/jpeg', 'الصورة'),
+        ('audio', 'audio_{}.mp3', 'audio/mpeg', 'الملف الصوتي'),
+        ('voice', 'voice_{}.ogg', 'audio/ogg', 'الرسالة الصوتية'),
+        ('video_note', 'video_note_{}.mp4', 'video/mp4', 'رسالة الفيديو'),
+        ('sticker', 'sticker_{}.webp', 'image/webp', 'الملصق'),
+    )
+    
+    def __init__(self, telegram_token: str, google_credentials_file: str, bot_api_server: str = None,
+                 max_workers: int = 4, local_mode: bool = False, http_pool_size: int = 32,
+                 max_concurrent_uploads: int = None, max_uploads_per_user: int = 2,
+                 max_queued_per_user: int = 20, db_path: str = 'bot_state.db', dedup_mode: str = 'link',
+                 chunk_size: int = 8 * 1024 * 1024, max_chunk_size: int = 32 * 1024 * 1024,
+                 adaptive_chunks: bool = True, progress_interval: float = 3.0,
+                 progress_edits_per_minute: int = 120, media_group_window: float = 1.0,
+                 webhook_url: str = None, webhook_listen: str = '0.0.0.0', webhook_port: int = 8443,
+                 webhook_path: str = '/telegram', webhook_secret: str = None, role: str = 'all',
+                 worker_id: str = None, worker_concurrency: int = None, job_lease_seconds: float = 60.0,
+                 metrics_port: int = None, metrics_listen: str = '127.0.0.1', retry_attempts: int = 5,
+                 retry_base_delay: float = 1.0, retry_max_delay: float = 60.0, drive_user_rate: float = 10.0,
+                 drive_user_burst: int = 20, drive_client_rate: float = 100.0, drive_client_burst: int = 200,
+                 bandwidth_limit: float = 0, user_bandwidth_limit: float = 0, verify_checksums: bool = True,
+                 checksum_sha256: bool = False, download_connections: int = 4,
+                 download_segment_size: int = 4 * 1024 * 1024, drive_folder_id: str = None,
+                 folder_layout: str = '', folder_cache_ttl: float = 3600, spool_dir: str = None,
+                 spool_disk_budget: int = 4 * 1024 ** 3, spool_memory_budget: int = 256 * 1024 ** 2,
+                 spool_memory_file_limit: int = 20 * 1024 ** 2, memory_budget: int = 512 * 1024 ** 2):
         """
         تهيئة البوت
         
@@ -42,26 +97,473 @@ class TelegramDriveBotLargeFiles:
             telegram_token: رمز بوت التيليجرام
             google_credentials_file: مسار ملف بيانات اعتماد Google
             bot_api_server: عنوان خادم Bot API المحلي (اختياري)
+            max_workers: عدد خيوط تنفيذ عمليات Google Drive المتوازية
+            local_mode: خادم Bot API يعمل بوضع --local ويشارك مجلد الملفات مع البوت
+            http_pool_size: الحد الأقصى لاتصالات HTTP المفتوحة لتنزيل الملفات من تيليجرام
+            max_concurrent_uploads: عدد عمليات الرفع المتزامنة (افتراضياً max_workers)
+            max_uploads_per_user: عدد عمليات الرفع المتزامنة لكل مستخدم
+            max_queued_per_user: عدد الملفات المنتظرة لكل مستخدم قبل رفض الجديدة
+            db_path: مسار قاعدة بيانات حالة البوت (بيانات الاعتماد وغيرها)
+            dedup_mode: التعامل مع الملفات المرفوعة مسبقاً: link (إرجاع الرابط) أو copy (نسخ على Drive) أو off
+            chunk_size: الحجم الابتدائي لجزء الرفع المتقطع (يُقرّب لمضاعف 256 كيلوبايت)
+            max_chunk_size: أكبر حجم يصل إليه جزء الرفع عند الضبط التلقائي
+            adaptive_chunks: ضبط حجم جزء الرفع وحجم قراءة التنزيل حسب السرعة المقاسة
+            progress_interval: أقل فاصل بالثواني بين تحديثين لرسالة التقدم
+            progress_edits_per_minute: الحد الأقصى لتعديلات رسائل التقدم في الدقيقة لكل البوت
+            media_group_window: مدة انتظار بقية عناصر الألبوم بالثواني قبل رفعه كعملية واحدة
+            webhook_url: العنوان العام للبوت؛ إذا حُدد يعمل البوت بوضع webhook بدلاً من polling
+            webhook_listen: عنوان استماع خادم webhook
+            webhook_port: منفذ استماع خادم webhook
+            webhook_path: مسار استقبال التحديثات
+            webhook_secret: الرمز السري للتحقق من طلبات Telegram (يُولّد عشوائياً إذا لم يُحدد)
+            role: all (استقبال الملفات ونقلها)، frontend (إضافتها إلى قائمة الانتظار فقط)، worker (نقلها فقط)
+            worker_id: معرف العامل في قائمة الانتظار (افتراضياً اسم الجهاز ورقم العملية)
+            worker_concurrency: عدد عمليات النقل المتزامنة في العامل (افتراضياً max_workers)
+            job_lease_seconds: مدة حجز العامل للعملية قبل أن تنتقل لعامل آخر إذا توقف عن تجديدها
+            metrics_port: منفذ خادم المقاييس بصيغة Prometheus (معطل إذا لم يُحدد)
+            metrics_listen: عنوان استماع خادم المقاييس
+            retry_attempts: العدد الأقصى لمحاولات كل طلب (أو جزء رفع) عند الأخطاء المؤقتة
+            retry_base_delay: فترة الانتظار الأساسية قبل إعادة المحاولة (تتضاعف مع كل محاولة)
+            retry_max_delay: الحد الأقصى لفترة الانتظار بين المحاولات
+            drive_user_rate: الحد الأقصى لطلبات Drive في الثانية لكل حساب Google (0 بلا حد)
+            drive_user_burst: أقصى دفعة طلبات متتالية لكل حساب قبل تطبيق المعدل
+            drive_client_rate: الحد الأقصى لطلبات Drive في الثانية لعميل OAuth كله (0 بلا حد)
+            drive_client_burst: أقصى دفعة طلبات متتالية لعميل OAuth
+            bandwidth_limit: الحد الأقصى لسرعة التنزيل وسرعة الرفع للبوت كله بالبايت/ث (0 بلا حد)
+            user_bandwidth_limit: الحد الأقصى لسرعة التنزيل وسرعة الرفع لكل مستخدم بالبايت/ث (0 بلا حد)
+            verify_checksums: مقارنة MD5 للبايتات المرسلة بـ md5Checksum الذي يحسبه Drive
+            checksum_sha256: حساب SHA-256 أيضاً ومقارنته بـ sha256Checksum
+            download_connections: عدد اتصالات تنزيل الملف الكبير المتوازية (1 يعطل التنزيل المقسم)
+            download_segment_size: حجم كل جزء في التنزيل المقسم
+            drive_folder_id: معرف (أو رابط) مجلد Drive الافتراضي للملفات المرفوعة (افتراضياً المجلد الرئيسي)
+            folder_layout: التنظيم الافتراضي للمجلدات الفرعية، مثل type/date (type و date و chat)
+            folder_cache_ttl: مدة صلاحية معرفات المجلدات في الفهرس المحلي بالثواني
+            spool_dir: مجلد الملفات المؤقتة بين التنزيل والرفع (افتراضياً داخل مجلد النظام المؤقت)
+            spool_disk_budget: الحد الأقصى لمجموع الملفات المؤقتة على القرص بالبايت
+            spool_memory_budget: الحد الأقصى لمجموع الملفات المحفوظة في الذاكرة بالبايت
+            spool_memory_file_limit: أكبر ملف يُحفظ في الذاكرة بدلاً من القرص
+            memory_budget: الحد الأقصى لذاكرة مخازن النقل لكل البوت بالبايت (0 بلا حد)
         """
         self.telegram_token = telegram_token
         self.google_credentials_file = google_credentials_file
         self.bot_api_server = bot_api_server or "https://api.telegram.org"
+        self.local_mode = local_mode and self.bot_api_server != "https://api.telegram.org"
         self.drive_service = None
         self.user_credentials = {}
         
+        # منفذ محدود لعمليات Google Drive المتزامنة (حتى لا تتجمد حلقة asyncio)
+        self.max_workers = max(1, max_workers)
+        self.drive_executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='drive-io')
+        # منفذ صغير منفصل لقاعدة البيانات المحلية: لا تنتظر قراءاتها وتجديد عقود العمليات
+        # انتهاء عمليات رفع تشغل كل خيوط Drive
+        self.db_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='db-io')
+        
+        # خدمات Drive المحفوظة لكل مستخدم (تجنب build واتصال جديد مع كل ملف)
+        self.drive_services = DriveServiceCache(max_idle_per_user=self.max_workers)
+        
+        # جلسة HTTP مشتركة لتنزيل الملفات من تيليجرام (تُنشأ عند بدء التشغيل)
+        self.http_session = None
+        self.http_pool_size = max(1, http_pool_size)
+        self.HTTP_KEEPALIVE_TIMEOUT = 60  # ثانية
+        
+        # عرض تقدم النقل في رسائل التحميل دون تجاوز حدود Telegram
+        self.progress = ProgressReporter(
+            min_interval=progress_interval,
+            edits_per_minute=progress_edits_per_minute
+        )
+        
+        # استقبال التحديثات: webhook إذا حُدد العنوان العام، وإلا polling
+        self.webhook_url = webhook_url.rstrip('/') if webhook_url else None
+        self.webhook_listen = webhook_listen
+        self.webhook_port = webhook_port
+        self.webhook_path = webhook_path if webhook_path.startswith('/') else f"/{webhook_path}"
+        self.webhook_secret = webhook_secret or secrets.token_urlsafe(32)
+        self.update_latency = UpdateLatencyTracker('webhook' if self.webhook_url else 'polling')
+        
+        # تجميع عناصر الألبومات لرفعها كعملية واحدة
+        self.media_groups = MediaGroupCollector(media_group_window)
+        
+        # تحديد معدل طلبات Drive لكل حساب Google ولعميل OAuth (تأخير الطلب بدلاً من رفضه بخطأ 403)
+        self.rate_limiter = DriveRateLimiter(
+            user_rate=drive_user_rate,
+            user_burst=drive_user_burst,
+            client_rate=drive_client_rate,
+            client_burst=drive_client_burst,
+            on_wait=lambda scope, seconds: self.metrics.rate_limit_wait.inc(seconds, scope=scope)
+        )
+        
+        # قائمة انتظار الرفع مع حدود للتوازي وتناوب عادل بين المستخدمين
+        self.upload_scheduler = UploadScheduler(
+            max_concurrent=max_concurrent_uploads or self.max_workers,
+            per_user_concurrent=max_uploads_per_user,
+            max_queued_per_user=max_queued_per_user,
+            rate_limiter=self.rate_limiter
+        )
+        
         # إعداد نطاقات Google Drive
         self.SCOPES = ['https://www.googleapis.com/auth/drive.file']
         
+        # مخزن دائم لبيانات الاعتماد (يُحمّل كل مستخدم عند أول حاجة إليه)
+        self.credential_store = CredentialStore(db_path, self.SCOPES)
+        # قفل لكل مستخدم حول تحديث رمزه فقط: تحديث بطيء لمستخدم لا يوقف رفع غيره
+        self._refresh_locks = {}
+        self._refresh_locks_guard = threading.Lock()
+        self._refresh_task = None
+        self.TOKEN_REFRESH_MARGIN = 10 * 60  # تحديث الرموز قبل انتهائها بعشر دقائق
+        self.TOKEN_REFRESH_INTERVAL = 5 * 60  # فحص الرموز كل خمس دقائق
+        
+        # فهرس الملفات المرفوعة لتجنب إعادة نقل نفس الملف
+        self.upload_index = UploadIndex(db_path)
+        self.dedup_mode = dedup_mode if dedup_mode in ('link', 'copy', 'off') else 'link'
+        
+        # سجل عمليات الرفع الجارية لمتابعتها بعد إعادة التشغيل
+        self.job_store = JobStore(db_path)
+        self._resume_task = None
+        # آخر عدد معروف لقائمة الانتظار المشتركة (يُقرأ في المقاييس دون استعلام SQLite)
+        self.shared_queued = 0
+        self._queue_depth_task = None
+        self.QUEUE_DEPTH_INTERVAL = 15  # تحديث العدد في الواجهة كل 15 ثانية
+        
+        # توزيع النقل على عمليات عمال منفصلة تشارك سجل العمليات
+        self.role = role if role in ('all', 'frontend', 'worker') else 'all'
+        self.worker = UploadWorker(
+            self,
+            worker_id=worker_id,
+            concurrency=worker_concurrency or self.max_workers,
+            lease_seconds=job_lease_seconds
+        )
+        
+        # مقاييس الأداء (تُعرض على خادم HTTP محلي إذا حُدد المنفذ)
+        self.metrics = TransferMetrics()
+        self.metrics.registry.gauge(
+            'upload_queue_depth', 'عدد الملفات التي تنتظر دورها في الرفع', function=self._queue_depth
+        )
+        self.metrics.registry.gauge(
+            'upload_active_jobs', 'عدد عمليات النقل الجارية', function=lambda: self.upload_scheduler.active + self.worker.active
+        )
+        self.metrics.registry.gauge(
+            'drive_rate_limit_client_tokens', 'رصيد طلبات Drive المتاح لعميل OAuth (-1 بلا حد)',
+            function=self.rate_limiter.client_tokens
+        )
+        self.metrics.registry.gauge(
+            'drive_rate_limited_accounts', 'عدد حسابات Google التي نفد رصيد طلباتها حالياً',
+            function=lambda: len(self.rate_limiter.throttled_users())
+        )
+        self.metrics_server = MetricsServer(self.metrics, metrics_listen, metrics_port) if metrics_port else None
+        
+        # حد الذاكرة المشترك: كل عملية تحجز ذاكرة مخازنها قبل إنشائها
+        self.memory = MemoryBudget(memory_budget, on_wait=self.metrics.memory_wait.inc)
+        self.metrics.registry.gauge(
+            'memory_budget_used_bytes', 'الذاكرة المحجوزة لمخازن النقل ضمن حد الذاكرة',
+            function=lambda: self.memory.used
+        )
+        
+        # المخزن المؤقت للملفات بين التنزيل والرفع: الصغيرة في الذاكرة والأكبر على القرص، بحد لكل منهما
+        self.spool = TransferSpool(
+            spool_dir, spool_disk_budget, spool_memory_budget, spool_memory_file_limit,
+            on_disk_write=self.metrics.temp_disk_bytes.inc, memory=self.memory
+        )
+        self.metrics.registry.gauge(
+            'spool_memory_reserved_bytes', 'البايتات المحجوزة في الذاكرة للملفات بين التنزيل والرفع',
+            function=lambda: self.spool.memory_reserved
+        )
+        self.metrics.registry.gauge(
+            'spool_disk_reserved_bytes', 'البايتات المحجوزة على القرص للملفات بين التنزيل والرفع',
+            function=lambda: self.spool.disk_reserved
+        )
+        
+        # إعادة المحاولة عند الأخطاء المؤقتة في Drive وتيليجرام بتراجع أسي وعشوائية
+        self.retry_policy = RetryPolicy(
+            max_attempts=retry_attempts,
+            base_delay=retry_base_delay,
+            max_delay=retry_max_delay,
+            on_retry=lambda operation, reason: self.metrics.retries.inc(operation=operation, reason=reason)
+        )
+        
+        # تحديد عرض النطاق لكل اتجاه مع تناوب عادل بين عمليات النقل المتزامنة
+        self.download_bandwidth = BandwidthLimiter(
+            bandwidth_limit, user_bandwidth_limit,
+            on_wait=lambda seconds: self.metrics.bandwidth_wait.inc(seconds, direction='download')
+        )
+        self.upload_bandwidth = BandwidthLimiter(
+            bandwidth_limit, user_bandwidth_limit,
+            on_wait=lambda seconds: self.metrics.bandwidth_wait.inc(seconds, direction='upload')
+        )
+        
+        # تنزيل الملفات الكبيرة بعدة طلبات Range متوازية (إذا دعمها خادم Bot API)
+        self.download_connections = max(1, download_connections)
+        self.download_segment_size = max(256 * 1024, download_segment_size)
+        self.SEGMENTED_DOWNLOAD_THRESHOLD = 2 * self.download_segment_size
+        self._range_support = None  # يُحدد عند أول ملف كبير
+        
+        # مجلد الوجهة على Drive وتنظيم المجلدات الفرعية (المعرفات محفوظة في فهرس محلي)
+        self.user_settings = UserSettings(db_path)
+        self.default_folder_id = parse_folder_id(drive_folder_id) if drive_folder_id else None
+        try:
+            self.default_folder_layout = parse_layout(folder_layout)
+        except ValueError as e:
+            logger.warning(f"تجاهل DRIVE_FOLDER_LAYOUT: {e}")
+            self.default_folder_layout = ()
+        self.folders = FolderResolver(ttl=folder_cache_ttl)
+        
+        # التحقق من سلامة الملفات المرفوعة بالمجموع الاختباري المحسوب أثناء الرفع
+        self.verify_checksums = verify_checksums
+        self.checksum_sha256 = checksum_sha256
+        
         # حدود الملفات
         self.MAX_FILE_SIZE_STANDARD = 20 * 1024 * 1024  # 20 ميجابايت (Bot API العادي)
         self.MAX_FILE_SIZE_LOCAL = 2 * 1024 * 1024 * 1024  # 2 جيجابايت (Local Bot API)
         
+        # إعدادات النقل المباشر (تنزيل ورفع متداخلان دون ملف مؤقت)
+        self.STREAM_THRESHOLD = 50 * 1024 * 1024  # 50 ميجابايت
+        self.STREAM_CHUNK_SIZE = max(DRIVE_CHUNK_ALIGNMENT, chunk_size // DRIVE_CHUNK_ALIGNMENT * DRIVE_CHUNK_ALIGNMENT)
+        self.STREAM_BUFFER_SIZE = 2 * self.STREAM_CHUNK_SIZE  # الحد الأقصى للبيانات المعلقة بين التنزيل والرفع
+        self.STREAM_READ_SIZE = 64 * 1024  # حجم قراءة استجابة aiohttp الابتدائي
+        
+        # الضبط التلقائي لحجم الأجزاء
+        self.adaptive_chunks = adaptive_chunks
+        self.MIN_CHUNK_SIZE = 4 * DRIVE_CHUNK_ALIGNMENT  # 1 ميجابايت
+        self.MAX_CHUNK_SIZE = max(self.STREAM_CHUNK_SIZE, max_chunk_size)
+        self.MAX_READ_SIZE = 1024 * 1024
+        self.metrics.upload_chunk_size.set(self.STREAM_CHUNK_SIZE)
+        
     def get_max_file_size(self):
         """الحصول على الحد الأقصى لحجم الملف حسب نوع الخادم"""
         if self.bot_api_server != "https://api.telegram.org":
             return self.MAX_FILE_SIZE_LOCAL
         return self.MAX_FILE_SIZE_STANDARD
     
+    def new_chunk_sizer(self, max_chunk_size: int = None) -> AdaptiveChunkSizer:
+        """
+        ضابط حجم جزء الرفع لعملية رفع واحدة (ثابت إذا كان الضبط التلقائي معطلاً)
+        
+        Args:
+            max_chunk_size: أكبر جزء تسمح به الذاكرة المحجوزة للعملية (افتراضياً MAX_CHUNK_SIZE)
+        """
+        maximum = min(self.MAX_CHUNK_SIZE, max_chunk_size or self.MAX_CHUNK_SIZE)
+        if not self.adaptive_chunks:
+            size = min(self.STREAM_CHUNK_SIZE, maximum)
+            return AdaptiveChunkSizer(size, size, size)
+        return AdaptiveChunkSizer(self.STREAM_CHUNK_SIZE, min(self.MIN_CHUNK_SIZE, maximum), maximum)
+    
+    def new_read_sizer(self) -> AdaptiveReadSize:
+        """ضابط حجم القراءة لعملية تنزيل واحدة"""
+        if not self.adaptive_chunks:
+            return AdaptiveReadSize(self.STREAM_READ_SIZE, self.STREAM_READ_SIZE, self.STREAM_READ_SIZE)
+        return AdaptiveReadSize(self.STREAM_READ_SIZE, maximum=self.MAX_READ_SIZE)
+    
+    def _record_upload_stats(self, sizer: AdaptiveChunkSizer):
+        """إضافة قياسات أجزاء عملية رفع إلى مقاييس الأداء"""
+        self.metrics.upload_chunks.inc(sizer.chunks)
+        self.metrics.upload_chunk_errors.inc(sizer.errors)
+        self.metrics.upload_chunk_size.set(sizer.size)
+    
+    def _queue_depth(self) -> int:
+        """الملفات المنتظرة في هذه العملية وفي قائمة انتظار العمال المشتركة"""
+        return self.upload_scheduler.queued + self.shared_queued
+    
+    async def refresh_shared_queue(self):
+        """تحديث عدد قائمة الانتظار المشتركة من سجل العمليات (الفشل يبقي العدد السابق)"""
+        if self.role == 'all' or not self.job_store.exists():
+            return
+        try:
+            self.shared_queued = await self.run_db_io(self.job_store.count_queued)
+        except Exception as e:
+            logger.warning(f"تعذر قراءة عدد قائمة الانتظار: {e}")
+    
+    async def queue_depth_loop(self):
+        """تحديث عدد قائمة الانتظار دورياً في الواجهة (العمال يحدثونه عند كل حجز)"""
+        while True:
+            await self.refresh_shared_queue()
+            await asyncio.sleep(self.QUEUE_DEPTH_INTERVAL)
+    
+    def get_file_url(self, file_path: str) -> str:
+        """بناء رابط تنزيل الملف (مكتبة telegram قد تعيد الرابط كاملاً)"""
+        if file_path.startswith(('http://', 'https://')):
+            return file_path
+        return f"{self.bot_api_server}/file/bot{self.telegram_token}/{file_path}"
+    
+    async def get_http_session(self) -> aiohttp.ClientSession:
+        """الحصول على جلسة HTTP المشتركة (يعاد استخدام الاتصالات بين الملفات)"""
+        if self.http_session is None or self.http_session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.http_pool_size,
+                limit_per_host=self.http_pool_size,
+                keepalive_timeout=self.HTTP_KEEPALIVE_TIMEOUT
+            )
+            self.http_session = aiohttp.ClientSession(connector=connector)
+        return self.http_session
+    
+    async def post_init(self, application: Application):
+        """تهيئة الموارد المشتركة عند بدء تشغيل التطبيق"""
+        await self.get_http_session()
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        self._refresh_task = asyncio.ensure_future(self.refresh_tokens_loop())
+        if self.role == 'all':
+            # في وضع الواجهة يستكمل العمال العمليات غير المكتملة
+            self._resume_task = asyncio.ensure_future(self.resume_pending_jobs(application.bot))
+        elif self.role == 'frontend':
+            self._queue_depth_task = asyncio.ensure_future(self.queue_depth_loop())
+    
+    async def post_shutdown(self, application: Application):
+        """إغلاق الموارد المشتركة عند إيقاف التطبيق"""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        if self._resume_task is not None:
+            self._resume_task.cancel()
+            self._resume_task = None
+        if self._queue_depth_task is not None:
+            self._queue_depth_task.cancel()
+            self._queue_depth_task = None
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        if self.http_session is not None and not self.http_session.closed:
+            await self.http_session.close()
+        self.http_session = None
+        self.credential_store.close()
+        self.upload_index.close()
+        self.job_store.close()
+        self.user_settings.close()
+    
+    def get_local_file_path(self, file_path: str) -> Optional[str]:
+        """
+        الحصول على مسار الملف المحلي إذا كان خادم Bot API يشارك مجلده مع البوت
+        
+        Returns:
+            المسار المطلق للملف إذا كان قابلاً للقراءة محلياً، وإلا None
+        """
+        if not self.local_mode or not file_path or not os.path.isabs(file_path):
+            return None
+        if os.path.isfile(file_path) and os.access(file_path, os.R_OK):
+            return file_path
+        return None
+    
+    def reserve_spool(self, file_size: int) -> Optional[SpoolBuffer]:
+        """
+        حجز مخزن مؤقت للملف قبل تنزيله
+        
+        Returns:
+            المخزن المحجوز، أو None إذا كان الملف كبيراً أو لم يتسع له المخزن فيُنقل مباشرة
+        """
+        if not file_size or file_size > self.STREAM_THRESHOLD:
+            return None
+        spool = self.spool.reserve(file_size)
+        if spool is None:
+            logger.info(f"المخزن المؤقت ممتلئ، نقل ملف بحجم {file_size} مباشرة دون تخزين")
+        return spool
+    
+    def get_user_credentials(self, user_id: int) -> Optional[Credentials]:
+        """الحصول على بيانات اعتماد المستخدم من الذاكرة أو من المخزن الدائم"""
+        entry = self.user_credentials.get(user_id, {})
+        if 'credentials' not in entry:
+            credentials = self.credential_store.load(user_id)
+            if credentials is None:
+                return None
+            entry['credentials'] = credentials
+            self.user_credentials[user_id] = entry
+        return entry['credentials']
+    
+    def ensure_fresh_credentials(self, user_id: int, credentials: Credentials, margin: float = 0) -> bool:
+        """
+        تحديث رمز الوصول إذا انتهى أو اقترب انتهاؤه وحفظه (يعمل داخل منفذ Drive)
+        
+        Args:
+            user_id: معرف المستخدم
+            credentials: بيانات اعتماد المستخدم
+            margin: عدد الثواني قبل انتهاء الصلاحية التي يتم التحديث خلالها
+            
+        Returns:
+            True إذا كانت بيانات الاعتماد صالحة للاستخدام
+        """
+        def fresh() -> bool:
+            expiry = credentials_expiry(credentials)
+            return credentials.valid and (expiry is None or expiry - time.time() >= margin)
+        
+        # المسار المعتاد: الرمز صالح فلا قفل ولا اتصال
+        if fresh():
+            return True
+        if not credentials.refresh_token:
+            return credentials.valid
+        
+        with self._refresh_locks_guard:
+            lock = self._refresh_locks.setdefault(user_id, threading.Lock())
+        with lock:
+            # ربما حدّثه خيط آخر أثناء الانتظار
+            if fresh():
+                return True
+            try:
+                credentials.refresh(Request())
+            except Exception:
+                self.metrics.token_refreshes.inc(result='error')
+                raise
+            self.metrics.token_refreshes.inc(result='ok')
+            self.credential_store.save(user_id, credentials)
+            logger.info(f"تم تحديث رمز الوصول للمستخدم {user_id}")
+            return True
+    
+    async def refresh_tokens_loop(self):
+        """تحديث الرموز التي تقترب من الانتهاء في الخلفية حتى لا ينتظرها الرفع"""
+        while True:
+            try:
+                deadline = time.time() + self.TOKEN_REFRESH_MARGIN + self.TOKEN_REFRESH_INTERVAL
+                user_ids = []
+                if self.credential_store.exists():
+                    user_ids = await self.run_db_io(self.credential_store.expiring_before, deadline)
+                for user_id in user_ids:
+                    credentials = self.get_user_credentials(user_id)
+                    if credentials is None:
+                        continue
+                    try:
+                        await self.run_drive_io(
+                            self.ensure_fresh_credentials,
+                            user_id,
+                            credentials,
+                            self.TOKEN_REFRESH_MARGIN + self.TOKEN_REFRESH_INTERVAL
+                        )
+                    except Exception as e:
+                        logger.warning(f"فشل تحديث رمز الوصول للمستخدم {user_id}: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"خطأ في تحديث رموز الوصول: {e}")
+            
+            await asyncio.sleep(self.TOKEN_REFRESH_INTERVAL)
+    
+    def queue_notifier(self, loading_message):
+        """إنشاء دالة تعرض ترتيب الملف في قائمة الانتظار ضمن رسالة التحميل"""
+        async def notify(position: int):
+            await loading_message.edit_text(f"⏳ الملف في قائمة الانتظار (الترتيب: {position})...")
+        return notify
+    
+    async def run_drive_io(self, func, *args, **kwargs):
+        """تشغيل دالة Google Drive متزامنة في منفذ Drive دون حجب حلقة الأحداث"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.drive_executor, functools.partial(func, *args, **kwargs))
+    
+    async def run_db_io(self, func, *args, **kwargs):
+        """تشغيل دالة قاعدة البيانات المحلية (SQLite) في منفذها الخاص دون حجب حلقة الأحداث"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.db_executor, functools.partial(func, *args, **kwargs))
+    
+    def drive_request(self, user_id: int, func, *args, tokens: int = 1, **kwargs):
+        """
+        تنفيذ طلب Drive بعد انتظار رصيده في محدد المعدل (يعمل داخل منفذ Drive)
+        
+        إذا رفض Drive الطلب لتجاوز الحد يُوقف دلو المستخدم أو العميل حتى تتأخر الطلبات التالية
+        """
+        self.rate_limiter.acquire(user_id, tokens)
+        try:
+            return func(*args, **kwargs)
+        except HttpError as e:
+            self.rate_limiter.observe_error(user_id, e)
+            raise
+    
+    async def get_telegram_file(self, bot, file_id: str):
+        """طلب معلومات الملف من Bot API مع إعادة المحاولة عند الأخطاء المؤقتة"""
+        return await self.retry_policy.acall('telegram_get_file', bot.get_file, file_id)
+    
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """معالج أمر /start"""
         max_size = self.get_max_file_size() / (1024 * 1024)
@@ -75,6 +577,8 @@ class TelegramDriveBotLargeFiles:
 /auth - ربط حسابك مع Google Drive
 /status - عرض حالة الاتصال
 /info - معلومات الخادم والحدود
+/folder - مجلد الوجهة على Google Drive
+/organize - تنظيم الملفات في مجلدات فرعية
 /help - عرض المساعدة
 
 📁 لرفع ملف، قم بإرسال أي ملف وسيتم رفعه تلقائياً إلى Google Drive الخاص بك.
@@ -97,6 +601,7 @@ class TelegramDriveBotLargeFiles:
 🖥️ نوع الخادم: {server_type}
 🌐 عنوان الخادم: {self.bot_api_server}
 📊 الحد الأقصى للملف: {max_size:.0f} ميجابايت
+⏱️ زمن وصول التحديثات: {self.format_update_latency()}
 
 📝 ملاحظات:
 • الخادم العادي يدعم ملفات حتى 20 ميجابايت
@@ -106,6 +611,22 @@ class TelegramDriveBotLargeFiles:
         """
         await update.message.reply_text(info_message)
     
+    def format_update_latency(self) -> str:
+        """ملخص زمن وصول التحديثات لوضع الاستقبال الحالي"""
+        summary = self.update_latency.summary()
+        if not summary['count']:
+            return f"{summary['mode']} (لا توجد قياسات بعد)"
+        return (
+            f"{summary['mode']} - متوسط {summary['mean']:.2f} ث، "
+            f"p95 {summary['p95']:.2f} ث ({summary['count']} تحديث)"
+        )
+    
+    async def track_update_latency(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """تسجيل زمن وصول كل تحديث قبل معالجته"""
+        latency = self.update_latency.record(update)
+        if latency is not None:
+            self.metrics.update_latency.observe(latency)
+    
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """معالج أمر /help"""
         max_size = self.get_max_file_size() / (1024 * 1024)
@@ -120,8 +641,9 @@ class TelegramDriveBotLargeFiles:
 
 📁 أنواع الملفات المدعومة:
 • الصور (JPG, PNG, GIF, إلخ)
-• الفيديوهات (حتى {max_size:.0f} ميجابايت)
-• الملفات الصوتية
+• الفيديوهات (حتى {max_size:.0f} ميجابايت) ورسائل الفيديو
+• الملفات الصوتية والرسائل الصوتية
+• الصور المتحركة والملصقات
 • المستندات
 • أي نوع ملف آخر
 
@@ -151,8 +673,8 @@ class TelegramDriveBotLargeFiles:
             
             auth_url, _ = flow.authorization_url(prompt='consent')
             
-            # حفظ flow للمستخدم
-            self.user_credentials[user_id] = {'flow': flow}
+            # حفظ flow للمستخدم (مع الإبقاء على بيانات الاعتماد الحالية حتى اكتمال الربط)
+            self.user_credentials.setdefault(user_id, {})['flow'] = flow
             
             auth_message = f"""
 🔗 لربط حسابك مع Google Drive:
@@ -177,9 +699,10 @@ class TelegramDriveBotLargeFiles:
         """معالج أمر /status لعرض حالة الاتصال"""
         user_id = update.effective_user.id
         
-        if user_id in self.user_credentials and 'credentials' in self.user_credentials[user_id]:
-            creds = self.user_credentials[user_id]['credentials']
-            if creds and creds.valid:
+        creds = self.get_user_credentials(user_id)
+        if creds:
+            # الرموز المنتهية تُحدّث تلقائياً ما دام رمز التحديث موجوداً
+            if creds.valid or creds.refresh_token:
                 status_message = "✅ حسابك مربوط بنجاح مع Google Drive\n📁 يمكنك الآن رفع الملفات"
             else:
                 status_message = "⚠️ انتهت صلاحية الاتصال. استخدم /auth للربط مجدداً"
@@ -188,6 +711,105 @@ class TelegramDriveBotLargeFiles:
         
         await update.message.reply_text(status_message)
     
+    def describe_destination(self, settings: dict) -> str:
+        """وصف مجلد الوجهة وتنظيمه لعرضه للمستخدم"""
+        folder_id = settings.get('folder_id') or self.default_folder_id
+        folder = f"https://drive.google.com/drive/folders/{folder_id}" if folder_id else "المجلد الرئيسي (My Drive)"
+        layout = self.folder_layout(settings)
+        return f"📁 مجلد الوجهة: {folder}\n🗂️ التنظيم: {'/'.join(layout) if layout else 'بدون مجلدات فرعية'}"
+    
+    async def folder_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """معالج أمر /folder لتحديد مجلد الوجهة على Drive"""
+        user_id = update.effective_user.id
+        credentials = self.get_user_credentials(user_id)
+        if not credentials:
+            await update.message.reply_text("❌ يجب ربط حسابك أولاً باستخدام /auth")
+            return
+        
+        settings = await self.run_db_io(self.user_settings.get, user_id)
+        argument = ' '.join(context.args or []).strip()
+        if not argument:
+            await update.message.reply_text(
+                f"{self.describe_destination(settings)}\n\n"
+                "لتغيير المجلد:\n"
+                "/folder <رابط أو معرف المجلد> - مجلد موجود أنشأه البوت\n"
+                "/folder <اسم أو مسار> - إنشاء مجلد (مثل Telegram/Uploads) في المجلد الرئيسي\n"
+                "/folder reset - العودة إلى المجلد الافتراضي",
+                disable_web_page_preview=True
+            )
+            return
+        
+        if argument.lower() in ('reset', 'default'):
+            await self.run_db_io(self.user_settings.update, user_id, folder_id=None)
+            settings['folder_id'] = None
+            await update.message.reply_text(
+                f"✅ تمت العودة إلى المجلد الافتراضي\n{self.describe_destination(settings)}",
+                disable_web_page_preview=True
+            )
+            return
+        
+        folder_id = parse_folder_id(argument)
+        try:
+            if folder_id is None:
+                # اسم أو مسار: يُنشأ تحت المجلد الرئيسي ما لم يكن موجوداً
+                folder_id = await self.run_drive_io(self._resolve_folder_sync, user_id, credentials, None, argument)
+            else:
+                folder_id = await self.run_drive_io(self._resolve_folder_sync, user_id, credentials, folder_id, '')
+        except Exception as e:
+            logger.error(f"خطأ في تحديد مجلد الوجهة للمستخدم {user_id}: {e}")
+            await update.message.reply_text("❌ حدث خطأ في الوصول إلى Google Drive. حاول مرة أخرى.")
+            return
+        
+        if not folder_id:
+            # صلاحية drive.file لا تسمح إلا بالمجلدات التي أنشأها البوت
+            await update.message.reply_text(
+                "❌ لا يمكن الوصول إلى هذا المجلد. يمكن للبوت الرفع فقط إلى المجلدات التي أنشأها؛ "
+                "استخدم /folder <اسم> لإنشاء مجلد جديد"
+            )
+            return
+        
+        await self.run_db_io(self.user_settings.update, user_id, folder_id=folder_id)
+        settings['folder_id'] = folder_id
+        await update.message.reply_text(
+            f"✅ تم تحديد مجلد الوجهة\n{self.describe_destination(settings)}", disable_web_page_preview=True
+        )
+    
+    async def organize_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """معالج أمر /organize لتنظيم الملفات في مجلدات فرعية"""
+        user_id = update.effective_user.id
+        argument = ' '.join(context.args or []).strip().lower()
+        if not argument:
+            settings = await self.run_db_io(self.user_settings.get, user_id)
+            await update.message.reply_text(
+                f"{self.describe_destination(settings)}\n\n"
+                "لتغيير التنظيم اذكر المكونات بالترتيب:\n"
+                "• type - حسب النوع (Documents, Photos, Videos)\n"
+                "• date - حسب الشهر (2024-05)\n"
+                "• chat - حسب المحادثة أو مصدر الرسالة المعاد توجيهها\n\n"
+                "مثال: /organize type/date\n"
+                "/organize off - بدون مجلدات فرعية\n"
+                "/organize reset - التنظيم الافتراضي",
+                disable_web_page_preview=True
+            )
+            return
+        
+        if argument in ('reset', 'default'):
+            layout = None
+        elif argument in ('off', 'none'):
+            layout = ''
+        else:
+            try:
+                layout = '/'.join(parse_layout(argument))
+            except ValueError as e:
+                await update.message.reply_text(f"❌ {e}\nالمكونات المتاحة: type و date و chat")
+                return
+        
+        await self.run_db_io(self.user_settings.update, user_id, folder_layout=layout)
+        settings = await self.run_db_io(self.user_settings.get, user_id)
+        await update.message.reply_text(
+            f"✅ تم تحديث التنظيم\n{self.describe_destination(settings)}", disable_web_page_preview=True
+        )
+    
     async def handle_auth_code(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """معالجة رمز التفويض من المستخدم"""
         user_id = update.effective_user.id
@@ -199,14 +821,16 @@ class TelegramDriveBotLargeFiles:
         
         try:
             flow = self.user_credentials[user_id]['flow']
-            flow.fetch_token(code=auth_code)
+            await self.run_drive_io(flow.fetch_token, code=auth_code)
             
-            # حفظ بيانات الاعتماد
+            # حفظ بيانات الاعتماد في الذاكرة وفي المخزن الدائم
             credentials = flow.credentials
             self.user_credentials[user_id]['credentials'] = credentials
+            await self.run_db_io(self.credential_store.save, user_id, credentials)
             
             # إزالة flow بعد الانتهاء
             del self.user_credentials[user_id]['flow']
+            self.drive_services.invalidate(user_id)
             
             await update.message.reply_text("✅ تم ربط حسابك بنجاح! يمكنك الآن رفع الملفات.")
             
@@ -214,51 +838,170 @@ class TelegramDriveBotLargeFiles:
             logger.error(f"خطأ في معالجة رمز التفويض: {e}")
             await update.message.reply_text("❌ رمز التفويض غير صحيح. حاول مرة أخرى.")
     
-    async def download_file_from_telegram(self, file_id: str, file_size: int, use_temp_file: bool = False) -> Optional[io.BytesIO]:
+    async def download_file_from_telegram(self, file_id: str, file_size: int, spool: SpoolBuffer = None,
+                                          job_id: int = None, user_id: int = None) -> Optional[SpoolBuffer]:
         """
-        تنزيل ملف من تيليجرام
+        تنزيل ملف من تيليجرام إلى مخزن مؤقت (في الذاكرة أو على القرص حسب حجمه)
         
         Args:
             file_id: معرف الملف في تيليجرام
             file_size: حجم الملف
-            use_temp_file: استخدام ملف مؤقت للملفات الكبيرة
+            spool: مخزن محجوز مسبقاً (يُحجز هنا إذا لم يُحدد)
+            job_id: معرف عملية الرفع (لعرض تقدم التنزيل)
+            user_id: معرف المستخدم (لتطبيق حد عرض النطاق الخاص به)
             
         Returns:
-            BytesIO object أو مسار الملف المؤقت
+            المخزن بعد اكتمال التنزيل (يحرره upload_to_drive)، أو None إذا فشل التنزيل أو لم يتسع له المخزن
         """
-        try:
-            max_size = self.get_max_file_size()
-            
-            if file_size > max_size:
-                logger.error(f"حجم الملف {file_size} يتجاوز الحد الأقصى {max_size}")
+        max_size = self.get_max_file_size()
+        if file_size > max_size:
+            logger.error(f"حجم الملف {file_size} يتجاوز الحد الأقصى {max_size}")
+            if spool is not None:
+                spool.release()
+            return None
+        
+        if spool is None:
+            spool = self.spool.reserve(file_size)
+            if spool is None:
+                logger.error(f"لا توجد مساحة في المخزن المؤقت لملف بحجم {file_size}")
                 return None
-            
-            # الحصول على رابط تنزيل الملف
-            file_url = f"{self.bot_api_server}/file/bot{self.telegram_token}/{file_id}"
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(file_url) as response:
-                    if response.status == 200:
-                        if use_temp_file and file_size > 50 * 1024 * 1024:  # 50 ميجابايت
-                            # استخدام ملف مؤقت للملفات الكبيرة
-                            temp_file = tempfile.NamedTemporaryFile(delete=False)
-                            async for chunk in response.content.iter_chunked(8192):
-                                temp_file.write(chunk)
-                            temp_file.close()
-                            return temp_file.name
-                        else:
-                            # تحميل في الذاكرة للملفات الصغيرة
-                            file_data = await response.read()
-                            return io.BytesIO(file_data)
-                    else:
-                        logger.error(f"فشل في تنزيل الملف: {response.status}")
-                        return None
-                        
+        
+        async def write(chunk: bytes):
+            spool.write(chunk)
+        
+        try:
+            await self._read_telegram_file(file_id, write, job_id=job_id, user_id=user_id, file_size=file_size)
+            spool.finish()
+            return spool
         except Exception as e:
+            # تحرير الحجز وحذف الملف المؤقت فوراً دون انتظار الرفع
+            spool.release()
             logger.error(f"خطأ في تنزيل الملف: {e}")
             return None
+        except BaseException:
+            # الإلغاء (إيقاف البوت أو العامل) يحرر الحجز أيضاً
+            spool.release()
+            raise
+    
+    async def _read_telegram_file(self, file_path: str, write, offset: int = 0, job_id: int = None,
+                                  user_id: int = None, file_size: int = None) -> int:
+        """
+        تنزيل الملف من تيليجرام (ابتداءً من offset) وتمرير أجزائه إلى الدالة async write
+        
+        عند انقطاع الاتصال أو استجابة مؤقتة (429 أو 5xx) يُستأنف التنزيل من آخر بايت
+        مستلم بترويسة Range حسب سياسة إعادة المحاولة، فلا يُعاد تنزيل ما وصل.
+        الملفات الكبيرة (إذا عُرف حجمها) تُنزّل بعدة اتصالات متوازية
+        
+        Returns:
+            عدد البايتات المستلمة
+        """
+        file_url = self.get_file_url(file_path)
+        session = await self.get_http_session()
+        if file_size and self.download_connections > 1 and file_size - offset >= self.SEGMENTED_DOWNLOAD_THRESHOLD:
+            received = await self._read_segmented(session, file_url, file_size, write, offset, job_id, user_id)
+            if received is not None:
+                return received
+        
+        reader = self.new_read_sizer()
+        started = time.monotonic()
+        received = 0
+        attempt = 0
+        while True:
+            position = offset + received
+            before = received
+            headers = {'Range': f'bytes={position}-'} if position else None
+            try:
+                async with session.get(file_url, headers=headers) as response:
+                    if response.status not in (200, 206):
+                        raise TransientHTTPError(
+                            response.status, parse_retry_after(response.headers.get('Retry-After'))
+                        )
+                    
+                    # الخادم تجاهل Range وأرسل الملف كاملاً: تخطي البايتات المستلمة مسبقاً
+                    skip = position if response.status == 200 else 0
+                    while True:
+                        chunk = await response.content.read(reader.size)
+                        if not chunk:
+                            break
+                        reader.record(len(chunk))
+                        if skip:
+                            if len(chunk) <= skip:
+                                skip -= len(chunk)
+                                continue
+                            chunk = chunk[skip:]
+                            skip = 0
+                        received += len(chunk)
+                        self.progress.add_downloaded(job_id, len(chunk))
+                        await self.download_bandwidth.aconsume(user_id, len(chunk))
+                        await write(chunk)
+                break
+            except Exception as e:
+                if received > before:
+                    # المحاولات تُحسب لكل جزء: أي تقدم يعيد العداد
+                    attempt = 0
+                delay = self.retry_policy.retry_delay('telegram_download', e, attempt)
+                if delay is None:
+                    self.metrics.observe_download(received, time.monotonic() - started, ok=False)
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+        
+        self.metrics.observe_download(received, time.monotonic() - started)
+        return received
+    
+    async def _read_segmented(self, session: aiohttp.ClientSession, file_url: str, file_size: int, write,
+                              offset: int, job_id: int, user_id: int) -> Optional[int]:
+        """
+        تنزيل الملف بطلبات Range متوازية وكتابة الأجزاء بالترتيب
+        
+        Returns:
+            عدد البايتات المستلمة، أو None إذا كان الخادم لا يدعم Range (يُستخدم التدفق الواحد)
+        """
+        if self._range_support is None:
+            try:
+                self._range_support = await probe_range_support(session, file_url) is not None
+            except Exception as e:
+                logger.warning(f"تعذر التحقق من دعم طلبات Range: {e}")
+                return None
+            if not self._range_support:
+                logger.info("خادم Bot API لا يدعم طلبات Range، التنزيل باتصال واحد")
+        if not self._range_support:
+            return None
+        
+        # نافذة الأجزاء من حد الذاكرة: اتصالات أقل إذا لم تتسع لكلها، وتدفق واحد إذا لم تتسع لجزأين
+        window = self.memory.try_acquire(
+            self.download_connections * self.download_segment_size, 2 * self.download_segment_size
+        )
+        if not window:
+            logger.info("حد الذاكرة لا يتسع لنافذة التنزيل المقسم، التنزيل باتصال واحد")
+            return None
+        
+        async def on_chunk(nbytes: int):
+            self.progress.add_downloaded(job_id, nbytes)
+            await self.download_bandwidth.aconsume(user_id, nbytes)
+        
+        downloader = SegmentedDownloader(
+            session, file_url, file_size,
+            connections=window // self.download_segment_size,
+            segment_size=self.download_segment_size,
+            read_size=self.MAX_READ_SIZE,
+            retry_policy=self.retry_policy,
+            on_chunk=on_chunk
+        )
+        started = time.monotonic()
+        try:
+            received = await downloader.download(write, offset)
+        except Exception:
+            self.metrics.observe_download(0, time.monotonic() - started, ok=False)
+            raise
+        finally:
+            self.memory.release(window)
+        self.metrics.observe_download(received, time.monotonic() - started)
+        return received
     
-    async def upload_to_drive(self, file_data, filename: str, user_id: int, file_size: int = None) -> Optional[str]:
+    async def upload_to_drive(self, file_data, filename: str, user_id: int, file_size: int = None,
+                              file_unique_id: str = None, job_id: int = None, session_uri: str = None,
+                              offset: int = 0, parent_id: str = None, mime_type: str = None) -> Optional[str]:
         """
         رفع ملف إلى Google Drive
         
@@ -267,265 +1010,1141 @@ class TelegramDriveBotLargeFiles:
             filename: اسم الملف
             user_id: معرف المستخدم
             file_size: حجم الملف
+            file_unique_id: المعرف الثابت للملف في تيليجرام (لتسجيله في فهرس الملفات المرفوعة)
+            job_id: معرف عملية الرفع في سجل العمليات (لحفظ تقدم الرفع)
+            session_uri: رابط جلسة رفع سابقة لمتابعتها
+            offset: آخر موضع أكده Drive في الجلسة السابقة
+            parent_id: معرف المجلد الذي يُرفع إليه الملف (افتراضياً المجلد الرئيسي)
             
         Returns:
             رابط الملف في Drive أو None في حالة الفشل
         """
         try:
-            if user_id not in self.user_credentials or 'credentials' not in self.user_credentials[user_id]:
+            credentials = self.get_user_credentials(user_id)
+            if credentials is None:
                 return None
             
-            credentials = self.user_credentials[user_id]['credentials']
+            # تنفيذ التحديث والرفع في منفذ Drive حتى يبقى البوت مستجيباً
+            response = await self.run_drive_io(
+                self._upload_to_drive_sync, file_data, filename, user_id, credentials,
+                file_unique_id=file_unique_id, job_id=job_id, session_uri=session_uri, offset=offset,
+                parent_id=parent_id, mime_type=mime_type
+            )
+            if response is None:
+                return None
             
-            # التحقق من صلاحية بيانات الاعتماد
-            if not credentials.valid:
-                if credentials.expired and credentials.refresh_token:
-                    credentials.refresh(Request())
-                else:
-                    return None
+            return response.get('webViewLink')
             
-            # إنشاء خدمة Drive
-            service = build('drive', 'v3', credentials=credentials)
+        except HttpError as e:
+            logger.error(f"خطأ في Google Drive API: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"خطأ في رفع الملف: {e}")
+            return None
+        finally:
+            # تحرير المخزن المؤقت (حذف الملف من القرص أو إعادة حجز الذاكرة)
+            if isinstance(file_data, SpoolBuffer):
+                file_data.release()
+    
+    def _upload_to_drive_sync(self, file_data, filename: str, user_id: int, credentials: Credentials,
+                              file_unique_id: str = None, job_id: int = None, session_uri: str = None,
+                              offset: int = 0, parent_id: str = None,
+                              max_chunk_size: int = None, mime_type: str = None) -> Optional[dict]:
+        """
+        الجزء المتزامن من الرفع (يعمل داخل منفذ Drive)
+        
+        Args:
+            file_data: بيانات الملف أو مسار الملف المؤقت
+            filename: اسم الملف
+            user_id: معرف المستخدم
+            credentials: بيانات اعتماد المستخدم
+            file_unique_id: المعرف الثابت للملف في تيليجرام
+            job_id: معرف عملية الرفع في سجل العمليات
+            session_uri: رابط جلسة رفع سابقة لمتابعتها
+            offset: آخر موضع أكده Drive في الجلسة السابقة
+            parent_id: معرف المجلد الذي يُرفع إليه الملف
+            max_chunk_size: أكبر جزء رفع (حسب الذاكرة المحجوزة للنقل المباشر)
+            mime_type: نوع محتوى الملف على Drive (يستنتجه Drive إذا لم يُحدد)
             
+        Returns:
+            استجابة Drive للملف المرفوع أو None إذا كانت بيانات الاعتماد غير صالحة
+        """
+        # التحقق من صلاحية بيانات الاعتماد (عادة حدّثها التحديث الخلفي مسبقاً)
+        if not self.ensure_fresh_credentials(user_id, credentials):
+            return None
+        
+        # الحصول على خدمة Drive من الذاكرة المؤقتة للمستخدم
+        with self.drive_services.service(user_id, credentials) as service:
             # إعداد بيانات الملف
             file_metadata = {
                 'name': filename,
-                'parents': []  # يمكن تحديد مجلد معين هنا
+                'parents': [parent_id] if parent_id else []
             }
+            if mime_type:
+                file_metadata['mimeType'] = mime_type
             
             # تحديد نوع الرفع حسب نوع البيانات
-            if isinstance(file_data, str):  # مسار ملف مؤقت
-                media = MediaFileUpload(file_data, resumable=True)
+            if isinstance(file_data, SpoolBuffer) and file_data.on_disk:  # ملف في المخزن المؤقت على القرص
+                media = MediaFileUpload(file_data.path, chunksize=self.STREAM_CHUNK_SIZE, resumable=True)
+            elif isinstance(file_data, SpoolBuffer):  # ملف في المخزن المؤقت في الذاكرة
+                media = MediaIoBaseUpload(
+                    file_data.memory, mimetype='application/octet-stream', chunksize=self.STREAM_CHUNK_SIZE,
+                    resumable=True
+                )
+            elif isinstance(file_data, MediaUpload):  # تدفق مباشر من تيليجرام
+                media = file_data
             else:  # BytesIO object
-                media = MediaIoBaseUpload(file_data, mimetype='application/octet-stream', resumable=True)
+                media = MediaIoBaseUpload(
+                    file_data, mimetype='application/octet-stream', chunksize=self.STREAM_CHUNK_SIZE, resumable=True
+                )
             
-            # رفع الملف مع دعم الرفع المتقطع للملفات الكبيرة
-            request = service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id,name,webViewLink'
+            # حجم كل جزء يُحدد حسب سرعة الأجزاء السابقة، والمجموع الاختباري يُحسب للبايتات المرسلة
+            sizer = self.new_chunk_sizer(max_chunk_size)
+            hasher = IncrementalHasher(self.checksum_sha256, offset) if self.verify_checksums else None
+            media = AdaptiveChunkUpload(
+                media, sizer, throttle=functools.partial(self.upload_bandwidth.consume, user_id), hasher=hasher
             )
             
+            fields = 'id,name,webViewLink'
+            if hasher is not None:
+                fields += ',md5Checksum,sha256Checksum' if self.checksum_sha256 else ',md5Checksum'
+            
+            def new_request(session_uri: str = None, offset: int = 0):
+                """طلب رفع متقطع جديد، أو متابعة جلسة من آخر بايت أكده الخادم"""
+                request = service.files().create(
+                    body=file_metadata,
+                    media_body=media,
+                    fields=fields
+                )
+                if session_uri:
+                    request.resumable_uri = session_uri
+                    request.resumable_progress = offset
+                return request
+            
+            # رفع الملف مع دعم الرفع المتقطع للملفات الكبيرة
+            request = new_request(session_uri, offset)
+            
             response = None
-            while response is None:
-                status, response = request.next_chunk()
-                if status:
-                    logger.info(f"رفع {int(status.progress() * 100)}% مكتمل")
+            chunk_attempt = 0
+            upload_started = time.monotonic()
+            try:
+                while response is None:
+                    started = time.monotonic()
+                    progress = request.resumable_progress
+                    try:
+                        status, response = self.drive_request(user_id, request.next_chunk)
+                    except Exception as e:
+                        sizer.record_error()
+                        self.metrics.observe_drive_error(e)
+                        delay = self.retry_policy.retry_delay('drive_upload_chunk', e, chunk_attempt)
+                        if delay is None:
+                            raise
+                        chunk_attempt += 1
+                        time.sleep(delay)
+                        if request.resumable_uri:
+                            # المحاولة التالية تبدأ من آخر بايت استلمه Drive. السؤال له محاولاته الخاصة
+                            # فلا يُحسب من محاولات الجزء، والطلب الجديد لا يسأل Drive مرة أخرى
+                            upload_status = self._query_upload_status_sync(
+                                user_id, credentials, request.resumable_uri, media.size()
+                            )
+                            if upload_status is None:
+                                raise
+                            committed, response = upload_status
+                            if response is None:
+                                request = new_request(request.resumable_uri, committed)
+                        continue
+                    chunk_attempt = 0
+                    
+                    sent = (media.size() if response is not None else request.resumable_progress) - progress
+                    sizer.record(sent, time.monotonic() - started)
+                    self.progress.set_uploaded(job_id, progress + sent)
+                    
+                    if status:
+                        logger.info(f"رفع {int(status.progress() * 100)}% مكتمل (جزء {sizer.size // 1024} كيلوبايت)")
+                        if job_id is not None:
+                            self._save_job_progress(job_id, request.resumable_uri, request.resumable_progress)
+            except Exception as e:
+                self.metrics.observe_upload(sizer.bytes_sent, time.monotonic() - upload_started, ok=False)
+                if parent_id and isinstance(e, HttpError) and e.resp.status == 404:
+                    # المجلد حُذف من Drive: يُعاد بناء المسار عند الرفع التالي
+                    self.folders.invalidate(user_id)
+                raise
+            else:
+                self.metrics.observe_upload(sizer.bytes_sent, time.monotonic() - upload_started)
+            finally:
+                self._record_upload_stats(sizer)
             
-            # تنظيف الملف المؤقت إذا كان موجوداً
-            if isinstance(file_data, str) and os.path.exists(file_data):
-                os.unlink(file_data)
+            if hasher is not None and response:
+                self._verify_checksums(user_id, service, response, hasher, media.size())
             
-            return response.get('webViewLink')
+        # تسجيل الملف في الفهرس حتى لا يُعاد رفعه إذا أُرسل مجدداً
+        if file_unique_id and response and response.get('id'):
+            try:
+                self.upload_index.record(
+                    user_id,
+                    file_unique_id,
+                    response['id'],
+                    response.get('webViewLink'),
+                    filename,
+                    media.size(),
+                    md5=hasher.md5() if hasher else None,
+                    sha256=hasher.sha256() if hasher else None
+                )
+            except Exception as e:
+                logger.warning(f"تعذر تسجيل الملف في فهرس الملفات المرفوعة: {e}")
+        
+        return response
+    
+    def _verify_checksums(self, user_id: int, service, response: dict, hasher: IncrementalHasher, size: int):
+        """
+        مقارنة المجموع الاختباري المحسوب أثناء الرفع بما حسبه Drive للملف (داخل منفذ Drive)
+        
+        عند عدم التطابق يُحذف الملف التالف من Drive ويُرفع ChecksumMismatch.
+        الرفع المستأنف من جلسة سابقة لا يمكن التحقق منه لأن بدايته لم تمر بالحاسب
+        """
+        expected = {'md5Checksum': hasher.md5(), 'sha256Checksum': hasher.sha256()}
+        if not response.get('md5Checksum') or expected['md5Checksum'] is None or hasher.position != size:
+            self.metrics.integrity_checks.inc(result='skipped')
+            logger.info(f"تعذر التحقق من المجموع الاختباري للملف {response.get('id')} (رفع مستأنف أو غير مدعوم)")
+            return
+        
+        mismatched = [
+            field for field, value in expected.items()
+            if value and response.get(field) and response[field] != value
+        ]
+        if not mismatched:
+            self.metrics.integrity_checks.inc(result='ok')
+            return
+        
+        self.metrics.integrity_checks.inc(result='mismatch')
+        logger.error(
+            f"المجموع الاختباري للملف {response['id']} لا يطابق البايتات المرسلة ({', '.join(mismatched)}): "
+            f"{response.get('md5Checksum')} != {expected['md5Checksum']}"
+        )
+        try:
+            self.drive_request(user_id, service.files().delete(fileId=response['id']).execute)
+        except Exception as e:
+            logger.warning(f"تعذر حذف الملف التالف {response['id']}: {e}")
+        raise ChecksumMismatch(f"الملف {response['id']} وصل إلى Drive تالفاً")
+    
+    def _save_job_progress(self, job_id: int, session_uri: str, offset: int):
+        """حفظ رابط جلسة الرفع وموضعها حتى يمكن متابعتها بعد إعادة التشغيل"""
+        try:
+            self.job_store.update_session(job_id, session_uri, offset)
+        except Exception as e:
+            logger.warning(f"تعذر حفظ تقدم عملية الرفع {job_id}: {e}")
+    
+    def _query_upload_status_sync(self, user_id: int, credentials: Credentials, session_uri: str, file_size: int):
+        """
+        سؤال Drive عن حالة جلسة رفع متقطع سابقة (يعمل داخل منفذ Drive)
+        
+        Returns:
+            (الموضع الذي أكده الخادم، استجابة الملف إذا اكتمل الرفع) أو None إذا انتهت صلاحية الجلسة
+        """
+        # build_http لا يعامل 308 كإعادة توجيه
+        http = google_auth_httplib2.AuthorizedHttp(credentials, http=build_http())
+        
+        def query():
+            resp, content = http.request(
+                session_uri,
+                method='PUT',
+                body=b'',
+                headers={'Content-Range': f'bytes */{file_size}', 'Content-Length': '0'}
+            )
+            if resp.status >= 500 or resp.status == 429:
+                raise HttpError(resp, content, uri=session_uri)
+            return resp, content
+        
+        resp, content = self.retry_policy.call('drive_upload_status', self.drive_request, user_id, query)
+        
+        if resp.status in (200, 201):
+            return file_size, json.loads(content.decode('utf-8'))
+        if resp.status == 308:
+            # Range: bytes=0-N يعني أن الخادم استلم حتى البايت N
+            received = resp.get('range')
+            offset = int(received.split('-')[1]) + 1 if received else 0
+            return offset, None
+        if resp.status in (404, 410):
+            return None
+        raise HttpError(resp, content, uri=session_uri)
+    
+    def _create_folder_sync(self, user_id: int, credentials: Credentials, name: str,
+                            parent_id: str = None) -> Optional[dict]:
+        """إنشاء مجلد على Drive (يعمل داخل منفذ Drive)"""
+        if not self.ensure_fresh_credentials(user_id, credentials):
+            return None
+        
+        metadata = {'name': name, 'mimeType': 'application/vnd.google-apps.folder'}
+        if parent_id:
+            metadata['parents'] = [parent_id]
+        
+        with self.drive_services.service(user_id, credentials) as service:
+            try:
+                request = service.files().create(body=metadata, fields='id,webViewLink')
+                return self.retry_policy.call('drive_create_folder', self.drive_request, user_id, request.execute)
+            except HttpError as e:
+                self.metrics.observe_drive_error(e)
+                raise
+    
+    def _resolve_folder_sync(self, user_id: int, credentials: Credentials, root_id: Optional[str],
+                             path: str) -> Optional[str]:
+        """
+        معرف المجلد الموافق للمسار تحت root_id مع إنشاء الناقص (يعمل داخل منفذ Drive)
+        
+        المعرفات تُقرأ من فهرس المجلدات المحلي فلا تُطلب من Drive إلا عند أول استخدام
+        للمسار أو بعد انتهاء صلاحيتها. إذا لم يكن root_id متاحاً يُستخدم المجلد الرئيسي
+        
+        Returns:
+            معرف المجلد أو None للمجلد الرئيسي
+        """
+        if not root_id and not path:
+            return None
+        if not self.ensure_fresh_credentials(user_id, credentials):
+            return None
+        
+        def execute(operation, request):
+            return self.retry_policy.call(operation, self.drive_request, user_id, request.execute)
+        
+        with self.drive_services.service(user_id, credentials) as service:
+            try:
+                if root_id and not self.folders.is_accessible(user_id, root_id, service, execute):
+                    logger.warning(f"المجلد {root_id} غير متاح للمستخدم {user_id}، استخدام المجلد الرئيسي")
+                    root_id = None
+                return self.folders.resolve(user_id, root_id, path, service, execute)
+            except HttpError as e:
+                self.metrics.observe_drive_error(e)
+                raise
+    
+    def _batch_copy_sync(self, user_id: int, credentials: Credentials, files: dict, parent_id: str) -> dict:
+        """
+        نسخ عدة ملفات موجودة إلى مجلد بطلب Drive مجمّع واحد (يعمل داخل منفذ Drive)
+        
+        Args:
+            files: مفتاح -> (معرف الملف على Drive، الاسم الجديد)
+            parent_id: المجلد الذي تُنسخ إليه
             
+        Returns:
+            مفتاح -> رابط النسخة أو None إذا فشل نسخ الملف
+        """
+        results = {key: None for key in files}
+        if not files or not self.ensure_fresh_credentials(user_id, credentials):
+            return results
+        
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                logger.warning(f"فشل نسخ ملف ضمن الطلب المجمّع: {exception}")
+                self.metrics.observe_drive_error(exception)
+            else:
+                results[request_id] = response.get('webViewLink')
+        
+        with self.drive_services.service(user_id, credentials) as service:
+            batch = service.new_batch_http_request(callback=on_response)
+            for key, (drive_file_id, name) in files.items():
+                batch.add(
+                    service.files().copy(
+                        fileId=drive_file_id,
+                        body={'name': name, 'parents': [parent_id]},
+                        fields='id,webViewLink'
+                    ),
+                    request_id=key
+                )
+            # كل عنصر في الطلب المجمّع يُحسب طلباً مستقلاً في حصة Drive
+            self.drive_request(user_id, batch.execute, tokens=len(files))
+        return results
+    
+    def _copy_drive_file_sync(self, user_id: int, credentials: Credentials, drive_file_id: str, filename: str) -> Optional[dict]:
+        """نسخ ملف موجود على Drive من جهة الخادم دون نقل بياناته (يعمل داخل منفذ Drive)"""
+        if not self.ensure_fresh_credentials(user_id, credentials):
+            return None
+        
+        with self.drive_services.service(user_id, credentials) as service:
+            try:
+                request = service.files().copy(
+                    fileId=drive_file_id,
+                    body={'name': filename},
+                    fields='id,name,webViewLink'
+                )
+                return self.retry_policy.call('drive_copy', self.drive_request, user_id, request.execute)
+            except HttpError as e:
+                self.metrics.observe_drive_error(e)
+                raise
+    
+    async def find_existing_upload(self, user_id: int, file_unique_id: str, filename: str) -> Optional[str]:
+        """
+        البحث عن ملف أُرسل ورُفع مسبقاً حسب file_unique_id
+        
+        Returns:
+            رابط الملف الموجود (أو نسخته الجديدة في وضع copy)، أو None إذا يجب رفعه
+        """
+        if self.dedup_mode == 'off' or not file_unique_id:
+            return None
+        
+        record = await self.run_db_io(self.upload_index.get, user_id, file_unique_id)
+        if record is None:
+            return None
+        
+        if self.dedup_mode == 'link':
+            return record['web_link']
+        
+        credentials = self.get_user_credentials(user_id)
+        if credentials is None:
+            return None
+        
+        try:
+            copy = await self.run_drive_io(
+                self._copy_drive_file_sync, user_id, credentials, record['drive_file_id'], filename
+            )
+            return copy.get('webViewLink') if copy else None
         except HttpError as e:
-            logger.error(f"خطأ في Google Drive API: {e}")
-            # تنظيف الملف المؤقت في حالة الخطأ
-            if isinstance(file_data, str) and os.path.exists(file_data):
-                os.unlink(file_data)
+            if e.resp.status == 404:
+                # حُذف الملف الأصلي من Drive فيجب رفعه من جديد
+                await self.run_db_io(self.upload_index.forget, user_id, file_unique_id)
+            else:
+                logger.error(f"خطأ في نسخ الملف على Google Drive: {e}")
             return None
+    
+    async def reply_if_duplicate(self, update: Update, user_id: int, file_unique_id: str, filename: str) -> bool:
+        """
+        الرد برابط الملف مباشرة إذا كان مرفوعاً مسبقاً
+        
+        Returns:
+            True إذا تم الرد ولا حاجة لإعادة الرفع
+        """
+        try:
+            drive_link = await self.find_existing_upload(user_id, file_unique_id, filename)
         except Exception as e:
-            logger.error(f"خطأ في رفع الملف: {e}")
-            # تنظيف الملف المؤقت في حالة الخطأ
-            if isinstance(file_data, str) and os.path.exists(file_data):
-                os.unlink(file_data)
-            return None
+            logger.warning(f"تعذر البحث في فهرس الملفات المرفوعة: {e}")
+            return False
+        
+        if not drive_link:
+            return False
+        
+        if self.dedup_mode == 'copy':
+            header = "✅ تم نسخ الملف على Google Drive دون إعادة رفعه!"
+        else:
+            header = "✅ هذا الملف مرفوع مسبقاً إلى Google Drive!"
+        
+        message = f"""
+{header}
+
+📁 اسم الملف: {filename}
+🔗 الرابط: {drive_link}
+        """
+        await update.message.reply_text(message, disable_web_page_preview=True)
+        return True
     
-    async def handle_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """معالجة الملفات المرسلة"""
-        user_id = update.effective_user.id
+    @asynccontextmanager
+    async def upload_job(self, update: Update, loading_message, file_id: str, file_unique_id: str,
+                         filename: str, file_size: int, local_path: str = None, parent_id: str = None,
+                         progress_key=None, mime_type: str = None):
+        """
+        تسجيل عملية الرفع طوال كتلة with حتى يمكن متابعتها إذا توقف البوت
         
-        # التحقق من ربط الحساب
-        if user_id not in self.user_credentials or 'credentials' not in self.user_credentials[user_id]:
-            await update.message.reply_text("❌ يجب ربط حسابك أولاً باستخدام /auth")
-            return
+        يُحذف السجل عند انتهاء الكتلة بنجاح أو بخطأ، ويبقى فقط إذا أُلغيت
+        العملية (إيقاف البوت) أو توقفت العملية فجأة.
+        إذا حُدد progress_key يُعرض التقدم ضمن رسالة مجموعة (ألبوم) بدلاً من رسالة خاصة
         
-        # الحصول على معلومات الملف
-        document = update.message.document
-        if not document:
-            await update.message.reply_text("❌ لم يتم العثور على ملف")
+        Yields:
+            معرف العملية في سجل العمليات
+        """
+        job_id = await self.run_db_io(
+            self.job_store.create,
+            update.effective_user.id,
+            update.effective_chat.id,
+            loading_message.message_id,
+            file_id,
+            file_unique_id,
+            filename,
+            file_size,
+            local_path,
+            parent_id,
+            mime_type=mime_type
+        )
+        if progress_key is None:
+            self.progress.start(job_id, loading_message.edit_text, filename, file_size)
+        else:
+            self.progress.link(job_id, progress_key)
+        try:
+            try:
+                yield job_id
+            finally:
+                if progress_key is None:
+                    await self.progress.finish(job_id)
+                else:
+                    self.progress.unlink(job_id)
+        except Exception:
+            await self.run_db_io(self.job_store.finish, job_id)
+            raise
+        await self.run_db_io(self.job_store.finish, job_id)
+    
+    async def resume_pending_jobs(self, bot):
+        """متابعة عمليات الرفع التي لم تكتمل قبل إيقاف البوت"""
+        # لا داعي لإنشاء قاعدة البيانات إذا لم تُستخدم بعد
+        if not self.job_store.exists():
             return
         
-        # التحقق من حجم الملف
-        max_size = self.get_max_file_size()
-        if document.file_size > max_size:
-            max_size_mb = max_size / (1024 * 1024)
-            await update.message.reply_text(f"❌ حجم الملف كبير جداً (الحد الأقصى {max_size_mb:.0f} ميجابايت)")
+        jobs = await self.run_db_io(self.job_store.pending)
+        if not jobs:
             return
         
+        logger.info(f"متابعة {len(jobs)} عملية رفع غير مكتملة")
+        await asyncio.gather(*(self.resume_upload_job(bot, job) for job in jobs))
+    
+    async def resume_upload_job(self, bot, job: dict):
+        """متابعة عملية رفع واحدة وإبلاغ المستخدم بالنتيجة"""
+        drive_link = None
         try:
-            # إرسال رسالة تحميل
-            loading_message = await update.message.reply_text("📤 جاري رفع الملف...")
-            
-            # الحصول على معلومات الملف من تيليجرام
-            file = await context.bot.get_file(document.file_id)
-            
-            # تحديد ما إذا كان يجب استخدام ملف مؤقت
-            use_temp_file = document.file_size > 50 * 1024 * 1024  # 50 ميجابايت
-            
-            # تنزيل الملف
-            file_data = await self.download_file_from_telegram(
-                file.file_path, 
-                document.file_size, 
-                use_temp_file
-            )
-            
-            if not file_data:
-                await loading_message.edit_text("❌ فشل في تنزيل الملف")
-                return
-            
-            # تحديث رسالة التحميل
-            await loading_message.edit_text("☁️ جاري رفع الملف إلى Google Drive...")
-            
-            # رفع الملف إلى Drive
-            drive_link = await self.upload_to_drive(
-                file_data, 
-                document.file_name, 
-                user_id, 
-                document.file_size
-            )
-            
-            if drive_link:
-                file_size_mb = document.file_size / (1024 * 1024)
-                success_message = f"""
-✅ تم رفع الملف بنجاح!
+            async with self.upload_scheduler.slot(job['user_id']):
+                drive_link = await self.run_upload_job(bot, job)
+        except Exception as e:
+            logger.error(f"خطأ في متابعة عملية الرفع {job['job_id']}: {e}")
+        
+        await self.run_db_io(self.job_store.finish, job['job_id'])
+        await self.report_job_result(bot, job, drive_link, resumed=True)
+    
+    async def run_upload_job(self, bot, job: dict) -> Optional[str]:
+        """
+        تنفيذ عملية من سجل العمليات مع عرض التقدم في رسالتها
+        
+        Returns:
+            رابط الملف في Drive أو None في حالة الفشل
+        """
+        edit = functools.partial(bot.edit_message_text, chat_id=job['chat_id'], message_id=job['message_id'])
+        self.progress.start(job['job_id'], edit, job['file_name'], job['file_size'], job['offset'])
+        try:
+            return await self.resume_transfer(bot, job)
+        except Exception as e:
+            logger.error(f"خطأ في عملية الرفع {job['job_id']}: {e}")
+            return None
+        finally:
+            await self.progress.finish(job['job_id'])
+    
+    async def report_job_result(self, bot, job: dict, drive_link: Optional[str], resumed: bool = False):
+        """إبلاغ المستخدم بنتيجة عملية من سجل العمليات في رسالتها"""
+        if drive_link and resumed:
+            message = f"""
+✅ تم استكمال رفع الملف بعد إعادة تشغيل البوت!
 
-📁 اسم الملف: {document.file_name}
-📊 الحجم: {file_size_mb:.2f} ميجابايت
+📁 اسم الملف: {job['file_name']}
 🔗 الرابط: {drive_link}
+        """
+        elif drive_link:
+            message = f"""
+✅ تم رفع الملف بنجاح!
 
-💡 يمكنك الآن الوصول إلى الملف من Google Drive الخاص بك
-                """
-                await loading_message.edit_text(success_message, disable_web_page_preview=True)
+📁 اسم الملف: {job['file_name']}
+📊 الحجم: {job['file_size'] / (1024 * 1024):.2f} ميجابايت
+🔗 الرابط: {drive_link}
+        """
+        elif resumed:
+            message = f"❌ تعذر استكمال رفع الملف {job['file_name']} بعد إعادة تشغيل البوت. أرسله مجدداً"
+        else:
+            message = f"❌ فشل في رفع الملف {job['file_name']} إلى Google Drive"
+        
+        try:
+            await bot.edit_message_text(
+                message, chat_id=job['chat_id'], message_id=job['message_id'], disable_web_page_preview=True
+            )
+        except Exception:
+            try:
+                await bot.send_message(job['chat_id'], message, disable_web_page_preview=True)
+            except Exception as e:
+                logger.warning(f"تعذر إبلاغ المستخدم {job['user_id']} بنتيجة الرفع: {e}")
+    
+    async def resume_transfer(self, bot, job: dict) -> Optional[str]:
+        """
+        استكمال نقل ملف من آخر موضع أكده Google Drive
+        
+        Returns:
+            رابط الملف في Drive أو None في حالة الفشل
+        """
+        user_id = job['user_id']
+        credentials = self.get_user_credentials(user_id)
+        if credentials is None:
+            return None
+        
+        session_uri = job['session_uri']
+        offset = 0
+        if session_uri:
+            status = await self.run_drive_io(
+                self._query_upload_status_sync, job['user_id'], credentials, session_uri, job['file_size']
+            )
+            if status is None:
+                # انتهت صلاحية الجلسة (أسبوع تقريباً) فيبدأ الرفع من جديد
+                logger.info(f"جلسة الرفع {job['job_id']} منتهية، إعادة الرفع من البداية")
+                session_uri = None
             else:
-                await loading_message.edit_text("❌ فشل في رفع الملف إلى Google Drive")
-                
-        except Exception as e:
-            logger.error(f"خطأ في معالجة الملف: {e}")
-            await update.message.reply_text("❌ حدث خطأ في معالجة الملف")
+                offset, response = status
+                if response is not None:
+                    # اكتمل الرفع قبل الإيقاف مباشرة ولم يُسجل
+                    if job['file_unique_id']:
+                        await self.run_db_io(
+                            self.upload_index.record, user_id, job['file_unique_id'], response['id'],
+                            response.get('webViewLink'), job['file_name'], job['file_size']
+                        )
+                    return response.get('webViewLink')
+        
+        parent_id = job['parent_id']
+        if parent_id is None and session_uri is None and job.get('folder_path') is not None:
+            # عملية من قائمة الانتظار: مسار المجلد حُسب عند إضافتها
+            parent_id = await self.destination_folder(user_id, path=job['folder_path'])
+        
+        logger.info(f"استكمال رفع {job['file_name']} من البايت {offset} من {job['file_size']}")
+        
+        local_path = job['local_path']
+        if not local_path or not os.path.exists(local_path):
+            # مسارات ملفات تيليجرام مؤقتة فيجب طلب مسار جديد
+            file = await self.get_telegram_file(bot, job['file_id'])
+            local_path = self.get_local_file_path(file.file_path)
+        
+        if local_path:
+            return await self.upload_local_file_to_drive(
+                local_path, job['file_name'], user_id, job['file_unique_id'],
+                job_id=job['job_id'], session_uri=session_uri, offset=offset, parent_id=parent_id,
+                mime_type=job.get('mime_type')
+            )
+        return await self.stream_file_to_drive(
+            file.file_path, job['file_name'], user_id, job['file_size'], job['file_unique_id'],
+            job_id=job['job_id'], session_uri=session_uri, offset=offset, parent_id=parent_id,
+            mime_type=job.get('mime_type')
+        )
     
-    async def handle_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """معالجة الصور المرسلة"""
-        user_id = update.effective_user.id
+    async def upload_local_file_to_drive(self, local_path: str, filename: str, user_id: int,
+                                         file_unique_id: str = None, job_id: int = None,
+                                         session_uri: str = None, offset: int = 0,
+                                         parent_id: str = None, mime_type: str = None) -> Optional[str]:
+        """
+        رفع ملف موجود على المجلد المشترك مع خادم Bot API المحلي مباشرة
         
-        if user_id not in self.user_credentials or 'credentials' not in self.user_credentials[user_id]:
-            await update.message.reply_text("❌ يجب ربط حسابك أولاً باستخدام /auth")
-            return
+        لا يتم تنزيل الملف عبر HTTP ولا نسخه، ولا يُحذف بعد الرفع لأنه ملك خادم Bot API
         
-        try:
-            # الحصول على أكبر حجم للصورة
-            photo = update.message.photo[-1]
+        Args:
+            local_path: المسار المطلق للملف
+            filename: اسم الملف
+            user_id: معرف المستخدم
+            file_unique_id: المعرف الثابت للملف في تيليجرام
+            job_id: معرف عملية الرفع في سجل العمليات
+            session_uri: رابط جلسة رفع سابقة لمتابعتها
+            offset: آخر موضع أكده Drive في الجلسة السابقة
+            parent_id: معرف المجلد الذي يُرفع إليه الملف
             
-            loading_message = await update.message.reply_text("📤 جاري رفع الصورة...")
+        Returns:
+            رابط الملف في Drive أو None في حالة الفشل
+        """
+        try:
+            media = MediaFileUpload(local_path, chunksize=self.STREAM_CHUNK_SIZE, resumable=True)
+        except OSError as e:
+            logger.error(f"خطأ في قراءة الملف المحلي: {e}")
+            return None
+        
+        return await self.upload_to_drive(
+            media, filename, user_id, file_unique_id=file_unique_id,
+            job_id=job_id, session_uri=session_uri, offset=offset, parent_id=parent_id, mime_type=mime_type
+        )
+    
+    async def stream_file_to_drive(self, file_path: str, filename: str, user_id: int, file_size: int,
+                                   file_unique_id: str = None, job_id: int = None,
+                                   session_uri: str = None, offset: int = 0,
+                                   parent_id: str = None, mime_type: str = None) -> Optional[str]:
+        """
+        نقل ملف من تيليجرام إلى Google Drive مباشرة دون ملف مؤقت
+        
+        يتم تمرير أجزاء التنزيل إلى الرفع المتقطع عبر أنبوب محدود، فيتداخل
+        التنزيل مع الرفع ولا يتجاوز استهلاك الذاكرة بضعة أجزاء مهما كان حجم الملف
+        
+        Args:
+            file_path: مسار الملف في تيليجرام
+            filename: اسم الملف
+            user_id: معرف المستخدم
+            file_size: حجم الملف
+            file_unique_id: المعرف الثابت للملف في تيليجرام
+            job_id: معرف عملية الرفع في سجل العمليات
+            session_uri: رابط جلسة رفع سابقة لمتابعتها
+            offset: آخر موضع أكده Drive (يبدأ التنزيل منه)
+            parent_id: معرف المجلد الذي يُرفع إليه الملف
             
-            # الحصول على معلومات الملف
-            file = await context.bot.get_file(photo.file_id)
+        Returns:
+            رابط الملف في Drive أو None في حالة الفشل
+        """
+        if file_size > self.get_max_file_size():
+            logger.error(f"حجم الملف {file_size} يتجاوز الحد الأقصى {self.get_max_file_size()}")
+            return None
+        
+        credentials = self.get_user_credentials(user_id)
+        if credentials is None:
+            return None
+        
+        # ذاكرة النقل: الأنبوب ونافذة الجزء غير المؤكد ونسخته المرسلة. عند قرب نفاد حد الذاكرة
+        # يعمل النقل بأجزاء أصغر، وإذا لم يتوفر حتى الحد الأدنى ينتظر انتهاء عمليات أخرى
+        memory = await self.memory.acquire(
+            self.STREAM_BUFFER_SIZE + 2 * self.MAX_CHUNK_SIZE, 4 * self.MIN_CHUNK_SIZE
+        )
+        pipe_size = min(self.STREAM_BUFFER_SIZE, memory // 2)
+        max_chunk_size = max(self.MIN_CHUNK_SIZE, (memory - pipe_size) // 2)
+        try:
+            pipe = StreamingPipe(pipe_size)
+            media = StreamingMediaUpload(pipe, file_size, chunksize=self.STREAM_CHUNK_SIZE, offset=offset)
             
-            # تنزيل الصورة
-            file_data = await self.download_file_from_telegram(file.file_path, photo.file_size)
+            def upload_from_pipe():
+                try:
+                    return self._upload_to_drive_sync(
+                        media, filename, user_id, credentials,
+                        file_unique_id=file_unique_id, job_id=job_id, session_uri=session_uri, offset=offset,
+                        parent_id=parent_id, max_chunk_size=max_chunk_size, mime_type=mime_type
+                    )
+                finally:
+                    # إيقاف التنزيل إذا انتهى الرفع أو فشل قبل استهلاك كل البيانات
+                    pipe.abort()
             
-            if not file_data:
-                await loading_message.edit_text("❌ فشل في تنزيل الصورة")
-                return
+            upload = asyncio.ensure_future(self.run_drive_io(upload_from_pipe))
+            try:
+                await self._download_into_pipe(file_path, pipe, offset, job_id, user_id, file_size)
+            except asyncio.CancelledError:
+                # إيقاف البوت: تحرير خيط الرفع وترك العملية في السجل لمتابعتها لاحقاً
+                pipe.abort()
+                raise
+            except Exception as e:
+                # إيقاف خيط الرفع دون إعادة محاولة (التنزيل استنفد محاولاته)
+                pipe.abort(PipeAborted(f"فشل تنزيل الملف: {e}"))
             
-            # تحديد اسم الملف
-            filename = f"photo_{photo.file_unique_id}.jpg"
+            try:
+                response = await upload
+                if response is None:
+                    return None
+                return response.get('webViewLink')
+                
+            except HttpError as e:
+                logger.error(f"خطأ في Google Drive API: {e}")
+                return None
+            except Exception as e:
+                logger.error(f"خطأ في النقل المباشر للملف: {e}")
+                return None
+        finally:
+            self.memory.release(memory)
+    
+    async def _download_into_pipe(self, file_path: str, pipe: StreamingPipe, offset: int = 0, job_id: int = None,
+                                  user_id: int = None, file_size: int = None):
+        """تنزيل الملف من تيليجرام (ابتداءً من offset) وكتابة أجزائه في الأنبوب"""
+        await self._read_telegram_file(file_path, pipe.write, offset, job_id, user_id, file_size)
+        pipe.close()
+    
+    def extract_media(self, message) -> Optional[dict]:
+        """
+        استخراج بيانات الملف من رسالة بأي نوع وسائط مدعوم (MEDIA_KINDS)
+        
+        Returns:
+            file_id و file_unique_id و file_name و file_size و mime_type ونوع الوسائط ووصفه، أو None
+        """
+        for kind, default_name, default_mime, label in self.MEDIA_KINDS:
+            media = getattr(message, kind, None)
+            if not media:
+                continue
+            if kind == 'photo':
+                media = media[-1]  # أكبر حجم للصورة
             
-            # رفع الصورة إلى Drive
-            drive_link = await self.upload_to_drive(file_data, filename, user_id, photo.file_size)
+            mime_type = getattr(media, 'mime_type', None) or default_mime
+            filename = getattr(media, 'file_name', None)
+            if kind == 'audio' and not filename and (media.performer or media.title):
+                filename = ' - '.join(filter(None, (media.performer, media.title))) + '.mp3'
+            elif kind == 'sticker' and (media.is_animated or media.is_video):
+                default_name, mime_type = (
+                    ('sticker_{}.tgs', 'application/x-tgsticker') if media.is_animated else ('sticker_{}.webm', 'video/webm')
+                )
             
-            if drive_link:
-                file_size_kb = photo.file_size / 1024
-                success_message = f"""
-✅ تم رفع الصورة بنجاح!
-
-📁 اسم الملف: {filename}
-📊 الحجم: {file_size_kb:.1f} كيلوبايت
-🔗 الرابط: {drive_link}
-                """
-                await loading_message.edit_text(success_message, disable_web_page_preview=True)
-            else:
-                await loading_message.edit_text("❌ فشل في رفع الصورة إلى Google Drive")
-                
+            return {
+                'file_id': media.file_id,
+                'file_unique_id': media.file_unique_id,
+                'file_name': filename or default_name.format(media.file_unique_id),
+                'file_size': media.file_size or 0,
+                'mime_type': mime_type,
+                'kind': kind,
+                'label': label,
+                'duration': getattr(media, 'duration', None),
+            }
+        return None
+    
+    def folder_layout(self, settings: dict) -> tuple:
+        """مكونات تنظيم المجلدات الفرعية للمستخدم (أو التنظيم الافتراضي)"""
+        if settings.get('folder_layout') is None:
+            return self.default_folder_layout
+        try:
+            return parse_layout(settings['folder_layout'])
+        except ValueError:
+            return self.default_folder_layout
+    
+    def message_chat_name(self, message) -> Optional[str]:
+        """اسم المحادثة لتنظيم المجلدات: مصدر الرسالة المعاد توجيهها أو المحادثة نفسها"""
+        origin = getattr(message, 'forward_origin', None)
+        if origin is not None:
+            chat = getattr(origin, 'chat', None) or getattr(origin, 'sender_chat', None)
+            if chat is not None:
+                return chat.effective_name or str(chat.id)
+            user = getattr(origin, 'sender_user', None)
+            if user is not None:
+                return user.full_name
+            if getattr(origin, 'sender_user_name', None):
+                return origin.sender_user_name
+        chat = message.chat
+        return chat.effective_name or str(chat.id)
+    
+    def destination_path(self, settings: dict, message, kind: str) -> str:
+        """المسار النسبي لمجلد الملف حسب تنظيم المستخدم (مثل Videos/2024-05)"""
+        layout = self.folder_layout(settings)
+        chat = self.message_chat_name(message) if 'chat' in layout else None
+        return folder_path(layout, kind, chat, message.date)
+    
+    async def destination_folder(self, user_id: int, message=None, kind: str = None,
+                                 path: str = None) -> Optional[str]:
+        """
+        معرف مجلد الوجهة على Drive لملف من الرسالة (أو للمسار path المحسوب مسبقاً)
+        
+        الفشل في تحديد المجلد لا يوقف الرفع: يُرفع الملف إلى المجلد الرئيسي
+        
+        Returns:
+            معرف المجلد أو None للمجلد الرئيسي
+        """
+        try:
+            credentials = self.get_user_credentials(user_id)
+            if credentials is None:
+                return None
+            settings = await self.run_db_io(self.user_settings.get, user_id)
+            if path is None:
+                path = self.destination_path(settings, message, kind)
+            root_id = settings.get('folder_id') or self.default_folder_id
+            return await self.run_drive_io(self._resolve_folder_sync, user_id, credentials, root_id, path)
         except Exception as e:
-            logger.error(f"خطأ في معالجة الصورة: {e}")
-            await update.message.reply_text("❌ حدث خطأ في معالجة الصورة")
+            logger.warning(f"تعذر تحديد مجلد الوجهة للمستخدم {user_id}، الرفع إلى المجلد الرئيسي: {e}")
+            return None
     
-    async def handle_video(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """معالجة الفيديوهات المرسلة"""
+    async def enqueue_upload(self, update: Update):
+        """
+        إضافة الملف إلى قائمة الانتظار المشتركة لينقله أحد العمال (وضع الواجهة)
+        
+        لا تُنزّل الواجهة الملف ولا تتصل بـ Drive؛ العامل يطلب مسار الملف ويرفعه
+        ثم يعدّل رسالة الحالة بالنتيجة. عناصر الألبوم تُضاف كعمليات مستقلة
+        """
         user_id = update.effective_user.id
+        item = self.extract_media(update.message)
+        if item is None:
+            await update.message.reply_text("❌ لم يتم العثور على ملف")
+            return
         
-        if user_id not in self.user_credentials or 'credentials' not in self.user_credentials[user_id]:
-            await update.message.reply_text("❌ يجب ربط حسابك أولاً باستخدام /auth")
+        max_size = self.get_max_file_size()
+        if item['file_size'] > max_size:
+            max_size_mb = max_size / (1024 * 1024)
+            await update.message.reply_text(f"❌ حجم الملف كبير جداً (الحد الأقصى {max_size_mb:.0f} ميجابايت)")
+            return
+        
+        if await self.reply_if_duplicate(update, user_id, item['file_unique_id'], item['file_name']):
             return
         
         try:
-            video = update.message.video
-            if not video:
-                await update.message.reply_text("❌ لم يتم العثور على فيديو")
+            queued = await self.run_db_io(self.job_store.count_queued, user_id)
+            if queued >= self.upload_scheduler.max_queued_per_user:
+                await update.message.reply_text(
+                    "❌ لديك ملفات كثيرة قيد الانتظار. انتظر اكتمال رفعها ثم حاول مجدداً"
+                )
                 return
             
-            # التحقق من حجم الملف
-            max_size = self.get_max_file_size()
-            if video.file_size > max_size:
-                max_size_mb = max_size / (1024 * 1024)
-                await update.message.reply_text(f"❌ حجم الفيديو كبير جداً (الحد الأقصى {max_size_mb:.0f} ميجابايت)")
-                return
+            # العامل يحوّل مسار المجلد إلى معرف عند النقل (الواجهة لا تتصل بـ Drive)
+            settings = await self.run_db_io(self.user_settings.get, user_id)
+            destination = self.destination_path(settings, update.message, item['kind'])
             
-            loading_message = await update.message.reply_text("📤 جاري رفع الفيديو...")
+            loading_message = await update.message.reply_text(
+                f"⏳ تمت إضافة الملف إلى قائمة الانتظار (الترتيب: {queued + 1})..."
+            )
+            await self.run_db_io(
+                self.job_store.create,
+                user_id,
+                update.effective_chat.id,
+                loading_message.message_id,
+                item['file_id'],
+                item['file_unique_id'],
+                item['file_name'],
+                item['file_size'],
+                status='queued',
+                folder_path=destination,
+                mime_type=item['mime_type']
+            )
+            await self.refresh_shared_queue()
+        except Exception as e:
+            logger.error(f"خطأ في إضافة الملف إلى قائمة الانتظار: {e}")
+            await update.message.reply_text("❌ حدث خطأ في معالجة الملف")
+    
+    async def collect_media_group(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """تجميع عناصر الألبوم ثم رفعها كعملية واحدة من أول تحديث فقط"""
+        key = (update.effective_user.id, update.message.media_group_id)
+        updates = await self.media_groups.collect(key, update)
+        if updates:
+            await self.process_media_group(updates, context.bot)
+    
+    async def process_media_group(self, updates: list, bot):
+        """
+        رفع ألبوم كامل كعملية واحدة
+        
+        رسالة حالة واحدة ومكان واحد في قائمة الانتظار، ومجلد على Drive للألبوم،
+        والعناصر المرفوعة مسبقاً تُنسخ بطلب Drive مجمّع واحد، وبقية العناصر
+        تُنزّل وتُرفع بالتوازي (Drive لا يقبل رفع المحتوى ضمن الطلبات المجمّعة)
+        """
+        first = updates[0]
+        user_id = first.effective_user.id
+        media_group_id = first.message.media_group_id
+        max_size = self.get_max_file_size()
+        
+        items = []
+        skipped = 0
+        for update in sorted(updates, key=lambda u: u.message.message_id):
+            item = self.extract_media(update.message)
+            if item is None or item['file_size'] > max_size:
+                skipped += 1
+            else:
+                items.append(item)
+        
+        if not items:
+            await first.message.reply_text("❌ لا توجد ملفات قابلة للرفع في هذا الألبوم")
+            return
+        
+        loading_message = None
+        try:
+            loading_message = await first.message.reply_text(f"📤 جاري رفع ألبوم من {len(items)} ملفات...")
             
-            # الحصول على معلومات الملف
-            file = await context.bot.get_file(video.file_id)
+            async with self.upload_scheduler.slot(user_id, self.queue_notifier(loading_message)):
+                credentials = self.get_user_credentials(user_id)
+                
+                # العناصر المرسلة سابقاً لا يُعاد نقلها
+                existing = {}
+                if self.dedup_mode != 'off':
+                    for item in items:
+                        record = await self.run_db_io(self.upload_index.get, user_id, item['file_unique_id'])
+                        if record is not None:
+                            existing[item['file_unique_id']] = record
+                
+                destination = await self.destination_folder(user_id, first.message, 'album')
+                folder = await self.run_drive_io(
+                    self._create_folder_sync, user_id, credentials, f"album_{media_group_id}", destination
+                )
+                if folder is None:
+                    await loading_message.edit_text("❌ فشل في إنشاء مجلد الألبوم على Google Drive")
+                    return
+                
+                links = {}
+                if existing and self.dedup_mode == 'copy':
+                    names = {item['file_unique_id']: item['file_name'] for item in items}
+                    copies = await self.run_drive_io(
+                        self._batch_copy_sync,
+                        user_id,
+                        credentials,
+                        {key: (record['drive_file_id'], names[key]) for key, record in existing.items()},
+                        folder['id']
+                    )
+                    links.update(copies)
+                elif existing:
+                    links.update({key: record['web_link'] for key, record in existing.items()})
+                
+                # العناصر الجديدة (أو التي فشل نسخها) تُرفع بالتوازي مع عرض تقدم مشترك
+                pending = [item for item in items if not links.get(item['file_unique_id'])]
+                progress_key = ('album', media_group_id)
+                self.progress.start(
+                    progress_key,
+                    loading_message.edit_text,
+                    f"ألبوم ({len(items)} ملفات)",
+                    sum(item['file_size'] for item in pending)
+                )
+                try:
+                    results = await asyncio.gather(
+                        *(self.transfer_media(first, loading_message, bot, item, folder['id'], progress_key)
+                          for item in pending),
+                        return_exceptions=True
+                    )
+                finally:
+                    await self.progress.finish(progress_key)
+                
+                for item, result in zip(pending, results):
+                    if isinstance(result, Exception):
+                        logger.error(f"خطأ في رفع {item['file_name']} ضمن الألبوم: {result}")
+                        result = None
+                    links[item['file_unique_id']] = result
             
-            # تحديد ما إذا كان يجب استخدام ملف مؤقت
-            use_temp_file = video.file_size > 50 * 1024 * 1024  # 50 ميجابايت
+            uploaded = sum(1 for item in items if links.get(item['file_unique_id']))
+            lines = [
+                f"{'✅' if uploaded == len(items) else '⚠️'} تم رفع {uploaded} من {len(items)} ملفات الألبوم",
+                f"📁 المجلد: {folder.get('webViewLink', '')}",
+                ""
+            ]
+            for item in items:
+                link = links.get(item['file_unique_id'])
+                lines.append(f"✅ {item['file_name']}: {link}" if link else f"❌ {item['file_name']}")
+            if skipped:
+                lines.append(f"\n⚠️ تم تجاهل {skipped} عناصر (نوع غير مدعوم أو حجم كبير)")
             
-            # تنزيل الفيديو
-            file_data = await self.download_file_from_telegram(
-                file.file_path, 
-                video.file_size, 
-                use_temp_file
-            )
+            await loading_message.edit_text("\n".join(lines), disable_web_page_preview=True)
             
-            if not file_data:
-                await loading_message.edit_text("❌ فشل في تنزيل الفيديو")
-                return
+        except QueueFull:
+            await loading_message.edit_text("❌ لديك ملفات كثيرة قيد الانتظار. انتظر اكتمال رفعها ثم حاول مجدداً")
+        except Exception as e:
+            logger.error(f"خطأ في معالجة الألبوم: {e}")
+            await first.message.reply_text("❌ حدث خطأ في معالجة الألبوم")
+    
+    async def transfer_media(self, update: Update, loading_message, bot, item: dict, parent_id: str = None,
+                             progress_key=None) -> Optional[str]:
+        """
+        نقل ملف وسائط واحد إلى Drive بالمسار المناسب له
+        
+        الملفات المتاحة محلياً تُرفع دون تنزيل، والصغيرة تُنزّل إلى المخزن المؤقت،
+        والكبيرة (أو عند امتلاء المخزن) تُنقل مباشرة
+        
+        Args:
+            item: بيانات الملف من extract_media
+            parent_id: معرف مجلد الوجهة
+            progress_key: مفتاح رسالة تقدم مشتركة (ألبوم)؛ بدونه تُعرض حالة النقل في loading_message
             
-            # تحديث رسالة التحميل
-            await loading_message.edit_text("☁️ جاري رفع الفيديو إلى Google Drive...")
+        Returns:
+            رابط الملف في Drive أو None في حالة الفشل
+        """
+        user_id = update.effective_user.id
+        filename = item['file_name']
+        file_size = item['file_size']
+        file_unique_id = item['file_unique_id']
+        mime_type = item.get('mime_type')
+        label = item.get('label', 'الملف')
+        
+        async def status(text: str):
+            if progress_key is None:
+                await loading_message.edit_text(text)
+        
+        file = await self.get_telegram_file(bot, item['file_id'])
+        local_path = self.get_local_file_path(file.file_path)
+        
+        async with self.upload_job(
+            update, loading_message, item['file_id'], file_unique_id, filename, file_size, local_path,
+            parent_id=parent_id, progress_key=progress_key, mime_type=mime_type
+        ) as job_id:
+            if local_path:
+                await status(f"☁️ جاري رفع {label} إلى Google Drive...")
+                return await self.upload_local_file_to_drive(
+                    local_path, filename, user_id, file_unique_id, job_id, parent_id=parent_id, mime_type=mime_type
+                )
+            # الحجز بعد تسجيل العملية حتى لا يبقى محجوزاً إذا فشل التسجيل
+            spool = self.reserve_spool(file_size)
+            if spool is None:
+                await status(f"☁️ جاري نقل {label} مباشرة إلى Google Drive...")
+                return await self.stream_file_to_drive(
+                    file.file_path, filename, user_id, file_size, file_unique_id, job_id, parent_id=parent_id,
+                    mime_type=mime_type
+                )
             
-            # تحديد اسم الملف
-            filename = video.file_name or f"video_{video.file_unique_id}.mp4"
+            try:
+                file_data = await self.download_file_from_telegram(
+                    file.file_path, file_size, spool, job_id=job_id, user_id=user_id
+                )
+                if not file_data:
+                    return None
+                await status(f"☁️ جاري رفع {label} إلى Google Drive...")
+                return await self.upload_to_drive(
+                    file_data, filename, user_id, file_size, file_unique_id, job_id, parent_id=parent_id,
+                    mime_type=mime_type
+                )
+            finally:
+                # upload_to_drive يحرر المخزن عادةً، وهذا للخروج قبله (خطأ أو إلغاء)؛ التحرير مرة واحدة فقط
+                spool.release()
+    
+    def format_upload_result(self, item: dict, drive_link: str) -> str:
+        """رسالة نجاح الرفع حسب نوع الوسائط"""
+        file_size = item['file_size']
+        if file_size < 1024 * 1024:
+            size_text = f"{file_size / 1024:.1f} كيلوبايت"
+        else:
+            size_text = f"{file_size / (1024 * 1024):.2f} ميجابايت"
+        lines = [
+            f"✅ تم رفع {item.get('label', 'الملف')} بنجاح!",
+            "",
+            f"📁 اسم الملف: {item['file_name']}",
+            f"📊 الحجم: {size_text}",
+        ]
+        if item.get('duration'):
+            lines.append(f"⏱️ المدة: {item['duration']} ثانية")
+        lines.extend([
+            f"🔗 الرابط: {drive_link}",
+            "",
+            "💡 يمكنك الآن الوصول إلى الملف من Google Drive الخاص بك",
+        ])
+        return "\n".join(lines)
+    
+    async def handle_media(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """معالجة الوسائط المرسلة بكل أنواعها (المستندات والصور والفيديو والصوت والملصقات وغيرها)"""
+        user_id = update.effective_user.id
+        
+        # التحقق من ربط الحساب
+        if not self.get_user_credentials(user_id):
+            await update.message.reply_text("❌ يجب ربط حسابك أولاً باستخدام /auth")
+            return
+        
+        # في وضع الواجهة ينقل العمال الملف
+        if self.role == 'frontend':
+            await self.enqueue_upload(update)
+            return
+        
+        # عناصر الألبوم تُجمع وتُرفع كعملية واحدة
+        if update.message.media_group_id:
+            await self.collect_media_group(update, context)
+            return
+        
+        item = self.extract_media(update.message)
+        if item is None:
+            await update.message.reply_text("❌ لم يتم العثور على ملف")
+            return
+        label = item['label']
+        
+        # التحقق من حجم الملف
+        max_size = self.get_max_file_size()
+        if item['file_size'] > max_size:
+            max_size_mb = max_size / (1024 * 1024)
+            await update.message.reply_text(f"❌ حجم {label} كبير جداً (الحد الأقصى {max_size_mb:.0f} ميجابايت)")
+            return
+        
+        # الملفات المرسلة سابقاً لا يُعاد نقلها
+        if await self.reply_if_duplicate(update, user_id, item['file_unique_id'], item['file_name']):
+            return
+        
+        try:
+            loading_message = await update.message.reply_text(f"📤 جاري رفع {label}...")
             
-            # رفع الفيديو إلى Drive
-            drive_link = await self.upload_to_drive(file_data, filename, user_id, video.file_size)
+            # انتظار دور الملف في قائمة الرفع
+            async with self.upload_scheduler.slot(user_id, self.queue_notifier(loading_message)) as waited:
+                if waited:
+                    await loading_message.edit_text(f"📤 جاري رفع {label}...")
+                
+                # مجلد الوجهة حسب إعدادات المستخدم (من فهرس المجلدات عادة دون طلبات Drive)
+                parent_id = await self.destination_folder(user_id, update.message, item['kind'])
+                drive_link = await self.transfer_media(update, loading_message, context.bot, item, parent_id)
             
             if drive_link:
-                file_size_mb = video.file_size / (1024 * 1024)
-                duration = video.duration or 0
-                success_message = f"""
-✅ تم رفع الفيديو بنجاح!
-
-📁 اسم الملف: {filename}
-📊 الحجم: {file_size_mb:.2f} ميجابايت
-⏱️ المدة: {duration} ثانية
-🔗 الرابط: {drive_link}
-                """
-                await loading_message.edit_text(success_message, disable_web_page_preview=True)
+                await loading_message.edit_text(self.format_upload_result(item, drive_link), disable_web_page_preview=True)
             else:
-                await loading_message.edit_text("❌ فشل في رفع الفيديو إلى Google Drive")
-                
+                await loading_message.edit_text(f"❌ فشل في رفع {label} إلى Google Drive")
+            
+        except QueueFull:
+            await loading_message.edit_text("❌ لديك ملفات كثيرة قيد الانتظار. انتظر اكتمال رفعها ثم حاول مجدداً")
         except Exception as e:
-            logger.error(f"خطأ في معالجة الفيديو: {e}")
-            await update.message.reply_text("❌ حدث خطأ في معالجة الفيديو")
+            logger.error(f"خطأ في معالجة {label}: {e}")
+            await update.message.reply_text(f"❌ حدث خطأ في معالجة {label}")
     
-    def run(self):
-        """تشغيل البوت"""
+    def build_application(self) -> Application:
+        """إنشاء تطبيق تيليجرام وتسجيل المعالجات"""
         # إنشاء التطبيق مع إعداد خادم Bot API المخصص
+        # معالجة التحديثات بشكل متوازٍ حتى لا يحجب رفع طويل بقية الأوامر
+        builder = Application.builder().token(self.telegram_token).concurrent_updates(True)
+        builder = builder.post_init(self.post_init).post_shutdown(self.post_shutdown)
         if self.bot_api_server != "https://api.telegram.org":
-            application = Application.builder().token(self.telegram_token).base_url(f"{self.bot_api_server}/bot").build()
-        else:
-            application = Application.builder().token(self.telegram_token).build()
+            builder = builder.base_url(f"{self.bot_api_server}/bot").base_file_url(f"{self.bot_api_server}/file/bot")
+            builder = builder.local_mode(self.local_mode)
+        if self.webhook_url:
+            # التحديثات تصل عبر خادم webhook المدمج فلا حاجة إلى Updater
+            builder = builder.updater(None)
+        application = builder.build()
+        
+        # قياس زمن وصول التحديثات قبل بقية المعالجات
+        application.add_handler(TypeHandler(Update, self.track_update_latency), group=-1)
         
         # إضافة معالجات الأوامر
         application.add_handler(CommandHandler("start", self.start_command))
@@ -533,21 +2152,130 @@ class TelegramDriveBotLargeFiles:
         application.add_handler(CommandHandler("auth", self.auth_command))
         application.add_handler(CommandHandler("status", self.status_command))
         application.add_handler(CommandHandler("info", self.info_command))
+        application.add_handler(CommandHandler("folder", self.folder_command))
+        application.add_handler(CommandHandler("organize", self.organize_command))
         
         # معالج رموز التفويض (نص عادي)
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_auth_code))
         
-        # معالجات الملفات
-        application.add_handler(MessageHandler(filters.Document.ALL, self.handle_document))
-        application.add_handler(MessageHandler(filters.PHOTO, self.handle_photo))
-        application.add_handler(MessageHandler(filters.VIDEO, self.handle_video))
+        # معالج واحد لكل أنواع الوسائط
+        media_filter = (
+            filters.Document.ALL | filters.PHOTO | filters.VIDEO | filters.AUDIO | filters.VOICE
+            | filters.VIDEO_NOTE | filters.ANIMATION | filters.Sticker.ALL
+        )
+        application.add_handler(MessageHandler(media_filter, self.handle_media))
+        
+        return application
+    
+    async def run_webhook(self, application: Application, allowed_updates: list):
+        """تشغيل البوت بوضع webhook حتى استلام إشارة الإيقاف"""
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass
+        
+        server = WebhookServer(
+            application,
+            listen=self.webhook_listen,
+            port=self.webhook_port,
+            path=self.webhook_path,
+            secret_token=self.webhook_secret
+        )
+        
+        await application.initialize()
+        await self.post_init(application)
+        try:
+            await server.start()
+            await application.bot.set_webhook(
+                url=f"{self.webhook_url}{self.webhook_path}",
+                allowed_updates=allowed_updates,
+                secret_token=self.webhook_secret,
+                max_connections=min(100, self.http_pool_size)
+            )
+            await application.start()
+            await stop_event.wait()
+        finally:
+            # لا يُحذف webhook عند الإيقاف حتى يحتفظ Telegram بالتحديثات إلى أن يعود البوت
+            if application.running:
+                await application.stop()
+            await server.stop()
+            await application.shutdown()
+            await self.post_shutdown(application)
+    
+    def build_bot(self) -> Bot:
+        """إنشاء عميل Bot API للعمال (لا يستقبل تحديثات)"""
+        if self.bot_api_server != "https://api.telegram.org":
+            return Bot(
+                self.telegram_token,
+                base_url=f"{self.bot_api_server}/bot",
+                base_file_url=f"{self.bot_api_server}/file/bot",
+                local_mode=self.local_mode
+            )
+        return Bot(self.telegram_token)
+    
+    async def run_worker(self):
+        """تشغيل عامل نقل يسحب العمليات من قائمة الانتظار حتى استلام إشارة الإيقاف"""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.worker.stop)
+            except NotImplementedError:
+                pass
+        
+        bot = self.build_bot()
+        await bot.initialize()
+        await self.get_http_session()
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        try:
+            await self.worker.run(bot)
+        finally:
+            await bot.shutdown()
+            await self.post_shutdown(None)
+    
+    def run(self):
+        """تشغيل البوت"""
+        # حذف الملفات المؤقتة التي تركتها عملية سابقة توقفت فجأة
+        self.spool.sweep()
+        
+        if self.role == 'worker':
+            logger.info(f"بدء عامل النقل {self.worker.worker_id}")
+            logger.info(f"خادم Bot API: {self.bot_api_server}")
+            try:
+                asyncio.run(self.run_worker())
+            finally:
+                self.drive_executor.shutdown(wait=False, cancel_futures=True)
+                self.db_executor.shutdown(wait=False)
+            return
+        
+        application = self.build_application()
+        
+        # الاشتراك فقط في أنواع التحديثات التي توجد لها معالجات
+        allowed_updates = allowed_updates_for(application)
         
         # تشغيل البوت
         logger.info("بدء تشغيل البوت...")
         logger.info(f"خادم Bot API: {self.bot_api_server}")
         logger.info(f"الحد الأقصى للملف: {self.get_max_file_size() / (1024 * 1024):.0f} ميجابايت")
+        logger.info(f"عدد خيوط Google Drive: {self.max_workers}")
+        logger.info(f"أنواع التحديثات المطلوبة: {', '.join(allowed_updates)}")
+        if self.local_mode:
+            logger.info("الوضع المحلي مفعّل: سيتم رفع الملفات مباشرة من مجلد خادم Bot API")
+        if self.role == 'frontend':
+            logger.info("وضع الواجهة: تُضاف الملفات إلى قائمة الانتظار وينقلها العمال")
         
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        try:
+            if self.webhook_url:
+                logger.info(f"وضع webhook: {self.webhook_url}{self.webhook_path}")
+                asyncio.run(self.run_webhook(application, allowed_updates))
+            else:
+                application.run_polling(allowed_updates=allowed_updates)
+        finally:
+            self.drive_executor.shutdown(wait=False, cancel_futures=True)
+            self.db_executor.shutdown(wait=False)
 
 def main():
     """الدالة الرئيسية"""
@@ -555,6 +2283,53 @@ def main():
     telegram_token = os.getenv('TELEGRAM_BOT_TOKEN')
     google_credentials_file = os.getenv('GOOGLE_CREDENTIALS_FILE', 'credentials.json')
     bot_api_server = os.getenv('BOT_API_SERVER', 'https://api.telegram.org')
+    max_workers = int(os.getenv('MAX_WORKERS', '4'))
+    local_mode = os.getenv('TELEGRAM_LOCAL', 'false').lower() in ('1', 'true', 'yes')
+    http_pool_size = int(os.getenv('HTTP_POOL_SIZE', '32'))
+    max_concurrent_uploads = int(os.getenv('MAX_CONCURRENT_UPLOADS', str(max_workers)))
+    max_uploads_per_user = int(os.getenv('MAX_UPLOADS_PER_USER', '2'))
+    max_queued_per_user = int(os.getenv('MAX_QUEUED_PER_USER', '20'))
+    db_path = os.getenv('BOT_DB_PATH', 'bot_state.db')
+    dedup_mode = os.getenv('DEDUP_MODE', 'link')
+    chunk_size_mb = int(os.getenv('DRIVE_CHUNK_SIZE_MB', '8'))
+    max_chunk_size_mb = int(os.getenv('DRIVE_MAX_CHUNK_SIZE_MB', '32'))
+    adaptive_chunks = os.getenv('ADAPTIVE_CHUNK_SIZE', 'true').lower() in ('1', 'true', 'yes')
+    progress_interval = float(os.getenv('PROGRESS_INTERVAL', '3'))
+    progress_edits_per_minute = int(os.getenv('PROGRESS_EDITS_PER_MINUTE', '120'))
+    media_group_window = float(os.getenv('MEDIA_GROUP_WINDOW', '1.0'))
+    webhook_url = os.getenv('WEBHOOK_URL') or None
+    webhook_listen = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+    webhook_port = int(os.getenv('WEBHOOK_PORT', '8443'))
+    webhook_path = os.getenv('WEBHOOK_PATH', '/telegram')
+    webhook_secret = os.getenv('WEBHOOK_SECRET') or None
+    role = os.getenv('BOT_ROLE', 'all').lower()
+    worker_id = os.getenv('WORKER_ID') or None
+    worker_concurrency = int(os.getenv('WORKER_CONCURRENCY', str(max_workers)))
+    job_lease_seconds = float(os.getenv('JOB_LEASE_SECONDS', '60'))
+    metrics_port = int(os.getenv('METRICS_PORT', '0')) or None
+    metrics_listen = os.getenv('METRICS_LISTEN', '127.0.0.1')
+    retry_attempts = int(os.getenv('RETRY_MAX_ATTEMPTS', '5'))
+    retry_base_delay = float(os.getenv('RETRY_BASE_DELAY', '1'))
+    retry_max_delay = float(os.getenv('RETRY_MAX_DELAY', '60'))
+    drive_user_rate = float(os.getenv('DRIVE_USER_RATE', '10'))
+    drive_user_burst = int(os.getenv('DRIVE_USER_BURST', '20'))
+    drive_client_rate = float(os.getenv('DRIVE_CLIENT_RATE', '100'))
+    drive_client_burst = int(os.getenv('DRIVE_CLIENT_BURST', '200'))
+    # الحدود بالميجابت في الثانية وتُحوّل إلى بايت/ث
+    bandwidth_limit = float(os.getenv('BANDWIDTH_LIMIT_MBPS', '0')) * 1000 * 1000 / 8
+    user_bandwidth_limit = float(os.getenv('USER_BANDWIDTH_LIMIT_MBPS', '0')) * 1000 * 1000 / 8
+    verify_checksums = os.getenv('VERIFY_CHECKSUMS', 'true').lower() in ('1', 'true', 'yes')
+    checksum_sha256 = os.getenv('CHECKSUM_SHA256', 'false').lower() in ('1', 'true', 'yes')
+    download_connections = int(os.getenv('DOWNLOAD_CONNECTIONS', '4'))
+    download_segment_size = int(os.getenv('DOWNLOAD_SEGMENT_MB', '4')) * 1024 * 1024
+    drive_folder_id = os.getenv('GOOGLE_DRIVE_FOLDER_ID') or None
+    folder_layout = os.getenv('DRIVE_FOLDER_LAYOUT', '')
+    folder_cache_ttl = float(os.getenv('DRIVE_FOLDER_CACHE_TTL', '3600'))
+    spool_dir = os.getenv('SPOOL_DIR') or None
+    spool_disk_budget = int(os.getenv('SPOOL_DISK_MB', '4096')) * 1024 * 1024
+    spool_memory_budget = int(os.getenv('SPOOL_MEMORY_MB', '256')) * 1024 * 1024
+    spool_memory_file_limit = int(os.getenv('SPOOL_MEMORY_FILE_MB', '20')) * 1024 * 1024
+    memory_budget = int(os.getenv('MEMORY_BUDGET_MB', '512')) * 1024 * 1024
     
     if not telegram_token:
         print("❌ خطأ: لم يتم تعيين TELEGRAM_BOT_TOKEN")
@@ -565,7 +2340,57 @@ def main():
         return
     
     # إنشاء وتشغيل البوت
-    bot = TelegramDriveBotLargeFiles(telegram_token, google_credentials_file, bot_api_server)
+    bot = TelegramDriveBotLargeFiles(
+        telegram_token,
+        google_credentials_file,
+        bot_api_server,
+        max_workers=max_workers,
+        local_mode=local_mode,
+        http_pool_size=http_pool_size,
+        max_concurrent_uploads=max_concurrent_uploads,
+        max_uploads_per_user=max_uploads_per_user,
+        max_queued_per_user=max_queued_per_user,
+        db_path=db_path,
+        dedup_mode=dedup_mode,
+        chunk_size=chunk_size_mb * 1024 * 1024,
+        max_chunk_size=max_chunk_size_mb * 1024 * 1024,
+        adaptive_chunks=adaptive_chunks,
+        progress_interval=progress_interval,
+        progress_edits_per_minute=progress_edits_per_minute,
+        media_group_window=media_group_window,
+        webhook_url=webhook_url,
+        webhook_listen=webhook_listen,
+        webhook_port=webhook_port,
+        webhook_path=webhook_path,
+        webhook_secret=webhook_secret,
+        role=role,
+        worker_id=worker_id,
+        worker_concurrency=worker_concurrency,
+        job_lease_seconds=job_lease_seconds,
+        metrics_port=metrics_port,
+        metrics_listen=metrics_listen,
+        retry_attempts=retry_attempts,
+        retry_base_delay=retry_base_delay,
+        retry_max_delay=retry_max_delay,
+        drive_user_rate=drive_user_rate,
+        drive_user_burst=drive_user_burst,
+        drive_client_rate=drive_client_rate,
+        drive_client_burst=drive_client_burst,
+        bandwidth_limit=bandwidth_limit,
+        user_bandwidth_limit=user_bandwidth_limit,
+        verify_checksums=verify_checksums,
+        checksum_sha256=checksum_sha256,
+        download_connections=download_connections,
+        download_segment_size=download_segment_size,
+        drive_folder_id=drive_folder_id,
+        folder_layout=folder_layout,
+        folder_cache_ttl=folder_cache_ttl,
+        spool_dir=spool_dir,
+        spool_disk_budget=spool_disk_budget,
+        spool_memory_budget=spool_memory_budget,
+        spool_memory_file_limit=spool_memory_file_limit,
+        memory_budget=memory_budget
+    )
     bot.run()
 
 if __name__ == '__main__':
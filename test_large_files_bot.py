@@ -3,10 +3,12 @@
 سكريبت اختبار البوت مع دعم الملفات الكبيرة
 """
 
+import io
 import os
 import sys
 import tempfile
 import asyncio
+from types import SimpleNamespace
 from unittest.mock import Mock
 
 def test_imports():
@@ -267,6 +269,2029 @@ def test_large_file_simulation():
         print(f"❌ خطأ في محاكاة الملف الكبير: {e}")
         return False
 
+def test_drive_executor_responsiveness():
+    """اختبار بقاء حلقة الأحداث مستجيبة أثناء عمليات رفع متزامنة"""
+    print("\n⚡ اختبار استجابة البوت أثناء الرفع المتوازي...")
+    
+    try:
+        import time
+        sys.path.append('/home/ubuntu')
+        from telegram_drive_bot_large_files import TelegramDriveBotLargeFiles
+        
+        temp_dir = tempfile.TemporaryDirectory()
+        bot = TelegramDriveBotLargeFiles(
+            "test", "test", "http://localhost:8081", max_workers=4, db_path=os.path.join(temp_dir.name, 'state.db')
+        )
+        
+        # محاكاة رفع متزامن يحجب الخيط لمدة نصف ثانية
+        def blocking_upload(file_data, filename, user_id, credentials, **kwargs):
+            time.sleep(0.5)
+            return {'webViewLink': f'https://drive.google.com/{filename}'}
+        
+        bot._upload_to_drive_sync = blocking_upload
+        for user_id in range(4):
+            bot.user_credentials[user_id] = {'credentials': Mock(valid=True)}
+        
+        async def measure():
+            latencies = []
+            
+            # محاكاة أمر /status: مهمة خفيفة تقيس تأخر حلقة الأحداث
+            async def ticker():
+                for _ in range(20):
+                    start = time.perf_counter()
+                    await asyncio.sleep(0.02)
+                    latencies.append(time.perf_counter() - start - 0.02)
+            
+            # ملف جديد أثناء انشغال كل خيوط Drive: البحث في الفهرس والإعدادات لا ينتظر الرفع
+            async def new_file():
+                await asyncio.sleep(0.1)
+                start = time.perf_counter()
+                await bot.find_existing_upload(0, "new-file", "new.bin")
+                await bot.run_db_io(bot.user_settings.get, 0)
+                return time.perf_counter() - start
+            
+            start = time.perf_counter()
+            uploads = [bot.upload_to_drive(None, f"file_{i}", i) for i in range(4)]
+            results = await asyncio.gather(ticker(), new_file(), *uploads)
+            return latencies, results[1], results[2:], time.perf_counter() - start
+        
+        latencies, lookup_time, links, elapsed = asyncio.run(measure())
+        bot.drive_executor.shutdown()
+        bot.upload_index.close()
+        bot.user_settings.close()
+        temp_dir.cleanup()
+        
+        max_latency_ms = max(latencies) * 1000
+        print(f"✅ أقصى تأخر لحلقة الأحداث: {max_latency_ms:.1f} مللي ثانية")
+        print(f"✅ زمن 4 عمليات رفع متوازية: {elapsed:.2f} ثانية")
+        
+        if None in links or max_latency_ms > 100 or elapsed > 1.5:
+            print("❌ الرفع يحجب حلقة الأحداث أو لا يعمل بالتوازي")
+            return False
+        if lookup_time > 0.2:
+            print(f"❌ البحث في الفهرس انتظر انتهاء الرفع: {lookup_time:.2f} ثانية")
+            return False
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار استجابة البوت - خطأ: {e}")
+        return False
+
+def test_streaming_pipe():
+    """اختبار النقل المباشر عبر أنبوب محدود دون ملف مؤقت"""
+    print("\n🔀 اختبار النقل المباشر من التنزيل إلى الرفع...")
+    
+    try:
+        import hashlib
+        import threading
+        sys.path.append('/home/ubuntu')
+        from transfer_pipeline import StreamingPipe, StreamingMediaUpload
+        
+        chunk_size = 256 * 1024
+        payload = os.urandom(5 * 1024 * 1024 + 12345)
+        
+        async def transfer():
+            pipe = StreamingPipe(2 * chunk_size)
+            media = StreamingMediaUpload(pipe, len(payload), chunksize=chunk_size)
+            received = hashlib.md5()
+            peak = [0]
+            
+            # محاكاة حلقة next_chunk: الخادم يؤكد أحياناً جزءاً فقط من البيانات المرسلة
+            def consume():
+                progress = 0
+                partial = True
+                while True:
+                    data = media.getbytes(progress, media.chunksize())
+                    peak[0] = max(peak[0], len(pipe._buffer))
+                    acked = len(data) // 2 if partial and len(data) == chunk_size else len(data)
+                    partial = not partial
+                    received.update(data[:acked])
+                    progress += acked
+                    if len(data) < chunk_size and acked == len(data):
+                        return progress
+            
+            consumer = asyncio.get_running_loop().run_in_executor(None, consume)
+            for offset in range(0, len(payload), 64 * 1024):
+                await pipe.write(payload[offset:offset + 64 * 1024])
+            pipe.close()
+            total = await consumer
+            return total, received.hexdigest(), peak[0]
+        
+        total, digest, peak = asyncio.run(transfer())
+        
+        if total != len(payload) or digest != hashlib.md5(payload).hexdigest():
+            print("❌ البيانات المرفوعة لا تطابق البيانات المنزلة")
+            return False
+        if peak > 2 * chunk_size:
+            print(f"❌ تجاوز المخزن الحد المسموح: {peak} بايت")
+            return False
+        
+        print(f"✅ تم نقل {total} بايت بأقصى مخزن {peak / 1024:.0f} كيلوبايت")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار النقل المباشر - خطأ: {e}")
+        return False
+
+def test_local_file_mode():
+    """اختبار رفع الملفات مباشرة من مجلد خادم Bot API المحلي"""
+    print("\n📂 اختبار الوضع المحلي دون تنزيل عبر HTTP...")
+    
+    try:
+        sys.path.append('/home/ubuntu')
+        from telegram_drive_bot_large_files import TelegramDriveBotLargeFiles
+        
+        test_file_path = create_test_file(1)
+        bot = TelegramDriveBotLargeFiles("test", "test", "http://localhost:8081", local_mode=True)
+        
+        if bot.get_local_file_path(test_file_path) != test_file_path:
+            print("❌ لم يتم اكتشاف الملف المحلي")
+            return False
+        if bot.get_local_file_path("documents/file_0.pdf") is not None:
+            print("❌ تم اعتبار مسار نسبي ملفاً محلياً")
+            return False
+        
+        uploaded = {}
+        
+        def fake_upload(media, filename, user_id, credentials, **kwargs):
+            uploaded['size'] = media.size()
+            return {'webViewLink': f'https://drive.google.com/{filename}'}
+        
+        bot._upload_to_drive_sync = fake_upload
+        bot.user_credentials[1] = {'credentials': Mock(valid=True)}
+        link = asyncio.run(bot.upload_local_file_to_drive(test_file_path, "local.bin", 1))
+        bot.drive_executor.shutdown()
+        
+        # يجب ألا يُحذف ملف خادم Bot API بعد الرفع
+        still_exists = os.path.exists(test_file_path)
+        os.unlink(test_file_path)
+        
+        if not link or uploaded.get('size') != 1024 * 1024 or not still_exists:
+            print("❌ فشل الرفع المباشر من الملف المحلي")
+            return False
+        
+        print("✅ تم رفع الملف المحلي دون نسخه أو حذفه")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار الوضع المحلي - خطأ: {e}")
+        return False
+
+def test_drive_service_cache():
+    """قياس تكلفة إنشاء خدمة Drive لكل ملف قبل وبعد الذاكرة المؤقتة"""
+    print("\n🗄️ اختبار الذاكرة المؤقتة لخدمات Drive...")
+    
+    try:
+        import time
+        sys.path.append('/home/ubuntu')
+        from google.oauth2.credentials import Credentials
+        from googleapiclient.discovery import build
+        from drive_services import DriveServiceCache
+        
+        credentials = Credentials(token="test-token")
+        iterations = 20
+        
+        # قبل: build لكل ملف كما كان البوت يفعل
+        start = time.perf_counter()
+        for _ in range(iterations):
+            build('drive', 'v3', credentials=credentials)
+        before_ms = (time.perf_counter() - start) / iterations * 1000
+        
+        # بعد: خدمة واحدة يعاد استخدامها لنفس المستخدم
+        cache = DriveServiceCache(max_users=2)
+        start = time.perf_counter()
+        services = set()
+        for _ in range(iterations):
+            with cache.service(1, credentials) as service:
+                services.add(id(service))
+        after_ms = (time.perf_counter() - start) / iterations * 1000
+        
+        print(f"✅ تكلفة الخدمة لكل ملف: {before_ms:.2f} مللي ثانية ← {after_ms:.3f} مللي ثانية")
+        
+        if len(services) != 1:
+            print("❌ لم يتم إعادة استخدام الخدمة")
+            return False
+        
+        # إعادة الربط ببيانات اعتماد جديدة تتطلب خدمة جديدة
+        with cache.service(1, Credentials(token="new-token")) as service:
+            if id(service) in services:
+                print("❌ تم استخدام خدمة ببيانات اعتماد قديمة")
+                return False
+        
+        # حذف الأقدم استخداماً عند تجاوز الحد
+        for user_id in (2, 3):
+            with cache.service(user_id, credentials):
+                pass
+        if len(cache) != 2:
+            print("❌ لم يتم حذف المستخدم الأقدم من الذاكرة المؤقتة")
+            return False
+        
+        return after_ms < before_ms
+        
+    except Exception as e:
+        print(f"❌ اختبار الذاكرة المؤقتة لخدمات Drive - خطأ: {e}")
+        return False
+
+def test_shared_http_session():
+    """قياس زمن تنزيل الصور الصغيرة بجلسة HTTP مشتركة مقارنة بجلسة لكل ملف"""
+    print("\n🔌 اختبار جلسة HTTP المشتركة...")
+    
+    try:
+        import io
+        import time
+        import aiohttp
+        from aiohttp import web
+        sys.path.append('/home/ubuntu')
+        from telegram_drive_bot_large_files import TelegramDriveBotLargeFiles
+        
+        photo = os.urandom(100 * 1024)
+        
+        async def measure():
+            # خادم ملفات محلي يحاكي نقطة /file في Bot API
+            async def serve_file(request):
+                return web.Response(body=photo)
+            
+            app = web.Application()
+            app.router.add_get('/file/{tail:.*}', serve_file)
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            server = f"http://127.0.0.1:{port}"
+            
+            bot = TelegramDriveBotLargeFiles("test", "test", server, http_pool_size=4)
+            count = 50
+            
+            # قبل: جلسة جديدة لكل ملف (اتصال TCP جديد في كل مرة)
+            start = time.perf_counter()
+            for i in range(count):
+                async with aiohttp.ClientSession() as session:
+                    async with session.get(bot.get_file_url(f"photos/{i}.jpg")) as response:
+                        io.BytesIO(await response.read())
+            before_ms = (time.perf_counter() - start) / count * 1000
+            
+            # بعد: الجلسة المشتركة للبوت
+            await bot.post_init(Mock())
+            start = time.perf_counter()
+            results = []
+            for i in range(count):
+                results.append(await bot.download_file_from_telegram(f"photos/{i}.jpg", len(photo)))
+            after_ms = (time.perf_counter() - start) / count * 1000
+            await bot.post_shutdown(Mock())
+            
+            await runner.cleanup()
+            bot.drive_executor.shutdown()
+            return before_ms, after_ms, results
+        
+        before_ms, after_ms, results = asyncio.run(measure())
+        print(f"✅ زمن تنزيل الصورة: {before_ms:.2f} مللي ثانية ← {after_ms:.2f} مللي ثانية")
+        
+        if any(r is None or r.memory.getvalue() != photo for r in results):
+            print("❌ فشل التنزيل عبر الجلسة المشتركة")
+            return False
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار جلسة HTTP المشتركة - خطأ: {e}")
+        return False
+
+def test_upload_scheduler():
+    """اختبار قائمة انتظار الرفع: حدود التوازي والتناوب العادل والضغط العكسي"""
+    print("\n🚦 اختبار جدولة عمليات الرفع...")
+    
+    try:
+        sys.path.append('/home/ubuntu')
+        from job_scheduler import UploadScheduler, QueueFull
+        
+        async def run():
+            scheduler = UploadScheduler(max_concurrent=2, per_user_concurrent=1, max_queued_per_user=4)
+            order = []
+            positions = {}
+            peak = {'total': 0, 'per_user': {}}
+            running = {}
+            
+            async def upload(user_id, index):
+                async def on_queued(position):
+                    positions[(user_id, index)] = position
+                
+                async with scheduler.slot(user_id, on_queued):
+                    running[user_id] = running.get(user_id, 0) + 1
+                    peak['total'] = max(peak['total'], scheduler.active)
+                    peak['per_user'][user_id] = max(peak['per_user'].get(user_id, 0), running[user_id])
+                    order.append(user_id)
+                    await asyncio.sleep(0.01)
+                    running[user_id] -= 1
+            
+            # المستخدم 1 يرسل 5 ملفات دفعة واحدة ثم يرسل المستخدمان 2 و3 ملفاً لكل منهما
+            tasks = [asyncio.ensure_future(upload(1, i)) for i in range(5)]
+            await asyncio.sleep(0)
+            tasks += [asyncio.ensure_future(upload(2, 0)), asyncio.ensure_future(upload(3, 0))]
+            await asyncio.sleep(0)
+            
+            # الملف السادس للمستخدم 1 يتجاوز حد الانتظار
+            rejected = False
+            try:
+                await scheduler.acquire(1)
+            except QueueFull:
+                rejected = True
+            
+            await asyncio.gather(*tasks)
+            return order, positions, peak, rejected
+        
+        order, positions, peak, rejected = asyncio.run(run())
+        
+        if peak['total'] > 2 or any(v > 1 for v in peak['per_user'].values()):
+            print(f"❌ تم تجاوز حدود التوازي: {peak}")
+            return False
+        # يجب أن يبدأ ملفا المستخدمين 2 و3 قبل انتهاء ملفات المستخدم 1
+        if order.index(2) > 2 or order.index(3) > 3:
+            print(f"❌ التناوب بين المستخدمين غير عادل: {order}")
+            return False
+        if not rejected or not positions:
+            print("❌ لم يتم تطبيق الضغط العكسي أو الإبلاغ بالترتيب")
+            return False
+        
+        print(f"✅ ترتيب التنفيذ: {order}")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار جدولة الرفع - خطأ: {e}")
+        return False
+
+def test_credential_store():
+    """اختبار بقاء بيانات الاعتماد بعد إعادة تشغيل البوت وفهرسة أوقات انتهائها"""
+    print("\n🔑 اختبار المخزن الدائم لبيانات الاعتماد...")
+    
+    try:
+        import threading
+        import time
+        from datetime import datetime, timedelta
+        sys.path.append('/home/ubuntu')
+        from google.oauth2.credentials import Credentials
+        from telegram_drive_bot_large_files import TelegramDriveBotLargeFiles
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = os.path.join(temp_dir, 'state.db')
+            
+            bot = TelegramDriveBotLargeFiles("test", "test", db_path=db_path)
+            if os.path.exists(db_path):
+                print("❌ تم إنشاء قاعدة البيانات قبل الحاجة إليها")
+                return False
+            
+            soon = datetime.utcnow() + timedelta(minutes=5)
+            later = datetime.utcnow() + timedelta(hours=1)
+            for user_id, expiry in ((1, soon), (2, later)):
+                credentials = Credentials(
+                    token=f"token-{user_id}",
+                    refresh_token="refresh",
+                    token_uri="https://oauth2.googleapis.com/token",
+                    client_id="client",
+                    client_secret="secret",
+                    expiry=expiry
+                )
+                bot.credential_store.save(user_id, credentials)
+            bot.credential_store.close()
+            
+            # محاكاة إعادة التشغيل: بوت جديد يقرأ من نفس قاعدة البيانات
+            restarted = TelegramDriveBotLargeFiles("test", "test", db_path=db_path)
+            loaded = restarted.get_user_credentials(1)
+            expiring = restarted.credential_store.expiring_before(time.time() + 15 * 60)
+            missing = restarted.get_user_credentials(3)
+            restarted.credential_store.close()
+            
+            if loaded is None or loaded.token != "token-1" or loaded.refresh_token != "refresh":
+                print("❌ لم يتم تحميل بيانات الاعتماد بعد إعادة التشغيل")
+                return False
+            if expiring != [1] or missing is not None:
+                print(f"❌ فهرسة أوقات الانتهاء غير صحيحة: {expiring}")
+                return False
+            
+            # تحديث بطيء لرمز مستخدم لا يوقف تحديث رمز غيره، ولا يُحدّث الرمز مرتين
+            release = threading.Event()
+            refreshed = []
+            
+            def make_credentials(user_id, delay_event=None):
+                credentials = Mock(valid=False, refresh_token="refresh", expiry=None)
+                
+                def refresh(request):
+                    refreshed.append(user_id)
+                    if delay_event is not None:
+                        delay_event.wait(5)
+                    credentials.valid = True
+                
+                credentials.refresh.side_effect = refresh
+                return credentials
+            
+            restarted.credential_store.save = lambda user_id, credentials: None
+            slow = make_credentials(1, release)
+            threads = [
+                threading.Thread(target=restarted.ensure_fresh_credentials, args=(1, slow)) for _ in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            time.sleep(0.1)
+            started = time.monotonic()
+            other_ok = restarted.ensure_fresh_credentials(2, make_credentials(2))
+            other_time = time.monotonic() - started
+            release.set()
+            for thread in threads:
+                thread.join()
+            
+            if not other_ok or other_time > 0.5 or sorted(refreshed) != [1, 2]:
+                print(f"❌ تحديث الرموز يحجب المستخدمين الآخرين: {other_time:.2f} ثانية، {refreshed}")
+                return False
+        
+        print("✅ بيانات الاعتماد محفوظة ويتم تحديد الرموز القريبة من الانتهاء")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار المخزن الدائم لبيانات الاعتماد - خطأ: {e}")
+        return False
+
+def test_upload_dedup():
+    """اختبار عدم إعادة رفع ملف أُرسل مسبقاً حسب file_unique_id"""
+    print("\n♻️ اختبار تجنب رفع الملفات المكررة...")
+    
+    try:
+        sys.path.append('/home/ubuntu')
+        from telegram_drive_bot_large_files import TelegramDriveBotLargeFiles
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = os.path.join(temp_dir, 'state.db')
+            bot = TelegramDriveBotLargeFiles("test", "test", db_path=db_path)
+            bot.user_credentials[1] = {'credentials': Mock(valid=True)}
+            
+            uploads = []
+            
+            def fake_service(user_id, credentials):
+                class FakeRequest:
+                    resumable_progress = 0
+                    
+                    def next_chunk(self):
+                        uploads.append(user_id)
+                        return None, {'id': 'drive-1', 'webViewLink': 'https://drive.google.com/drive-1'}
+                
+                service = Mock()
+                service.files.return_value.create.return_value = FakeRequest()
+                service.files.return_value.copy.return_value.execute.return_value = {
+                    'id': 'drive-2', 'webViewLink': 'https://drive.google.com/drive-2'
+                }
+                
+                class Context:
+                    def __enter__(self):
+                        return service
+                    
+                    def __exit__(self, *exc):
+                        return False
+                
+                fake_service.service = service
+                return Context()
+            
+            bot.drive_services.service = fake_service
+            bot.ensure_fresh_credentials = lambda user_id, credentials, margin=0: True
+            
+            async def scenario():
+                first = await bot.upload_to_drive(io.BytesIO(b"data"), "a.bin", 1, 4, "unique-a")
+                linked = await bot.find_existing_upload(1, "unique-a", "a.bin")
+                other_user = await bot.find_existing_upload(2, "unique-a", "a.bin")
+                bot.dedup_mode = 'copy'
+                copied = await bot.find_existing_upload(1, "unique-a", "a.bin")
+                bot.dedup_mode = 'off'
+                disabled = await bot.find_existing_upload(1, "unique-a", "a.bin")
+                return first, linked, other_user, copied, disabled
+            
+            first, linked, other_user, copied, disabled = asyncio.run(scenario())
+            bot.drive_executor.shutdown()
+            bot.upload_index.close()
+            
+            if first != linked or len(uploads) != 1:
+                print(f"❌ لم يتم إرجاع الرابط الموجود: {linked}")
+                return False
+            if other_user is not None or disabled is not None:
+                print("❌ الفهرس يجب أن يكون خاصاً بكل مستخدم وقابلاً للتعطيل")
+                return False
+            if copied != 'https://drive.google.com/drive-2':
+                print(f"❌ لم يتم النسخ من جهة الخادم: {copied}")
+                return False
+        
+        print("✅ الملفات المكررة تُعاد روابطها دون إعادة النقل")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار تجنب رفع الملفات المكررة - خطأ: {e}")
+        return False
+
+def test_resumable_jobs():
+    """اختبار متابعة عمليات الرفع غير المكتملة بعد إعادة تشغيل البوت"""
+    print("\n🔁 اختبار متابعة الرفع بعد إعادة التشغيل...")
+    
+    try:
+        from unittest.mock import AsyncMock
+        sys.path.append('/home/ubuntu')
+        from telegram_drive_bot_large_files import TelegramDriveBotLargeFiles
+        from transfer_pipeline import StreamingPipe, StreamingMediaUpload
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = os.path.join(temp_dir, 'state.db')
+            local_path = os.path.join(temp_dir, 'big.bin')
+            file_size = 1024 * 1024
+            with open(local_path, 'wb') as f:
+                f.write(os.urandom(file_size))
+            
+            # عملية رفع توقفت بعد أن أكد Drive استلام أول 256 كيلوبايت
+            bot = TelegramDriveBotLargeFiles("test", "test", db_path=db_path)
+            job_id = bot.job_store.create(1, 10, 20, "file-id", "unique-id", "big.bin", file_size, local_path)
+            bot.job_store.update_session(job_id, "https://upload.example/session", 256 * 1024)
+            bot.job_store.close()
+            
+            # بعد إعادة التشغيل: الخادم يؤكد 512 كيلوبايت (جزء أُرسل قبل التوقف مباشرة)
+            restarted = TelegramDriveBotLargeFiles("test", "test", db_path=db_path)
+            restarted.user_credentials[1] = {'credentials': Mock(valid=True)}
+            restarted._query_upload_status_sync = lambda user_id, credentials, uri, size: (512 * 1024, None)
+            
+            resumed = {}
+            
+            def fake_upload(media, filename, user_id, credentials, **kwargs):
+                resumed.update(kwargs)
+                resumed['data'] = media.getbytes(kwargs['offset'], 16)
+                return {'id': 'drive-id', 'webViewLink': 'https://drive.google.com/resumed'}
+            
+            restarted._upload_to_drive_sync = fake_upload
+            telegram_bot = Mock(edit_message_text=AsyncMock())
+            
+            async def streaming_offset():
+                # الأنبوب يبدأ من الموضع 100 والخادم أكد حتى 150
+                pipe = StreamingPipe(1024)
+                await pipe.write(bytes(range(200)))
+                pipe.close()
+                media = StreamingMediaUpload(pipe, 300, chunksize=256 * 1024, offset=100)
+                return media.getbytes(150, 10)
+            
+            asyncio.run(restarted.resume_pending_jobs(telegram_bot))
+            skipped = asyncio.run(streaming_offset())
+            remaining = restarted.job_store.pending()
+            restarted.drive_executor.shutdown()
+            restarted.job_store.close()
+            
+            with open(local_path, 'rb') as f:
+                f.seek(512 * 1024)
+                expected = f.read(16)
+            
+            if resumed.get('session_uri') != "https://upload.example/session" or resumed.get('offset') != 512 * 1024:
+                print(f"❌ لم تتم متابعة الجلسة السابقة: {resumed}")
+                return False
+            if resumed.get('data') != expected:
+                print("❌ لم يبدأ الرفع من الموضع الذي أكده الخادم")
+                return False
+            if remaining or "https://drive.google.com/resumed" not in telegram_bot.edit_message_text.call_args[0][0]:
+                print("❌ لم يتم إنهاء العملية وإبلاغ المستخدم")
+                return False
+            if skipped != bytes(range(50, 60)):
+                print("❌ النقل المباشر لا يتخطى البايتات المؤكدة")
+                return False
+        
+        print("✅ يتم استكمال الرفع من آخر موضع أكده Google Drive")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار متابعة الرفع بعد إعادة التشغيل - خطأ: {e}")
+        return False
+
+def test_adaptive_chunk_size():
+    """اختبار ضبط حجم جزء الرفع وحجم القراءة حسب السرعة"""
+    print("\n📐 اختبار الضبط التلقائي لحجم الأجزاء...")
+    
+    try:
+        from googleapiclient.errors import HttpError
+        from googleapiclient.http import MediaIoBaseUpload
+        sys.path.append('/home/ubuntu')
+        from telegram_drive_bot_large_files import TelegramDriveBotLargeFiles
+        from transfer_pipeline import (
+            DRIVE_CHUNK_ALIGNMENT, AdaptiveChunkSizer, AdaptiveChunkUpload, AdaptiveReadSize
+        )
+        
+        mb = 1024 * 1024
+        sizer = AdaptiveChunkSizer(initial=8 * mb, minimum=1 * mb, maximum=32 * mb)
+        media = AdaptiveChunkUpload(MediaIoBaseUpload(io.BytesIO(b"x" * 100), 'application/octet-stream'), sizer)
+        
+        # أجزاء سريعة: يتضاعف الحجم حتى الحد الأقصى
+        for _ in range(5):
+            sizer.record(media.chunksize(), 0.5)
+        grown = media.chunksize()
+        
+        # جزء بطيء ثم خطأ: يتصغر الحجم
+        sizer.record(grown, 30.0)
+        after_slow = sizer.size
+        sizer.record_error()
+        after_error = sizer.size
+        
+        odd = AdaptiveChunkSizer(initial=3 * mb + 1000)
+        
+        reader = AdaptiveReadSize(initial=64 * 1024, maximum=1 * mb)
+        for _ in range(6):
+            reader.record(reader.size)
+        full_reads = reader.size
+        for _ in range(8):
+            reader.record(100)
+        
+        if grown != 32 * mb or after_slow != 16 * mb or after_error != 8 * mb:
+            print(f"❌ تعديل حجم الجزء غير صحيح: {grown}, {after_slow}, {after_error}")
+            return False
+        if odd.size % DRIVE_CHUNK_ALIGNMENT != 0 or media.size() != 100:
+            print("❌ حجم الجزء ليس من مضاعفات 256 كيلوبايت")
+            return False
+        if full_reads != 1 * mb or reader.size != 512 * 1024:
+            print(f"❌ تعديل حجم القراءة غير صحيح: {full_reads}, {reader.size}")
+            return False
+        if sizer.chunks != 6 or sizer.errors != 1:
+            print("❌ لم يتم تسجيل القياسات")
+            return False
+        
+        # رفع من جزأين بعد خطأ مؤقت: الأجزاء والأخطاء وحجم الجزء تظهر في المقاييس
+        with tempfile.TemporaryDirectory() as temp_dir:
+            bot = TelegramDriveBotLargeFiles(
+                "test", "test", db_path=os.path.join(temp_dir, 'state.db'), retry_base_delay=0.01
+            )
+            
+            class FakeRequest:
+                resumable_uri = None
+                resumable_progress = 0
+                calls = 0
+                
+                def next_chunk(self):
+                    FakeRequest.calls += 1
+                    if FakeRequest.calls == 1:
+                        raise HttpError(Mock(status=503, reason="Unavailable"), b"")
+                    if FakeRequest.calls == 2:
+                        self.resumable_progress = 2 * mb
+                        return None, None
+                    return None, {'id': 'drive-1', 'webViewLink': 'https://drive.google.com/drive-1'}
+            
+            service = Mock()
+            service.files.return_value.create.return_value = FakeRequest()
+            
+            class Context:
+                def __enter__(self):
+                    return service
+                
+                def __exit__(self, *exc):
+                    return False
+            
+            bot.drive_services.service = lambda user_id, credentials: Context()
+            bot.ensure_fresh_credentials = lambda user_id, credentials, margin=0: True
+            bot._upload_to_drive_sync(io.BytesIO(b"x" * 3 * mb), "chunks.bin", 1, Mock(valid=True))
+            body = bot.metrics.render()
+            bot.drive_executor.shutdown()
+        
+        expected = [
+            'drive_upload_chunks_total 2',
+            'drive_upload_chunk_errors_total 1',
+            f'drive_upload_chunk_size_bytes {bot.metrics.upload_chunk_size.value()}',
+        ]
+        missing = [line for line in expected if line not in body.splitlines()]
+        if missing or not bot.metrics.upload_chunk_size.value():
+            print(f"❌ قياسات الأجزاء غير موجودة في المقاييس: {missing}")
+            return False
+        
+        print("✅ حجم الأجزاء يتكيف مع السرعة والأخطاء")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار الضبط التلقائي لحجم الأجزاء - خطأ: {e}")
+        return False
+
+def test_progress_reporter():
+    """اختبار تحديث رسائل التقدم مع احترام الفاصل الزمني والميزانية العامة"""
+    print("\n📊 اختبار عرض تقدم النقل...")
+    
+    try:
+        from progress_reporter import ProgressReporter
+        
+        async def scenario():
+            reporter = ProgressReporter(min_interval=0.05, min_delta=0.01, edits_per_minute=60, tick=0.01)
+            edits = {job_id: [] for job_id in range(8)}
+            
+            def editor(job_id):
+                async def edit(text):
+                    edits[job_id].append(text)
+                return edit
+            
+            for job_id in edits:
+                reporter.start(job_id, editor(job_id), f"file_{job_id}.bin", 100 * 1024 * 1024)
+            
+            # تقدم مستمر لكل العمليات لمدة نصف ثانية
+            for step in range(1, 51):
+                for job_id in edits:
+                    reporter.add_downloaded(job_id, 1024 * 1024)
+                    reporter.set_uploaded(job_id, step * 1024 * 1024)
+                await asyncio.sleep(0.01)
+            
+            for job_id in edits:
+                await reporter.finish(job_id)
+            return reporter, edits
+        
+        reporter, edits = asyncio.run(scenario())
+        total_edits = sum(len(texts) for texts in edits.values())
+        texts = [text for texts in edits.values() for text in texts]
+        
+        # الميزانية: 5 تعديلات فورية + تعديل واحد في الثانية
+        if total_edits == 0 or total_edits > 6:
+            print(f"❌ عدد التعديلات لا يحترم الميزانية العامة: {total_edits}")
+            return False
+        if len(reporter) != 0 or not any("الرفع" in text and "التنزيل" in text for text in texts):
+            print("❌ نص التقدم غير مكتمل")
+            return False
+        
+        print(f"✅ تم تحديث رسائل التقدم {total_edits} مرات ضمن الميزانية")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار عرض تقدم النقل - خطأ: {e}")
+        return False
+
+def test_media_group_batching():
+    """اختبار رفع الألبوم كعملية واحدة برسالة حالة واحدة ومجلد واحد"""
+    print("\n🖼️ اختبار تجميع الألبومات...")
+    
+    try:
+        from unittest.mock import AsyncMock
+        sys.path.append('/home/ubuntu')
+        from telegram_drive_bot_large_files import TelegramDriveBotLargeFiles
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            bot = TelegramDriveBotLargeFiles(
+                "test", "test", "http://localhost:8081", local_mode=True,
+                db_path=os.path.join(temp_dir, 'state.db'), dedup_mode='copy', media_group_window=0.2
+            )
+            bot.user_credentials[1] = {'credentials': Mock(valid=True)}
+            bot.upload_index.record(1, "photo-0", "drive-old", "https://drive.google.com/old")
+            
+            calls = {'folders': 0, 'batches': [], 'uploads': []}
+            
+            def fake_folder(user_id, credentials, name, parent_id=None):
+                calls['folders'] += 1
+                return {'id': 'album-folder', 'webViewLink': 'https://drive.google.com/album'}
+            
+            def fake_batch(user_id, credentials, files, parent_id):
+                calls['batches'].append((dict(files), parent_id))
+                return {key: f"https://drive.google.com/copy-{key}" for key in files}
+            
+            def fake_upload(media, filename, user_id, credentials, **kwargs):
+                calls['uploads'].append((filename, kwargs.get('parent_id')))
+                return {'id': filename, 'webViewLink': f'https://drive.google.com/{filename}'}
+            
+            bot._create_folder_sync = fake_folder
+            bot._batch_copy_sync = fake_batch
+            bot._upload_to_drive_sync = fake_upload
+            
+            paths = {}
+            for index in range(4):
+                paths[f"file-{index}"] = os.path.join(temp_dir, f"photo_{index}.jpg")
+                with open(paths[f"file-{index}"], 'wb') as f:
+                    f.write(b"jpeg" * 100)
+            
+            loading_message = Mock(message_id=99, edit_text=AsyncMock())
+            replies = AsyncMock(return_value=loading_message)
+            
+            def make_update(index):
+                photo = Mock(file_id=f"file-{index}", file_unique_id=f"photo-{index}", file_size=400,
+                             file_name=None, mime_type=None)
+                message = Mock(
+                    media_group_id="group-1", message_id=index, photo=[photo], document=None, video=None,
+                    animation=None, audio=None, voice=None, video_note=None, sticker=None, reply_text=replies
+                )
+                return Mock(message=message, effective_user=Mock(id=1), effective_chat=Mock(id=5))
+            
+            telegram_bot = Mock(get_file=AsyncMock(side_effect=lambda file_id: Mock(file_path=paths[file_id])))
+            context = Mock(bot=telegram_bot)
+            
+            async def send_album():
+                await asyncio.gather(*(bot.handle_media(make_update(index), context) for index in range(4)))
+            
+            asyncio.run(send_album())
+            bot.drive_executor.shutdown()
+            bot.upload_index.close()
+            bot.job_store.close()
+            
+            summary = loading_message.edit_text.call_args[0][0]
+            if replies.call_count != 1 or calls['folders'] != 1:
+                print(f"❌ الألبوم لم يُعالج كعملية واحدة: {replies.call_count} رسائل")
+                return False
+            if len(calls['batches']) != 1 or list(calls['batches'][0][0]) != ["photo-0"]:
+                print(f"❌ لم يتم نسخ العنصر المرفوع مسبقاً بطلب مجمّع: {calls['batches']}")
+                return False
+            if sorted(calls['uploads']) != [(f"photo_photo-{i}.jpg", 'album-folder') for i in range(1, 4)]:
+                print(f"❌ لم تُرفع بقية العناصر إلى مجلد الألبوم: {calls['uploads']}")
+                return False
+            if "4 من 4" not in summary:
+                print(f"❌ ملخص الألبوم غير صحيح: {summary}")
+                return False
+        
+        print("✅ الألبوم يُرفع كعملية واحدة إلى مجلد واحد")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار تجميع الألبومات - خطأ: {e}")
+        return False
+
+def test_webhook_mode():
+    """اختبار خادم webhook المدمج واستنتاج allowed_updates من المعالجات"""
+    print("\n🪝 اختبار وضع webhook...")
+    
+    try:
+        import aiohttp
+        from telegram import Update
+        sys.path.append('/home/ubuntu')
+        from telegram_drive_bot_large_files import TelegramDriveBotLargeFiles
+        from webhook_server import SECRET_HEADER, WebhookServer, allowed_updates_for
+        
+        bot = TelegramDriveBotLargeFiles(
+            "123456:TEST", "test", webhook_url="https://bot.example.com/", webhook_secret="secret-1"
+        )
+        application = bot.build_application()
+        allowed_updates = allowed_updates_for(application)
+        
+        update_data = {
+            'update_id': 1,
+            'message': {
+                'message_id': 7,
+                'date': 1700000000,
+                'chat': {'id': 5, 'type': 'private'},
+                'from': {'id': 5, 'is_bot': False, 'first_name': 'Test'},
+                'text': '/start'
+            }
+        }
+        
+        async def scenario():
+            server = WebhookServer(application, listen='127.0.0.1', port=0, path='/telegram', secret_token="secret-1")
+            await server.start()
+            url = f"http://127.0.0.1:{server.bound_port}/telegram"
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.post(url, json=update_data, headers={SECRET_HEADER: "wrong"}) as response:
+                        rejected = response.status
+                    async with session.post(url, json=update_data, headers={SECRET_HEADER: "secret-1"}) as response:
+                        accepted = response.status
+            finally:
+                await server.stop()
+            return rejected, accepted, application.update_queue.qsize()
+        
+        rejected, accepted, queued = asyncio.run(scenario())
+        update = application.update_queue.get_nowait()
+        bot.update_latency.record(update)
+        bot.drive_executor.shutdown()
+        
+        if allowed_updates != [Update.MESSAGE]:
+            print(f"❌ allowed_updates غير مستنتجة من المعالجات: {allowed_updates}")
+            return False
+        if rejected != 403 or accepted != 200 or queued != 1:
+            print(f"❌ خادم webhook لا يتحقق من الرمز السري: {rejected}, {accepted}, {queued}")
+            return False
+        if update.message.text != '/start' or bot.update_latency.summary()['count'] != 1:
+            print("❌ لم يتم تمرير التحديث إلى التطبيق")
+            return False
+        if application.updater is not None or bot.webhook_url != "https://bot.example.com":
+            print("❌ إعداد وضع webhook غير صحيح")
+            return False
+        
+        print("✅ خادم webhook يعمل ويشترك في أنواع التحديثات المطلوبة فقط")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار وضع webhook - خطأ: {e}")
+        return False
+
+def test_worker_queue():
+    """اختبار قائمة الانتظار المشتركة بين الواجهة والعمال (الحجز والعقود)"""
+    print("\n👷 اختبار توزيع النقل على العمال...")
+    
+    try:
+        import threading
+        import time
+        from unittest.mock import AsyncMock
+        sys.path.append('/home/ubuntu')
+        from bot_storage import JobStore
+        from telegram_drive_bot_large_files import TelegramDriveBotLargeFiles
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = os.path.join(temp_dir, 'state.db')
+            
+            # عدة عمال (اتصالات مستقلة) يحجزون من نفس القائمة: لا تُحجز عملية مرتين
+            queue = JobStore(db_path)
+            for index in range(40):
+                queue.create(index % 4, 10, index, f"file-{index}", None, f"{index}.bin", 100, status='queued')
+            claimed = []
+            
+            def drain(worker_id):
+                store = JobStore(db_path)
+                while True:
+                    job = store.claim(worker_id, 60)
+                    if job is None:
+                        break
+                    claimed.append(job['job_id'])
+                store.close()
+            
+            threads = [threading.Thread(target=drain, args=(f"worker-{n}",)) for n in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            
+            if sorted(claimed) != list(range(1, 41)):
+                print(f"❌ تم حجز بعض العمليات أكثر من مرة أو لم تُحجز: {len(claimed)}")
+                return False
+            
+            # عامل توقف عن تجديد عقده: تنتقل العملية لعامل آخر ولا يستطيع الأول إنهاءها
+            queue.execute("DELETE FROM upload_jobs")
+            first = queue.create(1, 10, 1, "a", None, "a.bin", 100, status='queued')
+            queue.create(1, 10, 2, "b", None, "b.bin", 100, status='queued')
+            second_user = queue.create(2, 10, 3, "c", None, "c.bin", 100, status='queued')
+            job = queue.claim("crashed", 0.05, per_user_limit=1)
+            fair = queue.claim("other", 60, per_user_limit=1)
+            blocked = queue.claim("other", 60, per_user_limit=1)
+            time.sleep(0.1)
+            taken = queue.claim("healthy", 60, per_user_limit=1)
+            renewed = queue.renew(first, "crashed", 60)
+            queue.finish(first, "crashed")
+            still_there = queue.get(first) is not None
+            queue.close()
+            
+            if job['job_id'] != first or fair['job_id'] != second_user or blocked is not None:
+                print("❌ الحجز لا يوزع العمليات بين المستخدمين حسب الحد")
+                return False
+            if taken['job_id'] != first or taken['attempts'] != 2 or renewed or not still_there:
+                print("❌ لم تنتقل العملية المتروكة إلى عامل آخر")
+                return False
+            
+            # الواجهة تضيف الملف فقط والعامل ينقله ويعدل رسالة الحالة
+            local_path = os.path.join(temp_dir, 'doc.bin')
+            with open(local_path, 'wb') as f:
+                f.write(b"x" * 1000)
+            db_path = os.path.join(temp_dir, 'shared.db')
+            
+            frontend = TelegramDriveBotLargeFiles("test", "test", db_path=db_path, role='frontend')
+            frontend.user_credentials[7] = {'credentials': Mock(valid=True)}
+            update = Mock()
+            update.effective_user.id = 7
+            update.effective_chat.id = 70
+            update.message.media_group_id = None
+            update.message.animation = None
+            update.message.document = Mock(file_id="doc-id", file_unique_id="doc-unique",
+                                           file_name="doc.bin", file_size=1000, mime_type=None)
+            update.message.reply_text = AsyncMock(return_value=Mock(message_id=700))
+            context = Mock()
+            context.bot.get_file = AsyncMock()
+            asyncio.run(frontend.handle_media(update, context))
+            queued = frontend.job_store.pending()
+            # مقياس قائمة الانتظار يقرأ العدد المحفوظ دون استعلام SQLite في حلقة الأحداث
+            frontend.job_store.count_queued = Mock(side_effect=AssertionError("استعلام عند قراءة المقياس"))
+            depth = frontend._queue_depth()
+            frontend.drive_executor.shutdown()
+            frontend.job_store.close()
+            frontend.upload_index.close()
+            
+            worker = TelegramDriveBotLargeFiles(
+                "test", "test", "http://localhost:8081", db_path=db_path, local_mode=True,
+                role='worker', worker_id="worker-1"
+            )
+            worker.user_credentials[7] = {'credentials': Mock(valid=True)}
+            worker._upload_to_drive_sync = lambda media, filename, user_id, credentials, **kwargs: {
+                'id': 'drive-id', 'webViewLink': 'https://drive.google.com/worker'
+            }
+            telegram_bot = Mock(edit_message_text=AsyncMock())
+            telegram_bot.get_file = AsyncMock(return_value=Mock(file_path=local_path))
+            
+            async def work_once():
+                await worker.refresh_shared_queue()
+                job = await worker.run_db_io(worker.job_store.claim, "worker-1", 60)
+                await worker.worker.execute(telegram_bot, job)
+                return worker.shared_queued
+            
+            worker_depth = asyncio.run(work_once())
+            remaining = worker.job_store.pending()
+            worker.drive_executor.shutdown()
+            worker.job_store.close()
+            worker.upload_index.close()
+            
+            if context.bot.get_file.called or len(queued) != 1 or queued[0]['status'] != 'queued':
+                print("❌ الواجهة لم تضف الملف إلى قائمة الانتظار")
+                return False
+            if depth != 1 or worker_depth != 1:
+                print(f"❌ عدد قائمة الانتظار في المقاييس غير صحيح: {depth}، {worker_depth}")
+                return False
+            if remaining or "https://drive.google.com/worker" not in telegram_bot.edit_message_text.call_args[0][0]:
+                print("❌ العامل لم ينقل الملف أو لم يبلغ المستخدم")
+                return False
+            
+            # رفع أطول من مدة العقد يشغل كل خيوط Drive: يجب أن يستمر تجديد العقد أثناءه
+            busy = TelegramDriveBotLargeFiles(
+                "test", "test", "http://localhost:8081", db_path=db_path, local_mode=True, max_workers=2,
+                role='worker', worker_id="worker-2"
+            )
+            for index in range(2):
+                busy.job_store.create(7, 10, index, f"long-{index}", None, f"long-{index}.bin", 1000, status='queued')
+            busy.user_credentials[7] = {'credentials': Mock(valid=True)}
+            busy.worker.lease_seconds = 0.6
+            uploading = []
+            renewed_during_upload = []
+            
+            def slow_upload(media, filename, user_id, credentials, **kwargs):
+                uploading.append(filename)
+                time.sleep(1.5)
+                uploading.remove(filename)
+                return {'id': filename, 'webViewLink': f'https://drive.google.com/{filename}'}
+            
+            def renew(job_id, worker_id, lease_seconds):
+                if uploading:
+                    renewed_during_upload.append(job_id)
+                return JobStore.renew(busy.job_store, job_id, worker_id, lease_seconds)
+            
+            busy._upload_to_drive_sync = slow_upload
+            busy.job_store.renew = renew
+            
+            async def work_long():
+                jobs = [await busy.run_db_io(busy.job_store.claim, "worker-2", 0.6) for _ in range(2)]
+                await asyncio.gather(*(busy.worker.execute(telegram_bot, job) for job in jobs))
+            
+            asyncio.run(work_long())
+            remaining = busy.job_store.pending()
+            busy.drive_executor.shutdown()
+            busy.job_store.close()
+            busy.upload_index.close()
+            
+            if len(renewed_during_upload) < 4 or remaining or busy.worker.completed != 2:
+                print(f"❌ توقف تجديد العقود أثناء الرفع: {len(renewed_during_upload)} تجديدات")
+                return False
+        
+        print("✅ العمال يتشاركون قائمة الانتظار بعقود حجز تنتقل عند توقف العامل")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار توزيع النقل على العمال - خطأ: {e}")
+        return False
+
+def test_metrics_endpoint():
+    """اختبار خادم مقاييس الأداء بصيغة Prometheus"""
+    print("\n📈 اختبار مقاييس الأداء...")
+    
+    try:
+        import aiohttp
+        from googleapiclient.errors import HttpError
+        sys.path.append('/home/ubuntu')
+        from bot_metrics import MetricsServer
+        from telegram_drive_bot_large_files import TelegramDriveBotLargeFiles
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            bot = TelegramDriveBotLargeFiles("test", "test", db_path=os.path.join(temp_dir, 'state.db'))
+            metrics = bot.metrics
+            
+            metrics.observe_download(4 * 1024 * 1024, 2.0)
+            metrics.observe_upload(4 * 1024 * 1024, 0.5)
+            metrics.observe_upload(0, 1.0, ok=False)
+            metrics.observe_drive_error(HttpError(Mock(status=503, reason="Unavailable"), b""))
+            metrics.observe_drive_error(ConnectionResetError())
+            
+            # تحديث رمز فاشل يُسجل في عداد التحديثات
+            credentials = Mock(valid=False, refresh_token="refresh", expiry=None)
+            credentials.refresh.side_effect = RuntimeError("invalid_grant")
+            try:
+                bot.ensure_fresh_credentials(1, credentials)
+            except RuntimeError:
+                pass
+            
+            async def scrape():
+                server = MetricsServer(metrics, '127.0.0.1', 0)
+                await server.start()
+                try:
+                    async with aiohttp.ClientSession() as session:
+                        url = f"http://127.0.0.1:{server.bound_port}/metrics"
+                        async with session.get(url) as response:
+                            return response.status, response.headers['Content-Type'], await response.text()
+                finally:
+                    await server.stop()
+            
+            status, content_type, body = asyncio.run(scrape())
+            bot.drive_executor.shutdown()
+        
+        expected = [
+            'telegram_download_seconds_bucket{le="2.5"} 1',
+            'telegram_download_seconds_count 1',
+            'drive_upload_bytes_total 4194304',
+            'drive_uploads_total{result="error"} 1',
+            'transfer_throughput_bytes_per_second_count{direction="upload"} 1',
+            'drive_api_errors_total{status="503"} 1',
+            'drive_api_errors_total{status="network"} 1',
+            'google_token_refreshes_total{result="error"} 1',
+            'upload_queue_depth 0',
+            'upload_active_jobs 0',
+            '# TYPE drive_upload_seconds histogram',
+        ]
+        missing = [line for line in expected if line not in body]
+        if status != 200 or not content_type.startswith('text/plain') or missing:
+            print(f"❌ المقاييس المعروضة غير صحيحة: {missing}")
+            return False
+        
+        print("✅ يتم عرض مقاييس التنزيل والرفع والأخطاء وقائمة الانتظار بصيغة Prometheus")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار مقاييس الأداء - خطأ: {e}")
+        return False
+
+def test_benchmark_harness():
+    """اختبار أداة قياس الأداء بالخوادم الوهمية"""
+    print("\n🏁 اختبار أداة قياس الأداء...")
+    
+    try:
+        sys.path.append('/home/ubuntu')
+        from benchmark_transfers import FaultProfile, parse_size, percentile, run_scenario
+        
+        options = {'chunk_size': 256 * 1024}
+        clean = asyncio.run(run_scenario(3 * 1024 * 1024, 2, 3, 'document', bot_options=options))
+        video = asyncio.run(run_scenario(512 * 1024, 1, 1, 'video', bot_options=options))
+        # كل طلب رفع يفشل: يجب أن تُحسب الملفات فاشلة بعد نفاد المحاولات
+        broken = asyncio.run(run_scenario(
+            512 * 1024, 1, 1, 'document', drive_faults=FaultProfile(error_rate=1.0),
+            bot_options=dict(options, retry_base_delay=0.01)
+        ))
+        
+        if clean['failed'] or clean['throughput_mbps'] <= 0 or clean['p99_seconds'] < clean['p50_seconds']:
+            print(f"❌ نتائج القياس غير صحيحة: {clean}")
+            return False
+        if video['failed'] or broken['failed'] != 1 or broken['injected_errors'] < 1:
+            print(f"❌ لم يتم احتساب الأعطال المحقونة: {video}, {broken}")
+            return False
+        if parse_size("2GB") != 2 * 1024 ** 3 or percentile([1, 2, 3, 4], 0.5) != 2 or clean['peak_rss_mb'] <= 0:
+            print("❌ تحليل الأحجام أو حساب المئين غير صحيح")
+            return False
+        
+        print(f"✅ أداة القياس تعمل ({clean['throughput_mbps']:.0f} Mbps محلياً)")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار أداة قياس الأداء - خطأ: {e}")
+        return False
+
+def test_retry_policy():
+    """اختبار إعادة المحاولة بتراجع أسي عند الأخطاء المؤقتة"""
+    print("\n🔁 اختبار إعادة المحاولة...")
+    
+    try:
+        sys.path.append('/home/ubuntu')
+        import json
+        import httplib2
+        from aiohttp import web
+        from googleapiclient.errors import HttpError
+        from telegram.error import BadRequest
+        from benchmark_transfers import FaultProfile, run_scenario
+        from retry_policy import RetryPolicy
+        from telegram_drive_bot_large_files import TelegramDriveBotLargeFiles
+        
+        def http_error(status, reason=None, retry_after=None):
+            headers = {'status': str(status)}
+            if retry_after is not None:
+                headers['retry-after'] = str(retry_after)
+            body = json.dumps({'error': {'errors': [{'reason': reason}] if reason else []}}).encode()
+            return HttpError(httplib2.Response(headers), body)
+        
+        policy = RetryPolicy(max_attempts=4, base_delay=1, max_delay=8, rand=lambda: 1.0)
+        cases = [
+            (http_error(503), True),
+            (http_error(429, retry_after=7), True),
+            (http_error(403, 'userRateLimitExceeded'), True),
+            (http_error(403, 'storageQuotaExceeded'), False),
+            (http_error(404), False),
+            (ConnectionResetError(), True),
+            (BadRequest("File is too big"), False),
+        ]
+        for error, expected in cases:
+            if policy.classify(error)[0] != expected:
+                print(f"❌ تصنيف خاطئ للخطأ {error!r}")
+                return False
+        if [policy.backoff(attempt) for attempt in range(5)] != [1, 2, 4, 8, 8]:
+            print("❌ التراجع الأسي لا يلتزم بالحد الأقصى")
+            return False
+        if policy.retry_delay('test', http_error(429, retry_after=7), 0) != 7:
+            print("❌ لم يتم احترام Retry-After")
+            return False
+        if policy.retry_delay('test', http_error(503), 3) is not None:
+            print("❌ لم تتوقف المحاولات بعد الحد الأقصى")
+            return False
+        
+        async def flaky_download():
+            # الطلب الأول ينقطع بعد نصف الملف، والثاني يجب أن يطلب الباقي فقط
+            data = os.urandom(300 * 1024)
+            ranges = []
+            
+            async def serve(request):
+                ranges.append(request.headers.get('Range'))
+                if len(ranges) == 1:
+                    response = web.StreamResponse(headers={'Content-Length': str(len(data))})
+                    await response.prepare(request)
+                    await response.write(data[:len(data) // 2])
+                    request.transport.close()
+                    return response
+                start = int(request.headers['Range'][len('bytes='):-1])
+                return web.Response(status=206, body=data[start:])
+            
+            app = web.Application()
+            app.router.add_get('/file/bot{token}/{path}', serve)
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, '127.0.0.1', 0).start()
+            port = runner.addresses[0][1]
+            bot = TelegramDriveBotLargeFiles(
+                "test_token", "credentials.json", f"http://127.0.0.1:{port}", retry_base_delay=0.01
+            )
+            received = bytearray()
+            
+            async def write(chunk):
+                received.extend(chunk)
+            
+            try:
+                await bot._read_telegram_file('flaky.bin', write)
+            finally:
+                await bot.post_shutdown(None)
+                await runner.cleanup()
+            retries = bot.metrics.retries.value(operation='telegram_download', reason='network')
+            return bytes(received) == data, ranges, retries
+        
+        intact, ranges, retries = asyncio.run(flaky_download())
+        if not intact or len(ranges) != 2 or ranges[1] != f"bytes={150 * 1024}-" or retries != 1:
+            print(f"❌ لم يُستأنف التنزيل من آخر بايت: {ranges}")
+            return False
+        
+        # كل طلب Drive يفشل بـ 503 مرتين ثم ينجح (أقل من المحاولات الخمس): يجب أن تكتمل كل
+        # الملفات بإعادة المحاولة، والنتيجة لا تعتمد على ترتيب الطلبات المتزامنة
+        faults = FaultProfile(error_rate=1.0, max_consecutive_failures=2)
+        result = asyncio.run(run_scenario(
+            2 * 1024 * 1024, 2, 3, 'document', drive_faults=faults,
+            bot_options={'chunk_size': 256 * 1024, 'retry_base_delay': 0.01, 'retry_attempts': 5}
+        ))
+        if result['failed'] or result['files'] != 3:
+            print(f"❌ فشل الرفع رغم إعادة المحاولة: {result}")
+            return False
+        if faults.injected_errors < 1 or result['retries'] < 1:
+            print(f"❌ لم تُحقن أخطاء أو لم تُعد المحاولة: {result}")
+            return False
+        
+        print(f"✅ يُعاد كل جزء عند الأخطاء المؤقتة ({faults.injected_errors} خطأ محقون دون إخفاق)")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار إعادة المحاولة - خطأ: {e}")
+        return False
+
+def test_drive_rate_limiter():
+    """اختبار تحديد معدل طلبات Drive وتكامله مع المجدول"""
+    print("\n🚦 اختبار تحديد معدل طلبات Drive...")
+    
+    try:
+        import json
+        import httplib2
+        from googleapiclient.errors import HttpError
+        sys.path.append('/home/ubuntu')
+        from bot_storage import JobStore
+        from drive_rate_limiter import DriveRateLimiter
+        from job_scheduler import UploadScheduler
+        from telegram_drive_bot_large_files import TelegramDriveBotLargeFiles
+        
+        def rate_error(reason, retry_after):
+            response = httplib2.Response({'status': '403', 'retry-after': str(retry_after)})
+            return HttpError(response, json.dumps({'error': {'errors': [{'reason': reason}]}}).encode())
+        
+        # ساعة وهمية: النوم يقدّم الساعة فقط
+        now = [0.0]
+        waits = []
+        
+        def sleep(seconds):
+            now[0] += seconds
+        
+        limiter = DriveRateLimiter(
+            user_rate=2, user_burst=2, client_rate=3, client_burst=3,
+            on_wait=lambda scope, seconds: waits.append(scope), clock=lambda: now[0], sleep=sleep
+        )
+        waited = [limiter.acquire(1), limiter.acquire(1), limiter.acquire(1)]
+        if waited[:2] != [0, 0] or abs(waited[2] - 0.5) > 1e-9 or waits != ['user']:
+            print(f"❌ دلو المستخدم لا يلتزم بالمعدل: {waited}")
+            return False
+        # المستخدم الثاني مقيد بدلو العميل المشترك فقط
+        if limiter.acquire(2) != 0 or limiter.acquire(2) <= 0 or waits[-1] != 'client':
+            print("❌ دلو العميل المشترك لا يحد طلبات كل الحسابات")
+            return False
+        
+        now[0] += 10
+        limiter.observe_error(1, rate_error('userRateLimitExceeded', 4))
+        # بعد Retry-After يمتلئ الدلو بالمعدل العادي: 4 ثوان ثم نصف ثانية لطلب واحد
+        if abs(limiter.ready_in(1) - 4.5) > 1e-9 or limiter.ready_in(2) != 0 or limiter.throttled_users() != [1]:
+            print("❌ لم يتم إيقاف حساب المستخدم بعد تجاوز حده")
+            return False
+        limiter.observe_error(2, rate_error('rateLimitExceeded', 2))
+        if limiter.client_ready_in() <= 0 or limiter.ready_in(3) <= 0:
+            print("❌ لم يتم إيقاف عميل OAuth بعد تجاوز حد المشروع")
+            return False
+        
+        async def scheduling():
+            # المستخدم 1 بلا رصيد: يبدأ المستخدم 2 أولاً ثم المستخدم 1 عند امتلاء دلوه
+            limiter = DriveRateLimiter(user_rate=20, user_burst=1, client_rate=0)
+            limiter.acquire(1)
+            scheduler = UploadScheduler(max_concurrent=1, rate_limiter=limiter)
+            order = []
+            
+            async def upload(user_id):
+                async with scheduler.slot(user_id):
+                    order.append(user_id)
+                    limiter.acquire(user_id)
+            
+            await asyncio.wait_for(asyncio.gather(upload(1), upload(2)), 2)
+            return order
+        
+        order = asyncio.run(scheduling())
+        if order != [2, 1]:
+            print(f"❌ المجدول لم يؤخر المستخدم الذي نفد رصيده: {order}")
+            return False
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = JobStore(os.path.join(temp_dir, 'state.db'))
+            store.create(1, 10, 1, "file-1", None, "1.bin", 100, status='queued')
+            store.create(2, 10, 2, "file-2", None, "2.bin", 100, status='queued')
+            job = store.claim("worker", 60, exclude_users=[1])
+            store.close()
+            if job is None or job['user_id'] != 2:
+                print("❌ العامل حجز عملية مستخدم نفد رصيده")
+                return False
+            
+            bot = TelegramDriveBotLargeFiles(
+                "test_token", "credentials.json", db_path=os.path.join(temp_dir, 'bot.db'), drive_client_burst=50
+            )
+            bot.drive_request(1, lambda: None)
+            metrics = bot.metrics.render()
+            if 'drive_rate_limit_client_tokens 49' not in metrics or 'drive_rate_limited_accounts 0' not in metrics:
+                print("❌ رصيد محدد المعدل غير معروض في المقاييس")
+                return False
+        
+        print("✅ طلبات Drive تتأخر حسب رصيد الحساب والعميل بدلاً من رفضها")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار تحديد معدل طلبات Drive - خطأ: {e}")
+        return False
+
+def test_bandwidth_limits():
+    """اختبار تحديد عرض النطاق والتناوب العادل بين عمليات النقل"""
+    print("\n📶 اختبار تحديد عرض النطاق...")
+    
+    try:
+        import time
+        sys.path.append('/home/ubuntu')
+        from bandwidth_limiter import BandwidthLimiter
+        from benchmark_transfers import run_scenario
+        
+        megabyte = 1024 * 1024
+        now = [0.0]
+        
+        def sleep(seconds):
+            now[0] += seconds
+        
+        # الحد العام: 3 ميجابايت بسرعة 1 ميجابايت/ث بعد رصيد ربع ثانية
+        limiter = BandwidthLimiter(megabyte, clock=lambda: now[0], sleep=sleep)
+        waited = limiter.consume(1, 3 * megabyte)
+        if abs(waited - 2.75) > 0.01:
+            print(f"❌ الحد العام غير صحيح: {waited:.2f} ثانية")
+            return False
+        
+        # حد المستخدم لا يؤثر على المستخدمين الآخرين
+        limiter = BandwidthLimiter(per_user_rate=megabyte, clock=lambda: now[0], sleep=sleep)
+        if limiter.consume(1, megabyte) <= 0 or limiter.consume(2, 256 * 1024) != 0:
+            print("❌ حد المستخدم يؤثر على غيره")
+            return False
+        
+        async def photo_during_large_transfer():
+            # صورة صغيرة تبدأ أثناء نقل ملف كبير: تتناوب معه ولا تنتظر انتهاءه
+            limiter = BandwidthLimiter(4 * megabyte)
+            started = time.monotonic()
+            finished = {}
+            
+            async def transfer(name, user_id, nbytes):
+                await limiter.aconsume(user_id, nbytes)
+                finished[name] = time.monotonic() - started
+            
+            large = asyncio.ensure_future(transfer('large', 1, 6 * megabyte))
+            await asyncio.sleep(0.1)
+            await transfer('photo', 2, 256 * 1024)
+            await large
+            return finished
+        
+        finished = asyncio.run(photo_during_large_transfer())
+        if finished['photo'] > 0.5 or finished['large'] < 1.2:
+            print(f"❌ الملف الصغير انتظر الملف الكبير: {finished}")
+            return False
+        
+        # السرعة الكلية الفعلية تلتزم بالحد (4 ميجابايت/ث = 32 Mbps تقريباً)
+        result = asyncio.run(run_scenario(
+            2 * megabyte, 2, 2, 'document',
+            bot_options={'chunk_size': 256 * 1024, 'bandwidth_limit': 4 * megabyte}
+        ))
+        if result['failed'] or result['throughput_mbps'] > 40:
+            print(f"❌ لم يتم تطبيق حد عرض النطاق على النقل: {result}")
+            return False
+        
+        print(f"✅ الصورة اكتملت خلال {finished['photo']:.2f} ثانية أثناء نقل ملف كبير "
+              f"(السرعة الكلية {result['throughput_mbps']:.0f} Mbps)")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار تحديد عرض النطاق - خطأ: {e}")
+        return False
+
+def test_integrity_verification():
+    """اختبار التحقق من سلامة الملفات بمقارنة MD5 مع Drive"""
+    print("\n🔐 اختبار التحقق من سلامة الملفات...")
+    
+    try:
+        import hashlib
+        sys.path.append('/home/ubuntu')
+        from bot_storage import UploadIndex
+        from benchmark_transfers import FaultProfile, run_scenario
+        from transfer_pipeline import IncrementalHasher
+        
+        data = os.urandom(1024 * 1024)
+        hasher = IncrementalHasher(sha256=True)
+        # جزء أُعيد إرساله بعد خطأ لا يُحسب مرتين
+        for offset, length in ((0, 300000), (200000, 500000), (700000, len(data) - 700000)):
+            hasher.update_at(offset, data[offset:offset + length])
+        if hasher.md5() != hashlib.md5(data).hexdigest() or hasher.sha256() != hashlib.sha256(data).hexdigest():
+            print("❌ المجموع الاختباري التدريجي لا يطابق الملف")
+            return False
+        
+        # رفع مستأنف من منتصف الملف لا يمكن التحقق منه
+        resumed = IncrementalHasher(offset=512 * 1024)
+        resumed.update_at(512 * 1024, data[512 * 1024:])
+        if resumed.md5() is not None:
+            print("❌ تم حساب مجموع اختباري لملف لم تمر بدايته بالحاسب")
+            return False
+        
+        options = {'chunk_size': 256 * 1024, 'checksum_sha256': True}
+        clean = asyncio.run(run_scenario(1024 * 1024, 2, 2, 'document', bot_options=options))
+        corrupted = asyncio.run(run_scenario(
+            512 * 1024, 1, 1, 'document', drive_faults=FaultProfile(corruption_rate=1.0), bot_options=options
+        ))
+        if clean['failed'] or clean['verified_files'] != 2:
+            print(f"❌ لم يتم التحقق من الملفات السليمة: {clean}")
+            return False
+        if corrupted['failed'] != 1 or corrupted['checksum_mismatches'] != 1:
+            print(f"❌ لم يُكتشف الملف التالف: {corrupted}")
+            return False
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            index = UploadIndex(os.path.join(temp_dir, 'state.db'))
+            index.record(1, 'unique', 'drive-id', 'link', 'a.bin', 10, md5='m' * 32, sha256='s' * 64)
+            record = index.get(1, 'unique')
+            index.close()
+            if record['md5'] != 'm' * 32 or record['sha256'] != 's' * 64:
+                print("❌ لم يُحفظ المجموع الاختباري في فهرس الملفات")
+                return False
+        
+        print("✅ يتم التحقق من MD5 و SHA-256 أثناء الرفع ورفض الملفات التالفة")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار التحقق من سلامة الملفات - خطأ: {e}")
+        return False
+
+def test_segmented_download():
+    """اختبار التنزيل المقسم بطلبات Range متوازية"""
+    print("\n🧩 اختبار التنزيل المقسم...")
+    
+    try:
+        import re
+        import time
+        from aiohttp import web
+        sys.path.append('/home/ubuntu')
+        from benchmark_transfers import FakeBotApiServer, FaultProfile
+        from telegram_drive_bot_large_files import TelegramDriveBotLargeFiles
+        
+        segment = 512 * 1024
+        data = os.urandom(5 * segment + 1000)
+        ranges = []
+        
+        async def serve(request):
+            # محتوى عشوائي حتى يظهر أي خطأ في ترتيب الأجزاء، والجزء الثالث ينقطع مرة واحدة
+            match = re.fullmatch(r'bytes=(\d+)-(\d*)', request.headers.get('Range', ''))
+            start = int(match.group(1))
+            end = int(match.group(2)) + 1 if match.group(2) else len(data)
+            ranges.append((start, end))
+            response = web.StreamResponse(status=206, headers={
+                'Content-Range': f"bytes {start}-{end - 1}/{len(data)}", 'Content-Length': str(end - start)
+            })
+            await response.prepare(request)
+            if start == 2 * segment:
+                await response.write(data[start:start + 1000])
+                request.transport.close()
+                return response
+            await response.write(data[start:end])
+            return response
+        
+        def new_bot(server_url, connections=4):
+            return TelegramDriveBotLargeFiles(
+                "test_token", "credentials.json", server_url, retry_base_delay=0.01,
+                download_connections=connections, download_segment_size=segment
+            )
+        
+        async def read(bot, path, size):
+            received = bytearray()
+            
+            async def write(chunk):
+                received.extend(chunk)
+            
+            try:
+                started = time.monotonic()
+                await bot._read_telegram_file(path, write, file_size=size)
+                return bytes(received), time.monotonic() - started
+            finally:
+                await bot.post_shutdown(None)
+        
+        async def scenarios():
+            app = web.Application()
+            app.router.add_get('/file/bot{token}/{path}', serve)
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, '127.0.0.1', 0).start()
+            try:
+                url = f"http://127.0.0.1:{runner.addresses[0][1]}"
+                segmented, _ = await read(new_bot(url), 'random.bin', len(data))
+            finally:
+                await runner.cleanup()
+            
+            # كل اتصال محدود بـ 4 ميجابايت/ث: أربعة اتصالات أسرع من اتصال واحد
+            size = 4 * 1024 * 1024
+            path = FakeBotApiServer.file_path(size, 'large.bin')
+            limited = FakeBotApiServer(FaultProfile(bandwidth=size))
+            fallback = FakeBotApiServer(ranges=False)
+            await limited.start()
+            await fallback.start()
+            try:
+                _, single_time = await read(new_bot(limited.url, 1), path, size)
+                _, parallel_time = await read(new_bot(limited.url), path, size)
+                bot = new_bot(fallback.url)
+                streamed, _ = await read(bot, path, size)
+            finally:
+                await limited.stop()
+                await fallback.stop()
+            return segmented, single_time, parallel_time, streamed, bot._range_support
+        
+        segmented, single_time, parallel_time, streamed, range_support = asyncio.run(scenarios())
+        
+        if segmented != data:
+            print("❌ الأجزاء لم تُكتب بالترتيب الصحيح")
+            return False
+        # طلب الفحص ثم ستة أجزاء، ثم استئناف الجزء المنقطع وحده من آخر بايت مستلم
+        resumed = [r for r in ranges[1:] if (r[0] % segment)]
+        if len(ranges) != 8 or resumed != [(2 * segment + 1000, 3 * segment)]:
+            print(f"❌ لم يُعد الجزء الفاشل وحده: {ranges}")
+            return False
+        if parallel_time * 2 > single_time:
+            print(f"❌ التنزيل المتوازي ليس أسرع: {parallel_time:.2f} ← {single_time:.2f} ثانية")
+            return False
+        if len(streamed) != 4 * 1024 * 1024 or range_support is not False:
+            print("❌ لم يتم الرجوع إلى التدفق الواحد عند عدم دعم Range")
+            return False
+        
+        print(f"✅ التنزيل المقسم: {single_time:.2f} ← {parallel_time:.2f} ثانية لكل ملف")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار التنزيل المقسم - خطأ: {e}")
+        return False
+
+def test_drive_folders():
+    """اختبار تحديد مجلد الوجهة وفهرس معرفات المجلدات"""
+    print("\n📁 اختبار مجلدات الوجهة...")
+    
+    try:
+        import re
+        import tempfile
+        import threading
+        import time
+        from datetime import datetime
+        from types import SimpleNamespace
+        import httplib2
+        from googleapiclient.errors import HttpError
+        sys.path.append('/home/ubuntu')
+        from bot_storage import JobStore, UserSettings
+        from drive_folders import FolderResolver, folder_path, parse_folder_id, parse_layout
+        from telegram_drive_bot_large_files import TelegramDriveBotLargeFiles
+        
+        class FakeDrive:
+            """مجلدات Drive في الذاكرة مع عداد للطلبات"""
+            
+            def __init__(self):
+                self.folders = {}
+                self.calls = []
+                self.lock = threading.Lock()
+                self.on_create = None
+            
+            def files(self):
+                return self
+            
+            def _request(self, method, func):
+                def execute():
+                    with self.lock:
+                        self.calls.append(method)
+                    time.sleep(0.01)
+                    with self.lock:
+                        return func()
+                return SimpleNamespace(execute=execute)
+            
+            def add(self, name, parent):
+                folder_id = f"folder{len(self.folders) + 1:020d}"
+                self.folders[folder_id] = {'id': folder_id, 'name': name, 'parent': parent,
+                                           'createdTime': f"{len(self.folders):06d}"}
+                return folder_id
+            
+            def list(self, q, **kwargs):
+                name, parent = re.match(r"name = '(.*)' and '(.*)' in parents", q).groups()
+                return self._request('list', lambda: {'files': [
+                    {'id': f['id'], 'createdTime': f['createdTime']} for f in self.folders.values()
+                    if f['name'] == name and f['parent'] == parent
+                ]})
+            
+            def create(self, body, **kwargs):
+                def create():
+                    if self.on_create:
+                        # عملية أخرى تنشئ نفس المجلد قبلنا مباشرة
+                        self.on_create(body)
+                    return {'id': self.add(body['name'], body.get('parents', ['root'])[0])}
+                return self._request('create', create)
+            
+            def delete(self, fileId):
+                return self._request('delete', lambda: self.folders.pop(fileId))
+            
+            def get(self, fileId, **kwargs):
+                def get():
+                    if fileId not in self.folders:
+                        raise HttpError(httplib2.Response({'status': '404'}), b'not found')
+                    return {'id': fileId, 'mimeType': 'application/vnd.google-apps.folder'}
+                return self._request('get', get)
+        
+        def execute(operation, request):
+            return request.execute()
+        
+        if parse_layout("Type/date") != ('type', 'date') or parse_folder_id(
+            "https://drive.google.com/drive/folders/1AbCdEfGhIjKlMnOpQrStUv?usp=sharing"
+        ) != '1AbCdEfGhIjKlMnOpQrStUv' or parse_folder_id("Telegram/Uploads") is not None:
+            print("❌ تحليل التنظيم أو رابط المجلد غير صحيح")
+            return False
+        when = datetime(2024, 5, 3)
+        if folder_path(('type', 'date', 'chat'), 'video', 'قناة/الأخبار', when) != "Videos/2024-05/قناة_الأخبار":
+            print(f"❌ مسار المجلد غير صحيح: {folder_path(('type', 'date', 'chat'), 'video', 'قناة/الأخبار', when)}")
+            return False
+        
+        # ملفات متزامنة إلى نفس المسار تنشئ كل مجلد مرة واحدة، والملفات التالية لا تطلب Drive
+        now = [0.0]
+        drive = FakeDrive()
+        resolver = FolderResolver(ttl=60, clock=lambda: now[0])
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                resolver.resolve(1, None, "Videos/2024-05", drive, execute)
+            ))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if len(drive.folders) != 2 or len(set(results)) != 1 or drive.calls.count('create') != 2:
+            print(f"❌ تكرار إنشاء المجلدات: {len(drive.folders)} مجلد، {drive.calls}")
+            return False
+        calls = len(drive.calls)
+        resolver.resolve(1, None, "Videos/2024-05", drive, execute)
+        if len(drive.calls) != calls:
+            print("❌ الفهرس المحلي لم يمنع طلبات Drive")
+            return False
+        # بعد انتهاء الصلاحية يُطلب المجلد من Drive مجدداً دون إنشائه
+        now[0] += 61
+        if resolver.resolve(1, None, "Videos/2024-05", drive, execute) != results[0] or drive.calls.count('create') != 2:
+            print("❌ انتهاء صلاحية الفهرس أنشأ مجلدات جديدة")
+            return False
+        
+        # عامل آخر أنشأ المجلد في نفس اللحظة: يُعتمد الأقدم ويُحذف المكرر
+        drive.on_create = lambda body: (drive.add(body['name'], body['parents'][0]), setattr(drive, 'on_create', None))
+        photos = resolver.resolve(1, results[0], "Photos", drive, execute)
+        siblings = [f for f in drive.folders.values() if f['name'] == 'Photos']
+        if len(siblings) != 1 or siblings[0]['id'] != photos or 'delete' not in drive.calls:
+            print(f"❌ لم يُعالج التسابق مع عامل آخر: {siblings}")
+            return False
+        
+        if resolver.is_accessible(1, 'missing' * 4, drive, execute) or not resolver.is_accessible(
+            1, results[0], drive, execute
+        ):
+            print("❌ فحص إتاحة المجلد غير صحيح")
+            return False
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = os.path.join(temp_dir, 'state.db')
+            settings = UserSettings(db_path)
+            settings.update(7, folder_layout='type')
+            settings.update(7, folder_id='root_folder_id_0123456789')
+            if settings.get(7) != {'folder_id': 'root_folder_id_0123456789', 'folder_layout': 'type'}:
+                print(f"❌ إعدادات المستخدم غير محفوظة: {settings.get(7)}")
+                return False
+            
+            jobs = JobStore(db_path)
+            job_id = jobs.create(7, 7, 1, 'file', 'unique', 'a.mp4', 10, status='queued', folder_path='Videos')
+            if jobs.get(job_id)['folder_path'] != 'Videos':
+                print("❌ مسار المجلد لم يُحفظ مع العملية")
+                return False
+            
+            bot = TelegramDriveBotLargeFiles(
+                "test_token", "credentials.json", db_path=db_path, folder_layout='date', drive_folder_id=
+                "https://drive.google.com/drive/folders/default_folder_0123456789"
+            )
+            chat = SimpleNamespace(id=7, effective_name="Ahmad")
+            forwarded = SimpleNamespace(
+                chat=chat, date=when,
+                forward_origin=SimpleNamespace(chat=SimpleNamespace(id=-100, effective_name="News"))
+            )
+            if bot.default_folder_id != 'default_folder_0123456789' or \
+                    bot.destination_path(settings.get(7), forwarded, 'video') != 'Videos' or \
+                    bot.destination_path({'folder_layout': None}, forwarded, 'video') != '2024-05':
+                print("❌ مسار الوجهة لا يتبع إعدادات المستخدم")
+                return False
+            settings.update(7, folder_layout='chat/type')
+            if bot.destination_path(settings.get(7), forwarded, 'photo') != 'News/Photos':
+                print("❌ التنظيم حسب مصدر الرسالة المعاد توجيهها غير صحيح")
+                return False
+            settings.close()
+            jobs.close()
+            bot.drive_executor.shutdown()
+        
+        print(f"✅ مجلدات الوجهة: {resolver.hits} من الفهرس و{resolver.misses} من Drive")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار مجلدات الوجهة - خطأ: {e}")
+        return False
+
+def test_transfer_spool():
+    """اختبار المخزن المؤقت: اختيار الطبقة وحدود الحجز وحذف الملفات المتروكة"""
+    print("\n🗄️ اختبار المخزن المؤقت للملفات...")
+    
+    try:
+        import gc
+        sys.path.append('/home/ubuntu')
+        from transfer_spool import SPOOL_PREFIX, TransferSpool
+        from telegram_drive_bot_large_files import TelegramDriveBotLargeFiles
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            written = []
+            spool = TransferSpool(
+                temp_dir, disk_budget=300, memory_budget=100, memory_file_limit=60, on_disk_write=written.append
+            )
+            
+            # الملف الصغير في الذاكرة، والأكبر من حد الذاكرة على القرص
+            small = spool.reserve(50)
+            large = spool.reserve(200)
+            if small is None or small.on_disk or large is None or not large.on_disk:
+                print("❌ اختيار طبقة التخزين غير صحيح")
+                return False
+            small.write(b'a' * 50)
+            small.finish()
+            large.write(b'b' * 200)
+            large.finish()
+            with open(large.path, 'rb') as file:
+                if small.memory.read() != b'a' * 50 or file.read() != b'b' * 200:
+                    print("❌ محتوى المخزن غير صحيح")
+                    return False
+            
+            # نفاد الحدود: ملف صغير آخر ينتقل إلى القرص، ثم لا يتسع شيء
+            second = spool.reserve(60)
+            if second is None or not second.on_disk or spool.reserve(60) is not None:
+                print(f"❌ الحجز تجاوز الحدود: ذاكرة {spool.memory_reserved}، قرص {spool.disk_reserved}")
+                return False
+            
+            # الملف المستخدم لا يُحذف، والمتروك من عملية متوقفة يُحذف
+            orphan = os.path.join(temp_dir, f"{SPOOL_PREFIX}999-orphan")
+            with open(orphan, 'wb') as file:
+                file.write(b'x' * 10)
+            if spool.sweep() != 10 or os.path.exists(orphan) or not os.path.exists(large.path):
+                print("❌ حذف الملفات المتروكة غير صحيح")
+                return False
+            
+            # التحرير يحذف الملف ويعيد الحجز، والمخزن المفقود دون تحرير يُحرر تلقائياً
+            path = large.path
+            large.release()
+            small.release()
+            del second
+            gc.collect()
+            if os.path.exists(path) or spool.memory_reserved or spool.disk_reserved or os.listdir(temp_dir):
+                print("❌ لم يُحرر المخزن")
+                return False
+            if sum(written) != 0 or max(written) != 200:
+                print(f"❌ مقياس الملفات المؤقتة غير متوازن: {written}")
+                return False
+            
+            # البوت ينقل الملف مباشرة إذا كان كبيراً أو لم يتسع له المخزن
+            bot = TelegramDriveBotLargeFiles(
+                "test_token", "credentials.json", db_path=os.path.join(temp_dir, 'state.db'),
+                spool_dir=temp_dir, spool_disk_budget=0, spool_memory_budget=1024, spool_memory_file_limit=1024
+            )
+            kept = bot.reserve_spool(1000)
+            if kept is None or bot.reserve_spool(1000) is not None or \
+                    bot.reserve_spool(bot.STREAM_THRESHOLD + 1) is not None:
+                print("❌ حجز البوت للمخزن غير صحيح")
+                return False
+            kept.release()
+            
+            # إلغاء التنزيل يحرر الحجز فوراً دون انتظار جمع المخلفات
+            async def hang(*args, **kwargs):
+                await asyncio.sleep(60)
+            
+            async def cancel_download():
+                buffer = bot.reserve_spool(1000)
+                task = asyncio.ensure_future(bot.download_file_from_telegram('file/path', 1000, buffer))
+                await asyncio.sleep(0.01)
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                return buffer
+            
+            bot._read_telegram_file = hang
+            cancelled = asyncio.run(cancel_download())
+            if not cancelled.released or bot.reserve_spool(1000) is None:
+                print("❌ إلغاء التنزيل لم يحرر المخزن")
+                return False
+            bot.drive_executor.shutdown()
+        
+        print("✅ المخزن المؤقت: الطبقات والحدود وحذف الملفات المتروكة")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار المخزن المؤقت - خطأ: {e}")
+        return False
+
+def test_memory_budget():
+    """اختبار حد الذاكرة المشترك: الحجز الجزئي والانتظار بالترتيب وثبات الذاكرة تحت الضغط"""
+    print("\n🧮 اختبار حد الذاكرة...")
+    
+    try:
+        sys.path.append('/home/ubuntu')
+        from benchmark_transfers import run_scenario
+        from memory_budget import MemoryBudget
+        from transfer_spool import TransferSpool
+        
+        MB = 1024 * 1024
+        budget = MemoryBudget(10 * MB)
+        if budget.try_acquire(6 * MB) != 6 * MB or budget.try_acquire(8 * MB, 2 * MB) != 4 * MB or \
+                budget.try_acquire(MB):
+            print(f"❌ الحجز الفوري غير صحيح: {budget.used}")
+            return False
+        
+        async def waiters():
+            order = []
+            
+            async def take(name, nbytes, minimum=None):
+                granted = await budget.acquire(nbytes, minimum)
+                order.append((name, granted))
+            
+            first = asyncio.ensure_future(take('first', 5 * MB))
+            cancelled = asyncio.ensure_future(take('cancelled', 3 * MB))
+            second = asyncio.ensure_future(take('second', 20 * MB, MB))
+            await asyncio.sleep(0)
+            # المنتظرون لهم الأولوية على الحجز الفوري
+            blocked = budget.try_acquire(MB)
+            cancelled.cancel()
+            budget.release(6 * MB)
+            await asyncio.sleep(0.01)
+            budget.release(4 * MB)
+            await asyncio.gather(first, second, cancelled, return_exceptions=True)
+            return order, blocked
+        
+        order, blocked = asyncio.run(waiters())
+        # الطلب الأكبر من الحد يُصغّر إليه، والجزئي يأخذ ما تبقى
+        if blocked or order != [('first', 5 * MB), ('second', 5 * MB)] or budget.used != 10 * MB or budget.waiting:
+            print(f"❌ ترتيب الانتظار غير صحيح: {order}، {budget.used}")
+            return False
+        
+        # الملف الصغير ينتقل إلى القرص إذا لم يتسع له حد الذاكرة
+        with tempfile.TemporaryDirectory() as temp_dir:
+            spool = TransferSpool(temp_dir, disk_budget=100 * MB, memory=budget)
+            buffer = spool.reserve(MB)
+            budget.release(10 * MB)
+            in_memory = spool.reserve(MB)
+            if not buffer.on_disk or in_memory.on_disk or budget.used != 2 * MB:
+                print("❌ المخزن المؤقت لا يلتزم بحد الذاكرة")
+                return False
+            buffer.release()
+            in_memory.release()
+        
+        # ثمانية ملفات كبيرة منقولة مباشرة بتوازٍ كامل: بلا حد تزيد الذاكرة نحو 900 ميجابايت
+        result = asyncio.run(run_scenario(
+            64 * MB, 8, 8, 'document', bot_options={'memory_budget': 32 * MB, 'chunk_size': 8 * MB}
+        ))
+        if result['failed'] or result['memory_budget_peak_mb'] > 32 or result['rss_growth_mb'] > 256:
+            print(f"❌ الذاكرة تجاوزت الحد تحت الضغط: {result}")
+            return False
+        
+        print(f"✅ حد الذاكرة: زيادة RSS {result['rss_growth_mb']:.0f} ميجابايت لثمانية ملفات 64 ميجابايت")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار حد الذاكرة - خطأ: {e}")
+        return False
+
+def test_media_kinds():
+    """اختبار معالجة كل أنواع الوسائط عبر نفس مسار النقل مع نوع المحتوى"""
+    print("\n🎙️ اختبار أنواع الوسائط...")
+    
+    try:
+        from unittest.mock import AsyncMock
+        from telegram import Animation, Audio, Document, Sticker, Voice
+        sys.path.append('/home/ubuntu')
+        from telegram_drive_bot_large_files import TelegramDriveBotLargeFiles
+        
+        def message(**media):
+            kinds = ('animation', 'document', 'video', 'photo', 'audio', 'voice', 'video_note', 'sticker')
+            return SimpleNamespace(media_group_id=None, **{kind: media.get(kind) for kind in kinds})
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            bot = TelegramDriveBotLargeFiles(
+                "test", "test", "http://localhost:8081", local_mode=True, db_path=os.path.join(temp_dir, 'state.db')
+            )
+            voice = Voice("voice-id", "voice-unique", 7, mime_type="audio/ogg", file_size=300)
+            audio = Audio("audio-id", "audio-unique", 200, performer="Fairuz", title="Song", file_size=900)
+            sticker = Sticker("sticker-id", "sticker-unique", 512, 512, True, False, Sticker.REGULAR)
+            # الصورة المتحركة تصل مع document أيضاً ويجب أن تُعامل كصورة متحركة
+            animation = Animation("gif-id", "gif-unique", 320, 240, 3, file_name="cat.mp4", mime_type="video/mp4")
+            document = Document("gif-id", "gif-unique", file_name="cat.mp4", mime_type="video/mp4")
+            
+            items = [bot.extract_media(message(**media)) for media in (
+                {'voice': voice}, {'audio': audio}, {'sticker': sticker},
+                {'animation': animation, 'document': document}
+            )]
+            expected = [
+                ('voice', 'voice_voice-unique.ogg', 'audio/ogg'),
+                ('audio', 'Fairuz - Song.mp3', 'audio/mpeg'),
+                ('sticker', 'sticker_sticker-unique.tgs', 'application/x-tgsticker'),
+                ('animation', 'cat.mp4', 'video/mp4'),
+            ]
+            if [(item['kind'], item['file_name'], item['mime_type']) for item in items] != expected:
+                print(f"❌ استخراج بيانات الوسائط غير صحيح: {items}")
+                return False
+            
+            # الرسالة الصوتية تمر بنفس مسار الرفع مع نوع المحتوى
+            path = os.path.join(temp_dir, 'voice.ogg')
+            with open(path, 'wb') as f:
+                f.write(b"o" * 300)
+            uploads = []
+            
+            def fake_upload(media, filename, user_id, credentials, **kwargs):
+                uploads.append((filename, kwargs.get('mime_type')))
+                return {'id': 'voice-file', 'webViewLink': 'https://drive.google.com/voice'}
+            
+            bot._upload_to_drive_sync = fake_upload
+            bot.user_credentials[1] = {'credentials': Mock(valid=True)}
+            loading_message = Mock(message_id=10, edit_text=AsyncMock())
+            update = SimpleNamespace(
+                effective_user=SimpleNamespace(id=1), effective_chat=SimpleNamespace(id=5),
+                message=SimpleNamespace(reply_text=AsyncMock(return_value=loading_message), message_id=3,
+                                        chat=SimpleNamespace(id=5, effective_name="chat"), forward_origin=None,
+                                        date=None, **vars(message(voice=voice)))
+            )
+            context = Mock(bot=Mock(get_file=AsyncMock(return_value=Mock(file_path=path))))
+            asyncio.run(bot.handle_media(update, context))
+            result = loading_message.edit_text.call_args[0][0]
+            bot.drive_executor.shutdown()
+            bot.upload_index.close()
+            bot.job_store.close()
+            if uploads != [('voice_voice-unique.ogg', 'audio/ogg')] or not result.startswith('✅'):
+                print(f"❌ لم تُرفع الرسالة الصوتية: {uploads} {result}")
+                return False
+            
+            # العمليات المضافة إلى قائمة العمال تحفظ نوع المحتوى
+            frontend = TelegramDriveBotLargeFiles(
+                "test", "test", db_path=os.path.join(temp_dir, 'shared.db'), role='frontend'
+            )
+            frontend.user_credentials[1] = {'credentials': Mock(valid=True)}
+            asyncio.run(frontend.handle_media(update, context))
+            queued = frontend.job_store.pending()
+            frontend.drive_executor.shutdown()
+            frontend.upload_index.close()
+            frontend.job_store.close()
+            if len(queued) != 1 or queued[0]['mime_type'] != 'audio/ogg':
+                print(f"❌ لم يُحفظ نوع المحتوى مع العملية: {queued}")
+                return False
+        
+        print("✅ كل أنواع الوسائط تمر بنفس مسار النقل")
+        return True
+        
+    except Exception as e:
+        print(f"❌ اختبار أنواع الوسائط - خطأ: {e}")
+        return False
+
 def main():
     """الدالة الرئيسية للاختبار"""
     print("🧪 بدء اختبار البوت مع دعم الملفات الكبيرة")
@@ -279,7 +2304,32 @@ def main():
         ("التعامل مع الملفات المؤقتة", test_temp_file_handling),
         ("إعداد البيئة", test_environment_setup),
         ("توفر Docker", test_docker_availability),
-        ("محاكاة ملف كبير", test_large_file_simulation)
+        ("محاكاة ملف كبير", test_large_file_simulation),
+        ("استجابة البوت أثناء الرفع", test_drive_executor_responsiveness),
+        ("النقل المباشر", test_streaming_pipe),
+        ("الوضع المحلي", test_local_file_mode),
+        ("الذاكرة المؤقتة لخدمات Drive", test_drive_service_cache),
+        ("جلسة HTTP المشتركة", test_shared_http_session),
+        ("جدولة الرفع", test_upload_scheduler),
+        ("المخزن الدائم لبيانات الاعتماد", test_credential_store),
+        ("تجنب رفع الملفات المكررة", test_upload_dedup),
+        ("متابعة الرفع بعد إعادة التشغيل", test_resumable_jobs),
+        ("الضبط التلقائي لحجم الأجزاء", test_adaptive_chunk_size),
+        ("عرض تقدم النقل", test_progress_reporter),
+        ("تجميع الألبومات", test_media_group_batching),
+        ("وضع webhook", test_webhook_mode),
+        ("قائمة انتظار العمال", test_worker_queue),
+        ("مقاييس الأداء", test_metrics_endpoint),
+        ("أداة قياس الأداء", test_benchmark_harness),
+        ("إعادة المحاولة", test_retry_policy),
+        ("تحديد معدل طلبات Drive", test_drive_rate_limiter),
+        ("تحديد عرض النطاق", test_bandwidth_limits),
+        ("التحقق من سلامة الملفات", test_integrity_verification),
+        ("التنزيل المقسم", test_segmented_download),
+        ("مجلدات الوجهة", test_drive_folders),
+        ("المخزن المؤقت", test_transfer_spool),
+        ("حد الذاكرة", test_memory_budget),
+        ("أنواع الوسائط", test_media_kinds)
     ]
     
     passed = 0
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+أدوات خط نقل الملفات من تيليجرام إلى Google Drive
+تسمح بتمرير أجزاء التنزيل مباشرة إلى الرفع المتقطع (resumable) عبر مخزن مؤقت محدود
+بحيث يتداخل التنزيل والرفع ويبقى استهلاك الذاكرة ثابتاً مهما كان حجم الملف
+"""
+
+import asyncio
+import hashlib
+import threading
+
+from googleapiclient.http import MediaUpload
+
+# يجب أن يكون حجم جزء الرفع المتقطع من مضاعفات 256 كيلوبايت (شرط Google Drive)
+DRIVE_CHUNK_ALIGNMENT = 256 * 1024
+
+
+class PipeAborted(Exception):
+    """يُرفع عند إغلاق الأنبوب من الطرف الآخر قبل اكتمال النقل"""
+
+
+class StreamingPipe:
+    """
+    أنبوب بايتات محدود بين منتج asyncio (تنزيل aiohttp) ومستهلك في خيط (رفع Drive)
+
+    يتوقف المنتج عن الكتابة عند امتلاء المخزن حتى يقرأ المستهلك (ضغط عكسي)،
+    ويتوقف المستهلك عن القراءة حتى تتوفر بيانات كافية أو ينتهي التنزيل.
+    يجب إنشاؤه من داخل حلقة الأحداث.
+    """
+
+    def __init__(self, max_buffer: int):
+        """
+        Args:
+            max_buffer: الحد الأقصى للبايتات المخزنة في الأنبوب
+        """
+        self.max_buffer = max_buffer
+        self._buffer = bytearray()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._error = None
+        self._loop = asyncio.get_running_loop()
+        self._space = asyncio.Event()
+
+    def _wake_writer(self):
+        """إيقاظ المنتج المنتظر من أي خيط"""
+        if not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._space.set)
+
+    async def write(self, data: bytes):
+        """كتابة جزء في الأنبوب مع الانتظار عند امتلاء المخزن"""
+        # تقسيم الأجزاء الكبيرة حتى يبقى المستهلك قادراً على التقدم دائماً
+        half = max(1, self.max_buffer // 2)
+        if len(data) > half:
+            view = memoryview(data)
+            for offset in range(0, len(data), half):
+                await self.write(view[offset:offset + half])
+            return
+
+        while True:
+            with self._cond:
+                if self._error is not None:
+                    raise self._error
+                if not self._buffer or len(self._buffer) + len(data) <= self.max_buffer:
+                    self._buffer += data
+                    self._cond.notify_all()
+                    return
+                # يتم المسح داخل القفل وقبل الانتظار حتى لا يضيع إشعار المستهلك
+                self._space.clear()
+            await self._space.wait()
+
+    def close(self):
+        """إعلام المستهلك بانتهاء البيانات"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def abort(self, error: BaseException = None):
+        """إلغاء النقل من أي طرف؛ يُرفع الخطأ لدى الطرف الآخر"""
+        with self._cond:
+            if self._error is None:
+                self._error = error or PipeAborted("تم إغلاق الأنبوب")
+            self._cond.notify_all()
+        self._wake_writer()
+
+    def read(self, size: int) -> bytes:
+        """
+        قراءة حتى size بايت (تعمل داخل خيط الرفع وتحجبه حتى تتوفر البيانات)
+
+        Returns:
+            البيانات المقروءة، أو bytes فارغة عند نهاية التدفق
+        """
+        # لا ننتظر أكثر من نصف المخزن حتى لا يتعطل الطرفان عند طلب جزء أكبر من المخزن
+        wanted = min(size, max(1, self.max_buffer // 2))
+        with self._cond:
+            while len(self._buffer) < wanted and not self._closed and self._error is None:
+                self._cond.wait()
+            if self._error is not None:
+                raise self._error
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        self._wake_writer()
+        return data
+
+
+class StreamingMediaUpload(MediaUpload):
+    """
+    وسيط رفع متقطع يقرأ من StreamingPipe بدلاً من ملف أو BytesIO
+
+    يحتفظ فقط بالجزء الأخير غير المؤكد من الخادم حتى يمكن إعادة إرساله
+    إذا أكد Drive استلام جزء منه فقط (استجابة 308 بنطاق أقصر).
+    """
+
+    def __init__(self, pipe: StreamingPipe, size: int, mimetype: str = 'application/octet-stream',
+                 chunksize: int = 8 * 1024 * 1024, offset: int = 0):
+        """
+        Args:
+            pipe: الأنبوب الذي يغذي الرفع
+            size: الحجم الكلي للملف
+            mimetype: نوع المحتوى
+            chunksize: حجم جزء الرفع (مضاعف 256 كيلوبايت)
+            offset: موضع أول بايت في الأنبوب (عند متابعة رفع سابق)
+        """
+        if chunksize % DRIVE_CHUNK_ALIGNMENT != 0:
+            raise ValueError("حجم الجزء يجب أن يكون من مضاعفات 256 كيلوبايت")
+        self._pipe = pipe
+        self._size = size
+        self._mimetype = mimetype
+        self._chunksize = chunksize
+        self._window = bytearray()
+        self._window_start = offset
+
+    def chunksize(self):
+        return self._chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def size(self):
+        return self._size
+
+    def resumable(self):
+        return True
+
+    def has_stream(self):
+        return False
+
+    def getbytes(self, begin, length):
+        """إرجاع البايتات من begin بطول length مع الاحتفاظ بنافذة لإعادة الإرسال"""
+        if begin < self._window_start:
+            raise ValueError(f"لا يمكن الرجوع إلى الموضع {begin} في تدفق مباشر")
+
+        # تحرير البايتات التي أكد الخادم استلامها
+        skip = begin - self._window_start
+        if skip > len(self._window):
+            # الموضع المطلوب بعد نهاية النافذة: تجاهل البايتات حتى نصل إليه
+            skip -= len(self._window)
+            self._window.clear()
+            while skip > 0:
+                data = self._pipe.read(min(skip, self._chunksize))
+                if not data:
+                    break
+                skip -= len(data)
+        else:
+            del self._window[:skip]
+        self._window_start = begin
+
+        while len(self._window) < length:
+            data = self._pipe.read(length - len(self._window))
+            if not data:
+                break
+            self._window += data
+
+        return bytes(self._window[:length])
+
+    def to_json(self):
+        # googleapiclient يسلسل الوسيط لحفظ الطلب، لكن البايتات تأتي من أنبوب لا يمكن إعادة قراءته
+        raise TypeError("لا يمكن تسلسل رفع من تدفق مباشر: البيانات تُقرأ من أنبوب مرة واحدة")
+
+
+class AdaptiveChunkSizer:
+    """
+    ضبط حجم جزء الرفع المتقطع حسب سرعة الرفع المقاسة
+
+    يبدأ بحجم آمن ثم يضاعفه ما دام الجزء يُرفع بسرعة ولم تنخفض الإنتاجية،
+    ويقسمه على اثنين إذا استغرق الجزء وقتاً طويلاً أو فشل طلبه
+    (الجزء الكبير الفاشل يعني إعادة إرسال بيانات أكثر).
+    الأحجام دائماً من مضاعفات 256 كيلوبايت.
+    """
+
+    def __init__(self, initial: int = 8 * 1024 * 1024, minimum: int = 1024 * 1024,
+                 maximum: int = 32 * 1024 * 1024, fast_seconds: float = 2.0, slow_seconds: float = 15.0):
+        """
+        Args:
+            initial: الحجم الابتدائي للجزء
+            minimum: أصغر حجم مسموح
+            maximum: أكبر حجم مسموح
+            fast_seconds: الجزء الأسرع من هذا يسمح بمضاعفة الحجم
+            slow_seconds: الجزء الأبطأ من هذا يؤدي إلى تصغير الحجم
+        """
+        self.minimum = self._align(minimum)
+        self.maximum = max(self.minimum, self._align(maximum))
+        self.fast_seconds = fast_seconds
+        self.slow_seconds = slow_seconds
+        self._size = self._clamp(initial)
+        self._best_throughput = 0.0
+        self.chunks = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.seconds = 0.0
+
+    @staticmethod
+    def _align(size: int) -> int:
+        """تقريب الحجم إلى مضاعف 256 كيلوبايت (لا يقل عن 256 كيلوبايت)"""
+        return max(DRIVE_CHUNK_ALIGNMENT, size // DRIVE_CHUNK_ALIGNMENT * DRIVE_CHUNK_ALIGNMENT)
+
+    def _clamp(self, size: int) -> int:
+        return min(self.maximum, max(self.minimum, self._align(size)))
+
+    @property
+    def size(self) -> int:
+        """حجم الجزء التالي"""
+        return self._size
+
+    @property
+    def throughput(self) -> float:
+        """متوسط سرعة الرفع بالبايت في الثانية"""
+        return self.bytes_sent / self.seconds if self.seconds else 0.0
+
+    def record(self, nbytes: int, seconds: float):
+        """تسجيل جزء مرفوع بنجاح وتعديل الحجم التالي"""
+        self.chunks += 1
+        self.bytes_sent += nbytes
+        self.seconds += seconds
+        if nbytes <= 0 or seconds <= 0:
+            return
+
+        throughput = nbytes / seconds
+        if seconds > self.slow_seconds:
+            self._size = self._clamp(self._size // 2)
+        elif seconds < self.fast_seconds and throughput >= 0.9 * self._best_throughput:
+            self._size = self._clamp(self._size * 2)
+        self._best_throughput = max(self._best_throughput, throughput)
+
+    def record_error(self):
+        """تسجيل فشل جزء: تصغير الحجم لتقليل البيانات المعاد إرسالها"""
+        self.errors += 1
+        self._size = self._clamp(self._size // 2)
+
+    def stats(self) -> dict:
+        """ملخص القياسات لتسجيلها"""
+        return {
+            'chunk_size': self._size,
+            'chunks': self.chunks,
+            'errors': self.errors,
+            'bytes': self.bytes_sent,
+            'throughput': self.throughput,
+        }
+
+
+class AdaptiveReadSize:
+    """
+    ضبط حجم القراءة من استجابة التنزيل
+
+    إذا امتلأ مخزن القراءة بالكامل فالبيانات تصل أسرع من استهلاكها فيُضاعف،
+    وإذا عادت القراءات أصغر من ربع الحجم باستمرار يُصغّر لتقليل الذاكرة المحجوزة
+    """
+
+    def __init__(self, initial: int = 64 * 1024, minimum: int = 16 * 1024, maximum: int = 1024 * 1024):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.size = min(self.maximum, max(self.minimum, initial))
+        self._small_reads = 0
+
+    def record(self, nbytes: int):
+        """تسجيل نتيجة قراءة وتعديل الحجم التالي"""
+        if nbytes >= self.size:
+            self.size = min(self.maximum, self.size * 2)
+            self._small_reads = 0
+        elif nbytes < self.size // 4:
+            self._small_reads += 1
+            if self._small_reads >= 8:
+                self.size = max(self.minimum, self.size // 2)
+                self._small_reads = 0
+        else:
+            self._small_reads = 0
+
+
+class ChecksumMismatch(Exception):
+    """يُرفع عندما لا يطابق المجموع الاختباري الذي حسبه Drive البايتات المرسلة"""
+
+
+class IncrementalHasher:
+    """
+    حساب MD5 (واختيارياً SHA-256) للبايتات أثناء مرورها إلى الرفع دون قراءة الملف مرة ثانية
+
+    تُمرر البايتات مع موضعها في الملف: الأجزاء المعادة بعد خطأ تُتجاهل لأنها حُسبت مسبقاً،
+    وإذا بدأ الرفع من موضع لم تمر البايتات قبله بالحاسب (متابعة جلسة سابقة) يصبح غير مكتمل
+    """
+
+    def __init__(self, sha256: bool = False, offset: int = 0):
+        """
+        Args:
+            sha256: حساب SHA-256 بالإضافة إلى MD5
+            offset: موضع بداية الرفع (غير الصفر يعني أن بداية الملف لن تمر بالحاسب)
+        """
+        self._md5 = hashlib.md5(usedforsecurity=False)
+        self._sha256 = hashlib.sha256() if sha256 else None
+        self.position = 0
+        self.complete = offset == 0
+
+    def update_at(self, offset: int, data: bytes):
+        """إضافة بايتات تبدأ من offset في الملف"""
+        if not self.complete:
+            return
+        if offset > self.position:
+            # فجوة في البيانات: لا يمكن حساب المجموع للملف كاملاً
+            self.complete = False
+            return
+        start = self.position - offset
+        if start >= len(data):
+            return
+        view = memoryview(data)[start:]
+        self._md5.update(view)
+        if self._sha256 is not None:
+            self._sha256.update(view)
+        self.position += len(view)
+
+    def md5(self) -> str:
+        return self._md5.hexdigest() if self.complete else None
+
+    def sha256(self) -> str:
+        return self._sha256.hexdigest() if self.complete and self._sha256 is not None else None
+
+
+class _ObservedStream:
+    """غلاف لتدفق ملف يمرر كل قراءة يرسلها httplib2 مع موضعها إلى on_read"""
+
+    def __init__(self, stream, on_read):
+        self._stream = stream
+        self._on_read = on_read
+
+    def seek(self, *args):
+        return self._stream.seek(*args)
+
+    def tell(self):
+        return self._stream.tell()
+
+    def read(self, n=-1):
+        offset = self._stream.tell()
+        data = self._stream.read(n)
+        if data:
+            self._on_read(offset, data)
+        return data
+
+
+class AdaptiveChunkUpload(MediaUpload):
+    """غلاف لأي وسيط رفع متقطع يأخذ حجم الجزء من AdaptiveChunkSizer"""
+
+    def __init__(self, media: MediaUpload, sizer: AdaptiveChunkSizer, throttle=None,
+                 hasher: IncrementalHasher = None):
+        """
+        Args:
+            media: وسيط الرفع الأصلي (ملف أو BytesIO أو تدفق مباشر)
+            sizer: ضابط حجم الجزء
+            throttle: دالة تُستدعى بحجم كل جزء قبل إرساله (لتحديد عرض النطاق)
+            hasher: حاسب المجموع الاختباري للبايتات المرسلة
+        """
+        self._media = media
+        self.sizer = sizer
+        self.throttle = throttle
+        self.hasher = hasher
+
+    def chunksize(self):
+        return self.sizer.size
+
+    def mimetype(self):
+        return self._media.mimetype()
+
+    def size(self):
+        return self._media.size()
+
+    def resumable(self):
+        return True
+
+    def has_stream(self):
+        return self._media.has_stream()
+
+    def _on_read(self, offset: int, data: bytes):
+        if self.hasher is not None:
+            self.hasher.update_at(offset, data)
+        if self.throttle is not None:
+            self.throttle(len(data))
+
+    def stream(self):
+        if self.throttle is not None or self.hasher is not None:
+            return _ObservedStream(self._media.stream(), self._on_read)
+        return self._media.stream()
+
+    def getbytes(self, begin, length):
+        data = self._media.getbytes(begin, length)
+        self._on_read(begin, data)
+        return data
+
+    def to_json(self):
+        # حالة الغلاف (سرعة الأجزاء السابقة، المجموع الاختباري الجاري، محدد السرعة) لا تُستعاد من JSON
+        raise TypeError("لا يمكن تسلسل وسيط رفع متكيف: حالة حجم الجزء والمجموع الاختباري تعيش في الذاكرة فقط")
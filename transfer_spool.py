@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+مخزن مؤقت مُدار للملفات بين تنزيلها من تيليجرام ورفعها إلى Drive
+طبقة في الذاكرة للملفات الصغيرة وطبقة على القرص للأكبر، ولكل منهما حد بالبايت يُحجز
+قبل بدء التنزيل، وتُحذف الملفات المتروكة (بعد توقف العملية فجأة) عند بدء التشغيل
+"""
+
+import io
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: لا أقفال، لكن النظام يمنع حذف الملف المفتوح في عملية أخرى
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SPOOL_PREFIX = 'spool-'
+# مساحة تُترك فارغة على القرص مهما كان الحد المسموح
+DISK_FREE_MARGIN = 256 * 1024 * 1024
+
+
+def _lock(file) -> bool:
+    """قفل حصري على الملف طوال استخدامه؛ False إذا كانت عملية أخرى تستخدمه"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _discard(spool_ref, nbytes: int, file, path: Optional[str]):
+    """تحرير الحجز وحذف الملف (تُستدعى مرة واحدة عند release أو عند حذف المخزن من الذاكرة)"""
+    written = 0
+    if file is not None:
+        try:
+            written = file.tell()
+        except (OSError, ValueError):
+            pass
+        file.close()
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"تعذر حذف الملف المؤقت {path}: {e}")
+    spool = spool_ref()
+    if spool is not None:
+        spool._release(nbytes, on_disk=path is not None, written=written)
+
+
+class SpoolBuffer:
+    """
+    مخزن ملف واحد محجوز من TransferSpool
+
+    يُكتب بالترتيب أثناء التنزيل ثم يُقرأ للرفع: path للملف على القرص، أو memory
+    (BytesIO) للملف في الذاكرة. release تحذفه وتعيد حجزه، وتُستدعى تلقائياً إذا
+    فُقد المخزن دون تحريره (خطأ بين التنزيل والرفع)
+    """
+
+    def __init__(self, spool, size: int, file=None, path: str = None):
+        self.size = size
+        self.path = path
+        self.memory = io.BytesIO() if file is None else None
+        self._file = file
+        self._on_disk_write = spool.on_disk_write
+        self._finalizer = weakref.finalize(self, _discard, weakref.ref(spool), size, file, path)
+
+    @property
+    def on_disk(self) -> bool:
+        return self.path is not None
+
+    def write(self, data: bytes):
+        if self._file is not None:
+            self._file.write(data)
+            if self._on_disk_write is not None:
+                self._on_disk_write(len(data))
+        else:
+            self.memory.write(data)
+
+    def finish(self):
+        """انتهاء الكتابة: الملف على القرص يبقى مفتوحاً ومقفلاً حتى release"""
+        if self._file is not None:
+            self._file.flush()
+        else:
+            self.memory.seek(0)
+
+    def release(self):
+        self._finalizer()
+
+    @property
+    def released(self) -> bool:
+        return not self._finalizer.alive
+
+
+class TransferSpool:
+    """
+    مدير المخازن المؤقتة
+
+    - directory: مجلد ملفات الطبقة على القرص
+    - disk_budget: الحد الأقصى لمجموع الملفات على القرص بالبايت (0 يعطل الطبقة)
+    - memory_budget: الحد الأقصى لمجموع الملفات في الذاكرة بالبايت (0 يعطل الطبقة)
+    - memory_file_limit: أكبر ملف يوضع في الذاكرة
+    - on_disk_write: دالة تُستدعى بعدد البايتات المكتوبة على القرص (موجباً) والمحذوفة (سالباً)
+    - memory: حد الذاكرة المشترك للبوت (MemoryBudget)؛ الملف في الذاكرة يحجز منه ضعف حجمه
+      (الملف ونسخة الجزء المرسل منه) وإلا يوضع على القرص
+
+    الحجز بحجم الملف كاملاً قبل التنزيل، فإذا لم تتسع له أي طبقة يُرجع reserve قيمة None
+    وينقل المستدعي الملف مباشرة دون تخزين
+    """
+
+    def __init__(self, directory: str = None, disk_budget: int = 4 * 1024 ** 3,
+                 memory_budget: int = 256 * 1024 ** 2, memory_file_limit: int = 20 * 1024 ** 2,
+                 on_disk_write=None, memory=None):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'telegram-drive-spool')
+        self.disk_budget = disk_budget
+        self.memory_budget = memory_budget
+        self.memory_file_limit = memory_file_limit
+        self.on_disk_write = on_disk_write
+        self.memory = memory
+        self.memory_reserved = 0
+        self.disk_reserved = 0
+        self._lock = threading.Lock()
+
+    def _disk_has_room(self, nbytes: int) -> bool:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            return shutil.disk_usage(self.directory).free - nbytes >= DISK_FREE_MARGIN
+        except OSError as e:
+            logger.warning(f"تعذر استخدام مجلد التخزين المؤقت {self.directory}: {e}")
+            return False
+
+    def reserve(self, nbytes: int) -> Optional[SpoolBuffer]:
+        """
+        حجز مخزن لملف بحجم nbytes قبل تنزيله
+
+        Returns:
+            SpoolBuffer في الذاكرة أو على القرص، أو None إذا لم تتسع له أي طبقة
+        """
+        with self._lock:
+            if nbytes <= self.memory_file_limit and self.memory_reserved + nbytes <= self.memory_budget and (
+                    self.memory is None or self.memory.try_acquire(2 * nbytes)):
+                self.memory_reserved += nbytes
+                return SpoolBuffer(self, nbytes)
+            if not self.disk_budget or self.disk_reserved + nbytes > self.disk_budget:
+                return None
+            self.disk_reserved += nbytes
+
+        if self._disk_has_room(nbytes):
+            try:
+                fd, path = tempfile.mkstemp(prefix=f"{SPOOL_PREFIX}{os.getpid()}-", dir=self.directory)
+                file = os.fdopen(fd, 'wb')
+                _lock(file)
+                return SpoolBuffer(self, nbytes, file, path)
+            except OSError as e:
+                logger.warning(f"تعذر إنشاء ملف مؤقت في {self.directory}: {e}")
+        with self._lock:
+            self.disk_reserved -= nbytes
+        return None
+
+    def _release(self, nbytes: int, on_disk: bool, written: int = 0):
+        with self._lock:
+            if on_disk:
+                self.disk_reserved -= nbytes
+            else:
+                self.memory_reserved -= nbytes
+        if not on_disk and self.memory is not None:
+            self.memory.release(2 * nbytes)
+        if on_disk and written and self.on_disk_write is not None:
+            self.on_disk_write(-written)
+
+    def sweep(self) -> int:
+        """
+        حذف ملفات المخزن المتروكة من عمليات توقفت فجأة (عند بدء التشغيل)
+
+        الملف المستخدم يحمل قفلاً حصرياً من العملية التي أنشأته، فلا يُحذف إلا ملف
+        لا تملكه أي عملية حية (حتى لو شاركت عدة عمليات نفس المجلد)
+
+        Returns:
+            عدد البايتات المحررة
+        """
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return 0
+        freed = 0
+        removed = 0
+        for name in names:
+            if not name.startswith(SPOOL_PREFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, 'rb') as file:
+                    if not _lock(file):
+                        continue
+                    size = os.fstat(file.fileno()).st_size
+                    os.unlink(path)
+            except OSError as e:
+                logger.warning(f"تعذر حذف الملف المؤقت المتروك {path}: {e}")
+                continue
+            freed += size
+            removed += 1
+        if removed:
+            logger.info(f"تم حذف {removed} ملفات مؤقتة متروكة ({freed / (1024 * 1024):.1f} ميجابايت)")
+        return freed
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+عمال الرفع: عمليات (processes) مستقلة تسحب عمليات الرفع من قائمة الانتظار المشتركة
+تضيف واجهة البوت الملفات إلى سجل العمليات في SQLite، وينفذها أي عدد من العمال
+على نفس الجهاز أو على أجهزة أخرى تشارك قاعدة البيانات ومجلد خادم Bot API المحلي
+"""
+
+import asyncio
+import logging
+import os
+import socket
+
+logger = logging.getLogger(__name__)
+
+
+class UploadWorker:
+    """
+    عامل ينفذ عمليات الرفع من سجل العمليات المشترك
+
+    - concurrency: عدد العمليات التي ينفذها العامل في نفس الوقت
+    - lease_seconds: مدة عقد الحجز؛ يُجدد كل ثلثها، وإذا توقف العامل تنتقل العملية لغيره بعد انتهائه
+    - poll_interval: فاصل فحص قائمة الانتظار عندما تكون فارغة
+    - max_attempts: عدد مرات حجز العملية قبل اعتبارها فاشلة (مثلاً ملف يوقف كل عامل يحاول رفعه)
+    """
+
+    def __init__(self, bot, worker_id: str = None, concurrency: int = 2, lease_seconds: float = 60.0,
+                 poll_interval: float = 2.0, max_attempts: int = 3):
+        """
+        Args:
+            bot: كائن TelegramDriveBotLargeFiles الذي يوفر عمليات النقل وسجل العمليات
+            worker_id: معرف العامل (افتراضياً اسم الجهاز ورقم العملية)
+        """
+        self.bot = bot
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.concurrency = max(1, concurrency)
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.completed = 0
+        self.failed = 0
+        self.active = 0
+        self._stopping = None
+
+    def stop(self):
+        """طلب الإيقاف: لا تُحجز عمليات جديدة وتُعاد العمليات الجارية إلى قائمة الانتظار"""
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def run(self, telegram_bot):
+        """تشغيل حلقات العامل حتى استدعاء stop"""
+        self._stopping = asyncio.Event()
+        logger.info(f"بدء العامل {self.worker_id} ({self.concurrency} عمليات متزامنة)")
+        loops = [asyncio.ensure_future(self._loop(telegram_bot)) for _ in range(self.concurrency)]
+        try:
+            await self._stopping.wait()
+        finally:
+            for task in loops:
+                task.cancel()
+            await asyncio.gather(*loops, return_exceptions=True)
+            logger.info(f"توقف العامل {self.worker_id}: {self.completed} ناجحة، {self.failed} فاشلة")
+
+    async def _wait_for_work(self, timeout: float = None):
+        """انتظار الفاصل التالي (أو timeout) أو طلب الإيقاف"""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout or self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _loop(self, telegram_bot):
+        """حجز العمليات وتنفيذها واحدة تلو الأخرى"""
+        limiter = self.bot.rate_limiter
+        while not self._stopping.is_set():
+            # لا تُحجز عمليات جديدة قبل توفر رصيد في محدد معدل Drive
+            wait = limiter.client_ready_in()
+            if wait > 0:
+                await self._wait_for_work(wait)
+                continue
+            try:
+                job = await self.bot.run_db_io(
+                    self.bot.job_store.claim,
+                    self.worker_id,
+                    self.lease_seconds,
+                    self.bot.upload_scheduler.per_user_concurrent,
+                    limiter.throttled_users()
+                )
+            except Exception as e:
+                logger.error(f"تعذر قراءة قائمة الانتظار: {e}")
+                job = None
+            # عدد قائمة الانتظار للمقاييس يُحدّث هنا بدل الاستعلام عند كل قراءة لها
+            await self.bot.refresh_shared_queue()
+
+            if job is None:
+                await self._wait_for_work()
+                continue
+            self.active += 1
+            try:
+                await self.execute(telegram_bot, job)
+            finally:
+                self.active -= 1
+
+    async def _heartbeat(self, job_id: int, transfer: asyncio.Future) -> bool:
+        """
+        تجديد عقد العملية دورياً
+
+        Returns:
+            True إذا فقد العامل العملية (حجزها عامل آخر) وتم إلغاء النقل
+        """
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                owned = await self.bot.run_db_io(
+                    self.bot.job_store.renew, job_id, self.worker_id, self.lease_seconds
+                )
+            except Exception as e:
+                logger.warning(f"تعذر تجديد عقد العملية {job_id}: {e}")
+                continue
+            if not owned:
+                logger.warning(f"فقد العامل {self.worker_id} العملية {job_id}، إيقاف النقل")
+                transfer.cancel()
+                return True
+
+    async def execute(self, telegram_bot, job: dict):
+        """تنفيذ عملية محجوزة مع تجديد عقدها وإبلاغ المستخدم بالنتيجة"""
+        job_id = job['job_id']
+        if job['attempts'] > self.max_attempts:
+            logger.error(f"العملية {job_id} تجاوزت {self.max_attempts} محاولات، إلغاؤها")
+            await self.bot.run_db_io(self.bot.job_store.finish, job_id, self.worker_id)
+            self.failed += 1
+            await self.bot.report_job_result(telegram_bot, job, None)
+            return
+
+        if job['attempts'] > 1:
+            logger.info(f"العامل {self.worker_id} يستكمل العملية {job_id} (المحاولة {job['attempts']})")
+
+        transfer = asyncio.ensure_future(self.bot.run_upload_job(telegram_bot, job))
+        heartbeat = asyncio.ensure_future(self._heartbeat(job_id, transfer))
+        try:
+            drive_link = await transfer
+        except asyncio.CancelledError:
+            if heartbeat.done() and not heartbeat.cancelled() and heartbeat.result():
+                # العملية أصبحت لعامل آخر فهو من يبلغ المستخدم
+                return
+            # إيقاف العامل: تعود العملية إلى قائمة الانتظار ويستكملها عامل آخر من آخر موضع
+            await asyncio.shield(self.bot.run_db_io(self.bot.job_store.release, job_id, self.worker_id))
+            raise
+        finally:
+            heartbeat.cancel()
+
+        await self.bot.run_db_io(self.bot.job_store.finish, job_id, self.worker_id)
+        if drive_link:
+            self.completed += 1
+        else:
+            self.failed += 1
+        await self.bot.report_job_result(telegram_bot, job, drive_link)
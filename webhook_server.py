@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+استقبال تحديثات تيليجرام عبر webhook بخادم aiohttp مدمج
+بديل عن الاستطلاع (polling): يصل التحديث فور إرساله دون طلبات long-poll متكررة،
+ويعمل مع خادم Bot API المحلي (يسمح بعناوين http وأي منفذ)
+"""
+
+import hmac
+import json
+import logging
+import statistics
+import time
+from collections import deque
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import (
+    CallbackQueryHandler, ChosenInlineResultHandler, CommandHandler, InlineQueryHandler,
+    MessageHandler, TypeHandler
+)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# أنواع التحديثات التي يحتاجها كل نوع من المعالجات
+# (تعديل الرسائل مستبعد عمداً حتى لا يعيد تعديل رسالة رفع الملف)
+HANDLER_UPDATE_TYPES = {
+    CommandHandler: (Update.MESSAGE,),
+    MessageHandler: (Update.MESSAGE,),
+    CallbackQueryHandler: (Update.CALLBACK_QUERY,),
+    InlineQueryHandler: (Update.INLINE_QUERY,),
+    ChosenInlineResultHandler: (Update.CHOSEN_INLINE_RESULT,),
+}
+
+
+def allowed_updates_for(application) -> list:
+    """
+    استنتاج قائمة allowed_updates من المعالجات المسجلة في التطبيق
+
+    معالجات TypeHandler (مثل قياس زمن الوصول) لا توسّع القائمة،
+    وأي معالج غير معروف يعيد كل الأنواع حتى لا تضيع تحديثات يحتاجها
+    """
+    types = set()
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, TypeHandler):
+                continue
+            handler_types = next(
+                (update_types for handler_class, update_types in HANDLER_UPDATE_TYPES.items()
+                 if isinstance(handler, handler_class)),
+                None
+            )
+            if handler_types is None:
+                return list(Update.ALL_TYPES)
+            types.update(handler_types)
+    return sorted(types)
+
+
+class UpdateLatencyTracker:
+    """
+    قياس الزمن بين إرسال الرسالة (message.date) ووصولها إلى المعالجات
+
+    تاريخ الرسالة بدقة ثانية واحدة، لذلك المقارنة بين الوضعين تعتمد على المتوسط لعدد كبير من التحديثات
+    """
+
+    def __init__(self, mode: str, max_samples: int = 1000):
+        """
+        Args:
+            mode: وضع استقبال التحديثات (webhook أو polling)
+            max_samples: عدد القياسات الأخيرة المحتفظ بها
+        """
+        self.mode = mode
+        self.samples = deque(maxlen=max_samples)
+
+    def record(self, update: Update):
+        """
+        تسجيل زمن وصول تحديث يحتوي على رسالة
+
+        Returns:
+            زمن الوصول بالثواني أو None إذا لم يكن التحديث رسالة
+        """
+        message = update.effective_message
+        if message is None or message.date is None:
+            return None
+        latency = max(0.0, time.time() - message.date.timestamp())
+        self.samples.append(latency)
+        return latency
+
+    def summary(self) -> dict:
+        """متوسط ووسيط والمئين 95 لزمن الوصول بالثواني"""
+        if not self.samples:
+            return {'mode': self.mode, 'count': 0}
+        ordered = sorted(self.samples)
+        return {
+            'mode': self.mode,
+            'count': len(ordered),
+            'mean': statistics.fmean(ordered),
+            'p50': ordered[len(ordered) // 2],
+            'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        }
+
+
+class WebhookServer:
+    """خادم HTTP يستقبل تحديثات webhook ويضعها في قائمة تحديثات التطبيق"""
+
+    def __init__(self, application, listen: str = '0.0.0.0', port: int = 8443,
+                 path: str = '/telegram', secret_token: str = None):
+        """
+        Args:
+            application: تطبيق python-telegram-bot
+            listen: عنوان الاستماع
+            port: منفذ الاستماع
+            path: مسار استقبال التحديثات
+            secret_token: الرمز السري الذي يرسله Telegram في ترويسة كل طلب
+        """
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.path = path if path.startswith('/') else f"/{path}"
+        self.secret_token = secret_token
+        self._runner = None
+
+    @property
+    def bound_port(self) -> int:
+        """المنفذ الفعلي بعد البدء (مفيد عند استخدام المنفذ 0)"""
+        for address in self._runner.addresses:
+            return address[1]
+        return self.port
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        """استقبال تحديث واحد من Telegram"""
+        if self.secret_token:
+            received = request.headers.get(SECRET_HEADER, '')
+            if not hmac.compare_digest(received, self.secret_token):
+                logger.warning(f"طلب webhook برمز سري غير صحيح من {request.remote}")
+                return web.Response(status=403)
+
+        try:
+            data = await request.json(loads=json.loads)
+            update = Update.de_json(data, self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"تحديث webhook غير صالح: {e}")
+            return web.Response(status=400)
+
+        # الرد فوراً؛ المعالجة تتم في التطبيق بشكل متوازٍ
+        await self.application.update_queue.put(update)
+        return web.Response()
+
+    async def start(self):
+        """بدء الاستماع"""
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.listen, self.port)
+        await site.start()
+        logger.info(f"خادم webhook يستمع على {self.listen}:{self.bound_port}{self.path}")
+
+    async def stop(self):
+        """إيقاف الخادم"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None